@@ -0,0 +1,207 @@
+"""Implements the command line interface of trendtrader.
+
+Description
+----------
+Runs random search optimizations, walk forward optimizations, tests
+of the tuned strategies and the live signal service from the command
+line, e.g.
+
+    python trendtrader/cli.py test --strategy SMAC --pair BTC-USD
+    python trendtrader/cli.py optimize --strategy SMAC --timeframe 1D
+    python trendtrader/cli.py walk-forward --workers 2
+    python trendtrader/cli.py live --speed 86400 --port 9000
+
+from the root of the repository, where the data directory is. The
+subcommands import backtrader, pandas and sklearn only when they run,
+so printing the help and starting a single test is fast.
+
+Classes
+----------
+    Implements no classes.
+
+Functions
+----------
+build_parser: ArgumentParser
+    Builds the parser of the command line arguments.
+main:
+    Parses the command line arguments and runs the subcommand.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+import argparse
+import json
+
+import main as tasks
+
+
+PAIRS = ('BTC-USD', 'ETH-USD')
+TIMEFRAMES = ('1D', '8H')
+
+
+class _PrintPublisher:
+    """Print decisions as lines of JSON."""
+
+    def publish(self, decision: dict):
+        print(json.dumps(decision), flush=True)
+
+    def close(self):
+        pass
+
+
+def _optimize(args):
+    _configure_telemetry(args)
+    tasks.random_search_optimization(args.checkpoint_dir, args.strategy,
+                                     args.pair, args.timeframe,
+                                     args.candidates, args.cpus, args.workers)
+
+
+def _walk_forward(args):
+    _configure_telemetry(args)
+    tasks.walk_forward_optimization(args.checkpoint_dir, args.strategy,
+                                    args.pair, args.timeframe,
+                                    args.candidates, args.cpus, args.workers)
+
+
+def _configure_telemetry(args):
+    if args.telemetry_dir is not None:
+        import telemetry
+
+        telemetry.configure(args.telemetry_dir)
+
+
+def _test(args):
+    import optimizer
+    import scheduler
+
+    for label in tasks.select(args.strategy):
+        get_parameters = tasks.parameter_getter(label)
+        for pair in args.pair:
+            for timeframe in args.timeframe:
+                name = '_'.join((label, pair.split('-')[0], timeframe))
+                stats = optimizer.test_strategy(
+                    name, tasks.strategy(label),
+                    get_parameters(pair, timeframe), pair, timeframe,
+                    args.cash or scheduler.DEFAULT_CASH[pair],
+                    plot=args.plot, save=args.save, shared=args.shared)
+                print(name, stats)
+
+
+def _live(args):
+    import live
+
+    if args.port is not None:
+        publisher = live.SocketPublisher(args.host, args.port)
+        print('Publishing on {0}:{1}'.format(*publisher.address))
+    else:
+        publisher = _PrintPublisher()
+
+    labels = tasks.select(args.strategy)
+    service = live.SignalService(publisher)
+    for stream in live.configured_streams(args.pair, args.timeframe):
+        if stream[0].rsplit('_', 2)[0] in labels:
+            service.add_stream(*stream)
+
+    service.run([live.ReplayFeed(pair, timeframe, args.speed, args.warmup)
+                 for pair in args.pair for timeframe in args.timeframe])
+    publisher.close()
+
+    for name, percentiles in service.latency_percentiles().items():
+        print(name, ', '.join('p{0}: {1:.2f} ms'.format(p, v)
+                              for p, v in percentiles.items()))
+
+
+def _add_selection(parser):
+    parser.add_argument('--strategy', nargs='+', choices=tasks.STRATEGIES,
+                        help='strategies to run, all if not given')
+    parser.add_argument('--pair', nargs='+', choices=PAIRS, default=PAIRS)
+    parser.add_argument('--timeframe', nargs='+', choices=TIMEFRAMES,
+                        default=TIMEFRAMES)
+
+
+def _add_jobs(parser, checkpoint_dir):
+    parser.add_argument('--candidates', type=int, default=2500,
+                        help='number of random parameter sets')
+    parser.add_argument('--checkpoint-dir', default=checkpoint_dir)
+    parser.add_argument('--cpus', type=int,
+                        help='CPUs all jobs may use, all cores by default')
+    parser.add_argument('--workers', type=int,
+                        help='number of jobs run at the same time')
+    parser.add_argument('--telemetry-dir',
+                        help='directory to export the progress of the '
+                             'jobs to as JSON and Prometheus files')
+
+
+def build_parser():
+    """Build the parser of the command line arguments.
+
+    Parameters:
+    ----------
+    Gets no parameters.
+
+    Returns:
+    ----------
+    parser: argparse.ArgumentParser
+        The parser with a subcommand for optimize, walk-forward, test
+        and live.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog='trendtrader',
+        description='Optimize, test and run trend following strategies.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    optimize = subparsers.add_parser(
+        'optimize', help='random search optimization')
+    _add_selection(optimize)
+    _add_jobs(optimize, './checkpoints/random_search')
+    optimize.set_defaults(run=_optimize)
+
+    walk_forward = subparsers.add_parser(
+        'walk-forward', help='walk forward optimization')
+    _add_selection(walk_forward)
+    _add_jobs(walk_forward, './checkpoints/walk_forward')
+    walk_forward.set_defaults(run=_walk_forward)
+
+    test = subparsers.add_parser(
+        'test', help='test the tuned parameters of parameters.py')
+    _add_selection(test)
+    test.add_argument('--cash', type=int,
+                      help='starting capital, by pair if not given')
+    test.add_argument('--plot', action='store_true')
+    test.add_argument('--save', action='store_true')
+    test.add_argument('--shared', action='store_true',
+                      help='take the indicators from the indicator graph')
+    test.set_defaults(run=_test)
+
+    live = subparsers.add_parser(
+        'live', help='emit live signals on a replay of the CSV files')
+    _add_selection(live)
+    live.add_argument('--speed', type=float, default=86400.0,
+                      help='factor by which the replay is faster than '
+                           'real time')
+    live.add_argument('--warmup', type=int, default=300,
+                      help='number of bars handed out as history')
+    live.add_argument('--host', default='127.0.0.1')
+    live.add_argument('--port', type=int,
+                      help='publish on a TCP socket instead of printing')
+    live.set_defaults(run=_live)
+
+    return parser
+
+
+def main(argv: list = None):
+    """Parse the command line arguments and run the subcommand."""
+
+    args = build_parser().parse_args(argv)
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
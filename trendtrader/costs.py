@@ -0,0 +1,569 @@
+"""Implements what if re-scoring of runs under other cost models.
+
+Description
+----------
+The commission is fixed when a run is made, so checking how a
+parameter set holds up at another fee tier, with slippage or with
+another starting capital used to mean running the sweep again. The
+signals of the strategies do not depend on the costs, only the sizes
+of the orders and the prices they fill at do. This module keeps the
+bars on which the position of a run changed and re-scores them under a
+grid of cost models in one vectorized pass, e.g.
+
+    trades = costs.run_trades(graph, 'SMAC', (10, 50))
+    costs.rescore(trades, df, costs.cost_grid(
+        commissions=(0.0002, 0.0007, 0.001), slippages=(0.0, 0.0005),
+        cashes=(1000, 10000, 100000)))
+
+The orders follow the BackBroker of backtrader as configured in
+optimizer and the kernels: every entry is sized with all the cash at
+the close of the signal, checked against the cash at the created price
+and filled at the next open. Slippage moves the fill against the order
+by a fraction of the open, but not beyond the high or low of the bar.
+
+Because every entry spends all the cash, the size of every order
+depends on the costs of all earlier trades. The re-scoring sizes every
+order anew and flags the models it changed a size for as resized. It
+cannot follow a model under which the orders fill differently: an
+order the cash does not cover under the model, or an order the run
+refused that the model would fill, e.g. after cheaper trades left
+enough cash for the commission. The run takes other fills from then on,
+such models are flagged as diverged. run_trades keeps all entry and
+exit signals of the run, and the diverged models are run again over
+them with the event loop, all of them at once, so their metrics are
+exact as well. The fills of recorder hold neither the signals nor the
+orders the run refused, so re-scored recordings cannot see the latter
+and report NaN metrics for diverged models.
+
+Classes
+----------
+CostModel: namedtuple
+    A commission, a slippage and an amount of starting capital.
+Trades: namedtuple
+    The bars on which the position of a run changed, on which it
+    refused orders and on which it had signals.
+
+Functions
+----------
+cost_grid: list
+    Returns every combination of commissions, slippages and cash.
+run_trades: Trades
+    Runs a strategy with the event loop of kernels and keeps its
+    trades.
+recorded_trades: Trades
+    Takes the trades of a run from the fills of recorder.
+rescore: DataFrame
+    Computes the metrics of the trades of a run under cost models.
+rescore_sweep: DataFrame
+    Runs many parameter sets once and re-scores them under cost
+    models.
+rescore_records: DataFrame
+    Re-scores the recorded runs of a sweep under cost models.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+from collections import namedtuple
+import itertools
+
+import numpy as np
+import pandas as pd
+
+import indicator_graph
+import kernels
+
+
+CostModel = namedtuple('CostModel', ('commission', 'slippage', 'cash'))
+
+Trades = namedtuple('Trades', ('bars', 'positions', 'refused', 'direction',
+                               'cash', 'commission', 'entries', 'exits'))
+
+COLUMNS = ('# trades', 'win rate', 'sharpe', 'max DD', 'pnl', 'end',
+           'resized', 'diverged')
+
+# Account values kept in memory at once, in models times bars
+CHUNK = 10000000
+
+# Metrics that are NaN for diverged models that cannot be run again
+_METRICS = ('# trades', 'win rate', 'sharpe', 'max DD', 'pnl', 'end')
+
+
+def cost_grid(commissions: tuple = (0.0007,), slippages: tuple = (0.0,),
+              cashes: tuple = (10000,)):
+    """Return every combination of commissions, slippages and cash.
+
+    Parameters:
+    ----------
+    commissions: tuple
+        Give the commissions as fractions of the traded value.
+    slippages: tuple
+        Give the slippages as fractions of the open.
+    cashes: tuple
+        Give the amounts of starting capital.
+
+    Returns:
+    ----------
+    models: list
+        The cost models, commissions vary slowest.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    return [CostModel(*model)
+            for model in itertools.product(commissions, slippages, cashes)]
+
+
+def run_trades(graph, strategy_name: str, par_tuple: tuple,
+               cash: float = 10000, commission: float = 0.0007):
+    """Run a strategy with the event loop of kernels and keep its trades.
+
+    Parameters:
+    ----------
+    graph: indicator_graph.IndicatorGraph
+        Give the indicator graph of the feed.
+    strategy_name: string
+        Give the class name of the strategy in strategies.py.
+    par_tuple: tuple
+        Give the parameter set of the strategy.
+    cash: float
+        Give the amount of starting capital of the run.
+    commission: float
+        Give the commission of the run.
+
+    Returns:
+    ----------
+    trades: Trades
+        The bars on which the position changed, the position after
+        every change, the bars on which orders were refused, the
+        direction of the positions, the cash and commission of the run
+        and the bars of all its entry and exit signals.
+
+    Raises:
+    ----------
+    KeyError
+        If the strategy has no description of its signals.
+    """
+
+    entry, exit_, direction, start = kernels.strategy_signals(
+        graph, strategy_name, par_tuple)
+    entries = np.flatnonzero(entry[start:]) + start
+    exits = np.flatnonzero(exit_[start:]) + start
+    changes = np.empty(len(entries) + len(exits), dtype=np.int64)
+    states = np.empty((len(changes), 3))
+
+    n_bars = len(graph.base('close').array)
+
+    _, _, _, n_changes = kernels.event_loop(
+        graph.base('open').array, graph.base('close').array, entries, exits,
+        direction, float(cash), commission, changes, states,
+        np.empty(len(exits)))
+    changes = changes[:n_changes].copy()
+    positions = states[:n_changes, 1].copy()
+
+    # The event loop looks at every signal of the current state from
+    # the last change on, those before the next change were refused
+    refused = list()
+    for k in range(n_changes + 1):
+        first = changes[k - 1] if k else 0
+        last = changes[k] if k < n_changes else n_bars
+        signals = entries if k == 0 or positions[k - 1] == 0.0 else exits
+        signals = signals[signals >= first]
+        refused.append(signals[signals + 1 < last] + 1)
+
+    return Trades(changes, positions, np.concatenate(refused), direction,
+                  float(cash), commission, entries, exits)
+
+
+def recorded_trades(fills, df, cash: float = 10000,
+                    commission: float = 0.0007):
+    """Take the trades of a run from the fills of recorder.
+
+    Parameters:
+    ----------
+    fills: DataFrame
+        Give the fill rows of one run, see recorder.read_records.
+    df: DataFrame
+        Give the data the run was made on.
+    cash: float
+        Give the amount of starting capital of the run.
+    commission: float
+        Give the commission of the run.
+
+    Returns:
+    ----------
+    trades: Trades
+        The bars on which the position changed, the position after
+        every change, the direction of the positions and the cash and
+        commission of the run. The fills do not tell which orders were
+        refused nor which signals the run had.
+
+    Raises:
+    ----------
+    KeyError
+        If a fill lies on no bar of the data.
+    """
+
+    fills = fills.sort_values('time')
+    times = pd.DatetimeIndex(fills['time'])
+    if df.index.tz is not None and times.tz is None:
+        # backtrader reports the times of the fills in naive UTC
+        times = times.tz_localize('UTC')
+
+    bars = df.index.get_indexer(times)
+    if (bars < 0).any():
+        raise KeyError('Fills outside of the data')
+
+    positions = np.cumsum(fills['size'].to_numpy(dtype=float))
+    direction = int(np.sign(positions[0])) if len(positions) else 1
+
+    return Trades(bars.astype(np.int64), positions,
+                  np.empty(0, dtype=np.int64), direction, float(cash),
+                  commission, None, None)
+
+
+def _fill_prices(open_, high, low, buy, slippage):
+    # Slippage is matched at the extremes of the bar like slip_match
+    return np.where(buy, np.minimum(open_ * (1.0 + slippage), high),
+                    np.maximum(open_ * (1.0 - slippage), low))
+
+
+def _replay(trades, open_, close, high, low, models):
+    commission = np.array([model.commission for model in models], dtype=float)
+    slippage = np.array([model.slippage for model in models], dtype=float)
+    cash = np.array([model.cash for model in models], dtype=float)
+
+    n_models = len(models)
+    cash_states = np.empty((n_models, len(trades.bars) + 1))
+    positions = np.zeros((n_models, len(trades.bars) + 1))
+    cash_states[:, 0] = cash
+    position = np.zeros(n_models)
+    price = np.zeros(n_models)
+    open_comm = np.zeros(n_models)
+    resized = np.zeros(n_models, dtype=bool)
+    diverged = np.zeros(n_models, dtype=bool)
+    trade_pnl = list()
+
+    # Changes and refused orders in the order of their bars, a refused
+    # order is marked by a change of -1
+    bars = np.concatenate((trades.bars, trades.refused))
+    events = np.concatenate((np.arange(len(trades.bars)),
+                             np.full(len(trades.refused), -1)))
+    order_by = np.argsort(bars, kind='stable')
+
+    k = 0
+    for bar, change in zip(bars[order_by], events[order_by]):
+        # Orders are created at the close before the bar they fill on
+        created = close[bar - 1]
+        opening = k == 0 or trades.positions[k - 1] == 0.0
+        if opening:
+            size = np.floor(cash / created)
+            order = trades.direction * size
+        else:
+            order = -position
+            size = np.abs(order)
+
+        fill = _fill_prices(open_[bar], high[bar], low[bar], order > 0,
+                            slippage)
+        comm = size * commission * fill
+        filled = cash - order * created - size * commission * created >= 0
+        if opening:
+            opened = cash - order * fill - comm
+            filled &= (size > 0) & (opened >= 0)
+
+        if change < 0:
+            # The run refused this order, the model must as well
+            diverged |= filled & (size > 0)
+            continue
+
+        diverged |= ~filled
+        if opening:
+            resized |= size != abs(trades.positions[change])
+            cash = np.where(filled, opened, cash)
+            position = np.where(filled, order, 0.0)
+            price = np.where(filled, fill, 0.0)
+            open_comm = np.where(filled, comm, 0.0)
+        else:
+            pnl = position * (fill - price)
+            cash = cash + position * price + pnl - comm
+            trade_pnl.append(np.where(position != 0.0,
+                                      pnl - (open_comm + comm), np.nan))
+            position = np.zeros(n_models)
+
+        k = change + 1
+        cash_states[:, k] = cash
+        positions[:, k] = position
+
+    trade_pnl = np.column_stack(trade_pnl) if trade_pnl \
+        else np.empty((n_models, 0))
+
+    return cash_states, positions, trade_pnl, resized, diverged
+
+
+def _signal_replay(trades, open_, close, high, low, models):
+    # kernels.event_loop for every model at once over all signals, a
+    # model looks at the entries while flat and at the exits otherwise
+    commission = np.array([model.commission for model in models], dtype=float)
+    slippage = np.array([model.slippage for model in models], dtype=float)
+    cash = np.array([model.cash for model in models], dtype=float)
+
+    # Orders of the last bar are never filled
+    signals = np.union1d(trades.entries, trades.exits)
+    signals = signals[signals + 1 < len(close)]
+    is_entry = np.isin(signals, trades.entries)
+    is_exit = np.isin(signals, trades.exits)
+
+    n_models = len(models)
+    cash_states = np.empty((n_models, len(signals) + 1))
+    positions = np.zeros((n_models, len(signals) + 1))
+    cash_states[:, 0] = cash
+    position = np.zeros(n_models)
+    price = np.zeros(n_models)
+    open_comm = np.zeros(n_models)
+    trade_pnl = list()
+
+    for k, signal in enumerate(signals):
+        flat = position == 0.0
+        created = close[signal]
+        # backtrader does not place orders of size zero
+        size = np.where(flat, np.floor(cash / created), np.abs(position))
+        order = np.where(flat, trades.direction * size, -position)
+        act = np.where(flat, is_entry[k], is_exit[k]) & (size > 0) \
+            & (cash - order * created - size * commission * created >= 0.0)
+
+        t = signal + 1
+        fill = _fill_prices(open_[t], high[t], low[t], order > 0, slippage)
+        comm = size * commission * fill
+        opened = cash - order * fill - comm
+        opens = act & flat & (opened >= 0.0)
+        closes = act & ~flat
+
+        pnl = position * (fill - price)
+        if closes.any():
+            trade_pnl.append(np.where(closes, pnl - (open_comm + comm),
+                                      np.nan))
+        cash = np.where(opens, opened,
+                        np.where(closes, (cash + (position * price + pnl))
+                                 - comm, cash))
+        price = np.where(opens, fill, np.where(closes, 0.0, price))
+        open_comm = np.where(opens, comm, open_comm)
+        position = np.where(opens, order, np.where(closes, 0.0, position))
+
+        cash_states[:, k + 1] = cash
+        positions[:, k + 1] = position
+
+    trade_pnl = np.column_stack(trade_pnl) if trade_pnl \
+        else np.empty((n_models, 0))
+
+    return signals + 1, cash_states, positions, trade_pnl
+
+
+def _equity_metrics(values, years, cash):
+    peak = np.maximum.accumulate(values, axis=1)
+    max_dd = np.max(100.0 * (peak - values) / peak, axis=1)
+
+    # Yearly returns like kernels.run_metrics, each year starting from
+    # the value at the end of the last
+    last = np.append(np.flatnonzero(np.diff(years)), len(years) - 1)
+    ends = values[:, last]
+    starts = np.column_stack((cash, ends[:, :-1]))
+    excess = ends / starts - 1.0 - 0.01
+    mean = excess.mean(axis=1)
+    deviation = np.sqrt(((excess - mean[:, None]) ** 2).mean(axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(deviation > 0.0, mean / deviation, np.nan)
+
+    return max_dd, sharpe
+
+
+def _metrics(bars, cash_states, positions, trade_pnl, close, years, models):
+    # The state of a bar is the one after the last change up to it
+    segment = np.searchsorted(bars, np.arange(len(close)), side='right')
+    cash = np.array([model.cash for model in models], dtype=float)
+    max_dd = np.empty(len(models))
+    sharpe = np.empty(len(models))
+    step = max(1, CHUNK // max(len(close), 1))
+    for first in range(0, len(models), step):
+        rows = slice(first, first + step)
+        values = cash_states[rows][:, segment] \
+            + positions[rows][:, segment] * close
+        max_dd[rows], sharpe[rows] = _equity_metrics(values, years,
+                                                     cash[rows])
+
+    closed = np.sum(~np.isnan(trade_pnl), axis=1)
+    count = closed + (positions[:, -1] != 0.0)
+    won = np.sum(trade_pnl >= 0.0, axis=1)
+
+    return {'# trades': count,
+            'win rate': np.where(count > 0, won / np.maximum(count, 1), 0),
+            'sharpe': sharpe,
+            'max DD': max_dd,
+            'pnl': np.nansum(trade_pnl, axis=1),
+            'end': cash_states[:, -1] + positions[:, -1] * close[-1]}
+
+
+def rescore(trades: Trades, df, models: list):
+    """Compute the metrics of the trades of a run under cost models.
+
+    Parameters:
+    ----------
+    trades: Trades
+        Give the trades of the run, see run_trades and
+        recorded_trades.
+    df: DataFrame
+        Give the data the run was made on.
+    models: list
+        Give the cost models, see cost_grid.
+
+    Returns:
+    ----------
+    analysis: DataFrame
+        The number of trades, win rate, sharpe ratio, maximum draw down
+        and net profit like kernels.sweep, the end value, and whether
+        the model changed the size of an order and whether it fills
+        other orders than the run, indexed by the cost models. The
+        metrics of the latter come from running the model again, NaN
+        if the trades hold no signals.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    models = [CostModel(*model) for model in models]
+    open_ = df['open'].to_numpy(dtype=float)
+    close = df['close'].to_numpy(dtype=float)
+    high = df['high'].to_numpy(dtype=float)
+    low = df['low'].to_numpy(dtype=float)
+    years = df.index.year.values
+
+    cash_states, positions, trade_pnl, resized, diverged = _replay(
+        trades, open_, close, high, low, models)
+    columns = _metrics(trades.bars, cash_states, positions, trade_pnl,
+                       close, years, models)
+
+    rows = np.flatnonzero(diverged)
+    if len(rows) and trades.entries is not None:
+        # Diverged models take other fills, they are run again
+        diverged_models = [models[i] for i in rows]
+        step = max(1, CHUNK // max(len(close), 1))
+        for first in range(0, len(rows), step):
+            chunk = slice(first, first + step)
+            exact = _metrics(*_signal_replay(trades, open_, close, high,
+                                             low, diverged_models[chunk]),
+                             close, years, diverged_models[chunk])
+            for name in _METRICS:
+                columns[name][rows[chunk]] = exact[name]
+    elif len(rows):
+        for name in _METRICS:
+            columns[name] = np.where(diverged, np.nan, columns[name])
+
+    columns['resized'] = resized
+    columns['diverged'] = diverged
+
+    return pd.DataFrame(
+        columns, columns=COLUMNS,
+        index=pd.MultiIndex.from_tuples(models, names=CostModel._fields))
+
+
+def rescore_sweep(strategy_name: str, par_tuples: list, df, models: list,
+                  cash: float = 10000, commission: float = 0.0007):
+    """Run many parameter sets once and re-score them under cost models.
+
+    Parameters:
+    ----------
+    strategy_name: string
+        Give the class name of the strategy in strategies.py.
+    par_tuples: list
+        Give the parameter sets to run the strategy with.
+    df: DataFrame
+        Give the data to run the strategy on.
+    models: list
+        Give the cost models, see cost_grid.
+    cash: float
+        Give the amount of starting capital of the runs.
+    commission: float
+        Give the commission of the runs.
+
+    Returns:
+    ----------
+    analysis: DataFrame
+        The metrics of rescore of every parameter set under every cost
+        model, indexed by the parameter sets and the cost models.
+
+    Raises:
+    ----------
+    KeyError
+        If the strategy has no description of its signals.
+    """
+
+    graph = indicator_graph.feed_graph(df)
+
+    par_tuples = list(par_tuples)
+    frames = list()
+    index = list()
+    for par_tuple in par_tuples:
+        analysis = rescore(run_trades(graph, strategy_name, par_tuple, cash,
+                                      commission), df, models)
+        frames.append(analysis)
+        index.extend(tuple(par_tuple) + model for model in analysis.index)
+
+    analysis = pd.concat(frames) if frames \
+        else pd.DataFrame(columns=COLUMNS)
+    if index:
+        names = [None] * (len(index[0]) - len(CostModel._fields)) \
+            + list(CostModel._fields)
+        analysis.index = pd.MultiIndex.from_tuples(index, names=names)
+
+    return analysis
+
+
+def rescore_records(directory: str, df, models: list, cash: float = 10000,
+                    commission: float = 0.0007, format: str = 'arrow'):
+    """Re-score the recorded runs of a sweep under cost models.
+
+    Parameters:
+    ----------
+    directory: string
+        Give the directory the runs were recorded to, see
+        optimizer.run_sweep.
+    df: DataFrame
+        Give the data the runs were made on.
+    models: list
+        Give the cost models, see cost_grid.
+    cash: float
+        Give the amount of starting capital of the runs.
+    commission: float
+        Give the commission of the runs.
+    format: string
+        Give the format the runs were recorded in.
+
+    Returns:
+    ----------
+    analysis: DataFrame
+        The metrics of rescore of every run under every cost model,
+        indexed by the names of the runs and the cost models.
+
+    Raises:
+    ----------
+    ImportError
+        If pyarrow is not installed.
+    """
+
+    import recorder
+
+    fills = recorder.read_records(directory, kind='fill',
+                                  columns=['run', 'time', 'size'],
+                                  format=format)
+
+    frames = dict()
+    for run, run_fills in fills.groupby('run', sort=True):
+        frames[run] = rescore(recorded_trades(run_fills, df, cash,
+                                              commission), df, models)
+
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.concat(frames, names=['run'])
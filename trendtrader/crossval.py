@@ -0,0 +1,291 @@
+"""Implements combinatorial purged cross validation of parameter sets.
+
+Description
+----------
+Combinatorial purged cross validation, see
+splits.CombinatorialPurgedSplit, trains and tests every candidate on
+many combinations of groups of the data. Backtesting every candidate on
+every combination is not affordable, so every candidate is run once on
+the full history and its per bar returns are reduced to a few sums per
+group: the number of bars, the sum and the sum of squares of the
+returns and the sum of the log returns. The metrics of any combination
+of groups follow from adding up the sums of its groups, minus the sums
+of the purged and embargoed bars at their edges, which is one matrix
+product for all combinations and candidates at once.
+
+The candidate with the best training metric of every combination is
+compared with the other candidates on the test groups. How often it
+ends up in the lower half estimates the probability of backtest
+overfitting of the selection.
+
+Classes
+----------
+SegmentEvaluator:
+    Evaluates candidates on all combinations of a combinatorial purged
+    split from cached per group sums.
+
+Functions
+----------
+candidate_returns: ndarray
+    Runs the candidates once on the full data and returns their per
+    bar returns.
+cross_validate: DataFrame, float
+    Runs combinatorial purged cross validation for a strategy.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+import numpy as np
+import pandas as pd
+
+import indicator_graph
+import kernels
+
+
+def candidate_returns(strategy_name: str, par_tuples: list, df,
+                      cash: float = 10000, commission: float = 0.0007,
+                      jit: bool = True):
+    """Run the candidates once on the full data and return their returns.
+
+    Parameters:
+    ----------
+    strategy_name: string
+        Give the class name of the strategy in strategies.py.
+    par_tuples: list
+        Give the parameter sets to run the strategy with.
+    df: DataFrame
+        Give the data to run the strategy on.
+    cash: float
+        Give the amount of starting capital.
+    commission: float
+        Give the commission as a fraction of the traded value.
+    jit: bool
+        Indicate if the compiled kernel should be used if available.
+
+    Returns:
+    ----------
+    returns: ndarray
+        An array of shape (len(par_tuples), len(df)) with the return of
+        the account value on every bar.
+
+    Raises:
+    ----------
+    KeyError
+        If the strategy has no description of its signals.
+    """
+
+    graph = indicator_graph.feed_graph(df)
+    returns = np.empty((len(par_tuples), len(df)))
+    for i, par_tuple in enumerate(par_tuples):
+        values = kernels.run_strategy(graph, strategy_name, par_tuple, cash,
+                                      commission, jit)['values']
+        returns[i] = values / np.concatenate(([cash], values[:-1])) - 1.0
+
+    return returns
+
+
+class SegmentEvaluator:
+    """Evaluates candidates on all combinations of a combinatorial split.
+
+    Parameters:
+    ----------
+    returns: array-like
+        Give the per bar returns of the candidates, an array of shape
+        (candidates, bars), e.g. from candidate_returns.
+    splitter: splits.CombinatorialPurgedSplit
+        Give the splitter that defines groups, purge and embargo.
+    periods_per_year: int
+        Give the number of bars per year to annualize the sharpe
+        ratio, it is given per bar if None.
+
+    Raises:
+    ----------
+    ValueError
+        If a group is not longer than purge and embargo together.
+    """
+
+    def __init__(self, returns, splitter, periods_per_year: int = None):
+        returns = np.atleast_2d(np.asarray(returns, dtype=float))
+        self.splitter = splitter
+        self.combinations = splitter.combinations()
+        self.scale = 1.0 if periods_per_year is None \
+            else np.sqrt(periods_per_year)
+
+        edges = splitter.group_bounds(returns.shape[1])
+        starts, ends = edges[:-1], edges[1:]
+
+        # Sums of every group, of the embargoed bars at its head and of
+        # the purged bars at its tail, shape (sums, candidates, groups)
+        cumulative = np.stack([np.ones_like(returns), returns, returns ** 2,
+                               np.log1p(returns)])
+        cumulative = np.concatenate(
+            (np.zeros(cumulative.shape[:2] + (1,)),
+             np.cumsum(cumulative, axis=2)), axis=2)
+
+        def sums(a, b):
+            return cumulative[:, :, b] - cumulative[:, :, a]
+
+        full = sums(starts, ends)
+        head = sums(starts, np.minimum(starts + splitter.embargo, ends))
+        tail = sums(np.maximum(ends - splitter.purge, starts), ends)
+
+        # Weights of the group sums in every combination
+        n_groups = len(starts)
+        test = np.zeros((len(self.combinations), n_groups))
+        for row, test_groups in enumerate(self.combinations):
+            test[row, list(test_groups)] = 1.0
+        train = 1.0 - test
+        after_test = np.zeros_like(test)
+        after_test[:, 1:] = test[:, :-1]
+        before_test = np.zeros_like(test)
+        before_test[:, :-1] = test[:, 1:]
+
+        self._sums = {'train': full @ train.T - head @ (train * after_test).T
+                               - tail @ (train * before_test).T,
+                      'test': full @ test.T}
+
+    def metrics(self, part: str = 'test'):
+        """Compute the metrics of every candidate on every combination.
+
+        Parameters:
+        ----------
+        part: string
+            Give 'train' or 'test'.
+
+        Returns:
+        ----------
+        metrics: dict
+            The number of bars, the sharpe ratio and the compounded
+            return, each an array of shape (combinations, candidates).
+
+        Raises:
+        ----------
+        KeyError
+            If the part is unknown.
+        """
+
+        count, total, squares, logs = self._sums[part]
+        mean = total / count
+        std = np.sqrt(np.maximum(squares / count - mean ** 2, 0.0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe = np.where(std > 0.0, mean / std * self.scale, np.nan)
+
+        return {'bars': count.T, 'sharpe': sharpe.T,
+                'return': np.expm1(logs).T}
+
+    def evaluate(self, metric: str = 'sharpe', index=None):
+        """Select the best training candidate of every combination.
+
+        Parameters:
+        ----------
+        metric: string
+            Give the metric to select by, 'sharpe' or 'return'.
+        index: list
+            Give the labels of the candidates, e.g. their parameter
+            sets, their positions if None.
+
+        Returns:
+        ----------
+        results: DataFrame
+            For every combination its test groups, the chosen
+            candidate, its training and test metric, its test return and
+            the fraction of candidates it beat on the test groups.
+
+        Raises:
+        ----------
+        KeyError
+            If the metric is unknown.
+        """
+
+        train = self.metrics('train')[metric]
+        test = self.metrics('test')
+        scores = np.where(np.isnan(train), -np.inf, train)
+        chosen = np.argmax(scores, axis=1)
+        rows = np.arange(len(chosen))
+
+        test_scores = np.where(np.isnan(test[metric]), -np.inf, test[metric])
+        beaten = np.sum(test_scores < test_scores[rows, chosen][:, None],
+                        axis=1)
+        n_candidates = test_scores.shape[1]
+
+        labels = list(range(n_candidates)) if index is None else list(index)
+        return pd.DataFrame(
+            {'test groups': self.combinations,
+             'params': [labels[i] for i in chosen],
+             'train ' + metric: train[rows, chosen],
+             'test ' + metric: test[metric][rows, chosen],
+             'test return': test['return'][rows, chosen],
+             'test rank': beaten / max(n_candidates - 1, 1)})
+
+    def overfitting_probability(self, metric: str = 'sharpe'):
+        """Estimate the probability of backtest overfitting.
+
+        Parameters:
+        ----------
+        metric: string
+            Give the metric to select by, 'sharpe' or 'return'.
+
+        Returns:
+        ----------
+        pbo: float
+            The fraction of combinations on which the best training
+            candidate beats fewer than half of the candidates on the
+            test groups.
+
+        Raises:
+        ----------
+        KeyError
+            If the metric is unknown.
+        """
+
+        return float(np.mean(self.evaluate(metric)['test rank'] < 0.5))
+
+
+def cross_validate(strategy_name: str, par_tuples: list, df, splitter,
+                   cash: float = 10000, metric: str = 'sharpe',
+                   periods_per_year: int = None):
+    """Run combinatorial purged cross validation for a strategy.
+
+    Parameters:
+    ----------
+    strategy_name: string
+        Give the class name of the strategy in strategies.py.
+    par_tuples: list
+        Give the parameter sets to choose from.
+    df: DataFrame
+        Give the data to cross validate on.
+    splitter: splits.CombinatorialPurgedSplit
+        Give the splitter that defines groups, purge and embargo.
+    cash: float
+        Give the amount of starting capital.
+    metric: string
+        Give the metric to select by, 'sharpe' or 'return'.
+    periods_per_year: int
+        Give the number of bars per year to annualize the sharpe
+        ratio.
+
+    Returns:
+    ----------
+    results: DataFrame
+        The chosen parameter set and its metrics for every
+        combination, see SegmentEvaluator.evaluate.
+    pbo: float
+        The estimated probability of backtest overfitting.
+
+    Raises:
+    ----------
+    KeyError
+        If the strategy has no description of its signals.
+    ValueError
+        If a group is not longer than purge and embargo together.
+    """
+
+    par_tuples = list(par_tuples)
+    evaluator = SegmentEvaluator(
+        candidate_returns(strategy_name, par_tuples, df, cash),
+        splitter, periods_per_year)
+    results = evaluator.evaluate(metric, par_tuples)
+
+    return results, float(np.mean(results['test rank'] < 0.5))
@@ -68,7 +68,7 @@ class BackwardDifferenceQuotient(PeriodN):
         Does not raise any exceptions.
         """
 
-        self.line[0] = (self.data[0] - self.data[self.p.period]) \
+        self.line[0] = (self.data[0] - self.data[-self.p.period]) \
                        / (self.data[0] * self.p.period)
 
     def once(self, start, end):
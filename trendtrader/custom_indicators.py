@@ -10,6 +10,17 @@ Classes
 ----------
 STC: Inherits from Indicator
     Represent the Schaff Trend Cycle (STC) indicator.
+GraphLine: Inherits from Indicator
+    Feed a node of an indicator_graph.IndicatorGraph into backtrader.
+Highest, Lowest: Inherit from Indicator
+    Represent the highest or lowest value over a period.
+AroonUp, AroonDown: Inherit from Indicator
+    Represent the AroonUp or AroonDown indicator.
+StandardDeviation: Inherits from Indicator
+    Represent the rolling population standard deviation.
+
+The rolling indicators replace the ones of backtrader with the same
+values, built on the constant time primitives of rolling.
 
 Functions
 ----------
@@ -20,7 +31,13 @@ Exceptions
     Exports no exceptions.
 """
 
+from array import array
+import math
+
 import backtrader as bt
+import numpy as np
+
+import rolling
 
 class STC(bt.Indicator):
     """The Schaff Trend Cycle indicator is a momentum indicator."""
@@ -39,14 +56,172 @@ class STC(bt.Indicator):
                           plot=False)
 
         # Compute Slow Stochastic of MACD
-        macLow = bt.ind.Lowest(mac, period=self.p.cycle, plot=False)
-        macHigh = bt.ind.Highest(mac, period=self.p.cycle, plot=False)
+        macLow = Lowest(mac, period=self.p.cycle, plot=False)
+        macHigh = Highest(mac, period=self.p.cycle, plot=False)
         k = 100 * bt.DivByZero(mac - macLow, (macHigh - macLow))
         d = bt.ind.ExponentialMovingAverage(k, period=self.p.d1Length,
                                             plot=False)
 
         # Compute Slow Stochastic of Slow Stochastic of MACD i.e. STC
-        dLow = bt.ind.Lowest(d, period=self.p.cycle, plot=False)
-        dHigh = bt.ind.Highest(d, period=self.p.cycle, plot=False)
+        dLow = Lowest(d, period=self.p.cycle, plot=False)
+        dHigh = Highest(d, period=self.p.cycle, plot=False)
         kd = 100 * bt.DivByZero((d - dLow), (dHigh - dLow))
-        self.l.stc = bt.ind.EMA(kd, period=self.p.d2Length, plot=False)
\ No newline at end of file
+        self.l.stc = bt.ind.EMA(kd, period=self.p.d2Length, plot=False)
+
+class GraphLine(bt.Indicator):
+    """Feed a precomputed node of an indicator graph into backtrader.
+
+    Description
+    ----------
+    The values of the node are computed once by the indicator graph and
+    shared by every strategy that uses them. The node has to be computed
+    on the same bars as the data feed the indicator is attached to.
+    """
+
+    lines = ('value',)
+    params = {('node', None)}
+
+    def __init__(self):
+        super(GraphLine, self).__init__()
+        self.addminperiod(self.p.node.minperiod)
+
+    def next(self):
+        self.l.value[0] = self.p.node.array[len(self) - 1]
+
+    def once(self, start, end):
+        self.line.array[start:end] = array('d', self.p.node.array[start:end])
+
+
+class _Rolling(bt.Indicator):
+    """Base of the indicators on the rolling primitives.
+
+    Description
+    ----------
+    In runonce mode the values of all bars are computed by one call of
+    the batch function of the primitive. Bar by bar, e.g. on live
+    feeds, a streaming state is seeded with the values before the first
+    full window and then updated with one value per bar.
+    """
+
+    params = (('period', 14),)
+
+    def __init__(self):
+        super(_Rolling, self).__init__()
+        self.state = None
+        self.addminperiod(self._window())
+
+    def _window(self):
+        return self.p.period
+
+    def _source(self):
+        return self.data
+
+    def _batch(self, values):
+        raise NotImplementedError
+
+    def _stream(self):
+        raise NotImplementedError
+
+    def _value(self, update):
+        return update
+
+    def next(self):
+        source = self._source()
+        if self.state is None:
+            self.state = self._stream()
+            for value in source.get(ago=-1, size=self._window() - 1):
+                self.state.update(value)
+        self.lines[0][0] = self._value(self.state.update(source[0]))
+
+    def once(self, start, end):
+        first = start - self._window() + 1
+        values = np.asarray(self._source().array[first:end], dtype=float)
+        self.lines[0].array[start:end] = array(
+            'd', self._batch(values)[self._window() - 1:])
+
+
+class Highest(_Rolling):
+    """The highest value of the data over a period."""
+
+    lines = ('highest',)
+
+    def _batch(self, values):
+        return rolling.rolling_max(values, self.p.period)
+
+    def _stream(self):
+        return rolling.RollingExtreme(self.p.period, True)
+
+    def _value(self, update):
+        return update[0]
+
+
+class Lowest(_Rolling):
+    """The lowest value of the data over a period."""
+
+    lines = ('lowest',)
+
+    def _batch(self, values):
+        return rolling.rolling_min(values, self.p.period)
+
+    def _stream(self):
+        return rolling.RollingExtreme(self.p.period, False)
+
+    def _value(self, update):
+        return update[0]
+
+
+class _Aroon(_Rolling):
+    """Base of AroonUp and AroonDown.
+
+    Description
+    ----------
+    100 when the extreme of period + 1 bars is on the current bar,
+    falling to 0 when it is period bars ago.
+    """
+
+    _up = True
+
+    def _window(self):
+        return self.p.period + 1
+
+    def _source(self):
+        return self.data.high if self._up else self.data.low
+
+    def _batch(self, values):
+        since = (rolling.rolling_argmax if self._up
+                 else rolling.rolling_argmin)(values, self.p.period + 1)
+        return (100.0 / self.p.period) * (self.p.period - since)
+
+    def _stream(self):
+        return rolling.RollingExtreme(self.p.period + 1, self._up)
+
+    def _value(self, update):
+        return (100.0 / self.p.period) * (self.p.period - update[1])
+
+
+class AroonUp(_Aroon):
+    """The AroonUp indicator of the high prices."""
+
+    lines = ('aroonup',)
+
+
+class AroonDown(_Aroon):
+    """The AroonDown indicator of the low prices."""
+
+    lines = ('aroondown',)
+    _up = False
+
+
+class StandardDeviation(_Rolling):
+    """The rolling population standard deviation of the data."""
+
+    lines = ('stddev',)
+
+    def _batch(self, values):
+        return rolling.rolling_std(values, self.p.period)
+
+    def _stream(self):
+        return rolling.RollingVariance(self.p.period)
+
+    def _value(self, update):
+        return math.sqrt(update)
@@ -0,0 +1,373 @@
+"""Implements incremental re-optimization of a sweep on growing data.
+
+Description
+----------
+A sweep that is brought up to date with a few new candles runs every
+candidate over the whole history again, although all but the last bars
+give the same result as before. The incremental sweep keeps the state
+every candidate ended in instead: the tails of the indicators of
+indicator_graph, the cash, the position and the pending order of the
+position loop of kernels and the accumulators of the metrics of
+metrics.OnlineMetrics. Appending bars extends the indicators by the new
+bars only, see IndicatorGraph.append, continues the position loop of
+every candidate from its state, see kernels.advance_loop, and feeds the
+new account values to its metrics, so the cost grows with the number of
+new bars instead of the length of the history, e.g.
+
+    state = incremental.start_sweep('StcVol', windowset, df)
+    incremental.advance_sweep(state, df_new)
+    analysis = incremental.ranked(state)
+
+gives the same ranking as a kernels.sweep over both DataFrames. The
+crosses of the STC levels only look back within the kept tail for the
+last bar the STC differed from the level, and the rolling standard
+deviation is taken from the values of every window rather than from
+running sums, so results can differ from a full sweep in the last
+digits.
+
+The strategies on the backward difference quotient are not causal, its
+values on all bars change with every new bar, so they are always swept
+in full. refresh_sweep keeps the state in a snapshot file and brings it
+up to date with the data, and sweeps in full whenever the state cannot
+be continued, see snapshot.
+
+Classes
+----------
+    Implements no classes.
+
+Functions
+----------
+start_sweep: dict
+    Runs a sweep and keeps the state of every candidate.
+advance_sweep:
+    Continues a sweep over appended bars.
+sweep_results: DataFrame
+    Returns the metrics of every candidate like kernels.sweep.
+ranked: DataFrame
+    Ranks the candidates like optimizer.optimize.
+refresh_sweep: DataFrame
+    Brings a sweep kept in a file up to date with the data.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import pytz
+
+import indicator_graph
+import kernels
+import metrics
+import optimizer
+import snapshot
+import telemetry
+
+
+def _signals(graph, strategy_name, par_tuples, batch):
+    # Signals of a chunk with one row per parameter set
+    if batch:
+        return kernels.rule_signals(graph, strategy_name, par_tuples)
+
+    entry, exit_, direction, start = kernels.strategy_signals(
+        graph, strategy_name, par_tuples[0])
+    return entry[None], exit_[None], direction, start
+
+
+def _feed(stats, years, values):
+    # OnlineMetrics.update on every bar, the account values within a
+    # year only matter for the drawdown, which is taken at once
+    peak = np.maximum.accumulate(np.concatenate(([stats.drawdown.peak],
+                                                 values)))[1:]
+    drawdown = 100.0 * (peak - values) / peak
+    max_drawdown = stats.drawdown.max_drawdown
+
+    ends = np.flatnonzero(np.diff(years)).tolist() + [len(values) - 1]
+    for i in ends:
+        stats.update(int(years[i]), float(values[i]))
+
+    stats.drawdown.peak = float(peak[-1])
+    stats.drawdown.drawdown = float(drawdown[-1])
+    stats.drawdown.max_drawdown = max(max_drawdown, float(drawdown.max()))
+
+
+def _advance(state, graph, years, progress):
+    # Continue every candidate over the last len(years) bars of graph
+    strategy_name = state['config']['strategy']
+    par_tuples = state['config']['par_tuples']
+    first = graph.size - len(years)
+    batch = bool(indicator_graph.RULE_PARAMETERS.get(strategy_name))
+
+    loop = kernels.advance_loop
+    open_ = np.ascontiguousarray(graph.base('open').array[first:])
+    close = np.ascontiguousarray(graph.base('close').array[first:])
+    values = np.empty(len(years))
+    trade_pnl = np.empty(len(years) // 2 + 1)
+    for chunk in kernels.rule_chunks(strategy_name, par_tuples, graph.size,
+                                     batch):
+        entry, exit_, direction, start = _signals(
+            graph, strategy_name, [par_tuples[i] for i in chunk], batch)
+        # The start of the strategy counts from the first bar of the
+        # sweep, the graph only holds a tail
+        start -= state['bars']
+        for row, i in enumerate(chunk):
+            trades, opened = loop(open_, close,
+                                  np.ascontiguousarray(entry[row, first:]),
+                                  np.ascontiguousarray(exit_[row, first:]),
+                                  direction, start, state['loops'][i],
+                                  state['config']['commission'], values,
+                                  trade_pnl)
+            stats = state['metrics'][i]
+            for pnl in trade_pnl[:trades].tolist():
+                stats.trades.close(pnl)
+            for _ in range(opened):
+                stats.trades.open()
+            _feed(stats, years, values)
+        if progress is not None:
+            progress.update(runs=len(chunk))
+
+    state['bars'] += len(years)
+    state['nodes'] = graph.tail(graph.context()).nodes()
+
+
+def start_sweep(strategy_name: str, par_tuples: list, df,
+                cash: float = 10000, commission: float = 0.0007,
+                progress=None):
+    """Run a sweep and keep the state of every candidate.
+
+    Parameters:
+    ----------
+    strategy_name: string
+        Give the class name of the strategy in strategies.py.
+    par_tuples: list
+        Give the parameter sets to run the strategy with.
+    df: DataFrame
+        Give the data to run the strategy on.
+    cash: float
+        Give the amount of starting capital.
+    commission: float
+        Give the commission as a fraction of the traded value.
+    progress: telemetry.SweepTelemetry
+        Give the telemetry to count the finished runs in, if any.
+
+    Returns:
+    ----------
+    state: dict
+        The configuration, the number of bars and the time of the last
+        bar run, the tails of the indicators and the state of the
+        position loop and the metrics of every candidate.
+
+    Raises:
+    ----------
+    KeyError
+        If the strategy has no description of its signals.
+    """
+
+    graph = indicator_graph.IndicatorGraph.from_frame(df)
+    loops = np.zeros((len(par_tuples), kernels.LOOP_STATE))
+    loops[:, 0] = cash
+    state = {'config': {'strategy': strategy_name,
+                        'par_tuples': list(par_tuples),
+                        'cash': cash, 'commission': commission},
+             'bars': 0,
+             'last': df.index[-1],
+             'loops': loops,
+             'metrics': [metrics.OnlineMetrics(cash) for _ in par_tuples]}
+
+    _advance(state, graph, df.index.year.values, progress)
+    state['causal'] = graph.causal()
+
+    return state
+
+
+def advance_sweep(state: dict, df, progress=None):
+    """Continue a sweep over appended bars.
+
+    Parameters:
+    ----------
+    state: dict
+        Give the state as returned by start_sweep, it is updated.
+    df: DataFrame
+        Give the bars that follow the bars of the state.
+    progress: telemetry.SweepTelemetry
+        Give the telemetry to count the finished runs in, if any.
+
+    Returns:
+    ----------
+    Returns no value.
+
+    Raises:
+    ----------
+    ValueError
+        If the strategy is not causal or the bars do not follow the
+        bars of the state.
+    """
+
+    if not state['causal']:
+        raise ValueError('Strategy is not causal, sweep it in full')
+    if not len(df):
+        return
+    if df.index[0] <= state['last']:
+        raise ValueError('Bars do not follow the bars of the state')
+
+    graph = indicator_graph.IndicatorGraph.from_nodes(state['nodes'])
+    state['last'] = df.index[-1]
+    _advance(state, graph.append(df), df.index.year.values, progress)
+
+
+def sweep_results(state: dict):
+    """Return the metrics of every candidate like kernels.sweep.
+
+    Parameters:
+    ----------
+    state: dict
+        Give the state as returned by start_sweep.
+
+    Returns:
+    ----------
+    analysis: DataFrame
+        The number of trades, win rate, sharpe ratio, maximum draw down
+        and net profit of every parameter set, indexed by the
+        parameter sets.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    rows = list()
+    for stats in state['metrics']:
+        row = stats.metrics()
+        if row['sharpe'] is None:
+            row['sharpe'] = np.nan
+        rows.append(row)
+
+    return pd.DataFrame(rows, columns=['# trades', 'win rate', 'sharpe',
+                                       'max DD', 'pnl'],
+                        index=pd.MultiIndex.from_tuples(
+                            state['config']['par_tuples']))
+
+
+def ranked(state: dict, method: str = 'drawdown'):
+    """Rank the candidates of a state, see optimizer.rank_results."""
+
+    return optimizer.rank_results(sweep_results(state), method)
+
+
+def _load_state(state_path, config):
+    # A snapshot of another format version is swept again
+    try:
+        state = snapshot.read_snapshot(state_path)
+    except (OSError, ValueError):
+        return None
+
+    return state if state['config'] == config else None
+
+
+def _continues(state, df):
+    # The bars of the state are still the first bars of the data
+    bars = state['bars']
+    if len(df) < bars or df.index[bars - 1] != state['last']:
+        return False
+
+    for node in state['nodes']:
+        if len(node.key) == 1:
+            kept = df[node.key[0]].to_numpy(dtype=float)[:bars]
+            if not np.array_equal(kept[bars - len(node.array):], node.array,
+                                  equal_nan=True):
+                return False
+
+    return True
+
+
+def refresh_sweep(strat_name: str, strategy_name: str, windowset: set,
+                  state_path: str, pair: str = 'BTC-USD', cash: int = 10000,
+                  timeframe: str = '1D',
+                  start_date: dt.datetime = dt.datetime(
+                      2014,12,1,0,0,0,0,
+                      dt.timezone(dt.timedelta(hours=0))),
+                  end_date: dt.datetime = None, funding: bool = False,
+                  commission: float = 0.0007, rank: str = 'drawdown'):
+    """Bring a sweep kept in a file up to date with the data.
+
+    Description
+    ----------
+    The state of every candidate is kept in a snapshot file, see
+    snapshot. When the data has grown since the last refresh, every
+    candidate is only run over the new bars. The sweep is run in full
+    if there is no state, if the strategy, the parameter sets or the
+    data they were run on changed, or if the strategy is not causal.
+
+    Parameters:
+    ----------
+    strat_name: string
+        Give the name of the sweep.
+    strategy_name: string
+        Give the class name of the strategy in strategies.py.
+    windowset: set
+        Give the parameter sets to run the strategy with.
+    state_path: string
+        Give the file to keep the state of the candidates in.
+    pair: string
+        Give the currency pair to be traded.
+    cash: int
+        Give the amount of starting capital.
+    timeframe: string
+        Give the time frame of the chart to be traded on.
+    start_date: datetime.datetime
+        Give the date where the data starts.
+    end_date: datetime.datetime
+        Give the date where the data ends, all data if None.
+    funding: bool
+        Indicates if funding data should be considered.
+    commission: float
+        Give the commission as a fraction of the traded value.
+    rank: string
+        Give the method that ranks the candidates, see
+        optimizer.rank_results.
+
+    Returns:
+    ----------
+    analysis: DataFrame
+        The metrics of the parameter sets that passed the filters, best
+        first.
+
+    Raises:
+    ----------
+    KeyError
+        If the strategy has no description of its signals.
+    ValueError
+        If the ranking method is unknown.
+    """
+
+    print('Refreshing: ' + strat_name + '\n')
+
+    if end_date is None:
+        end_date = dt.datetime.now(pytz.utc)
+    df, _ = optimizer.read_data(pair, timeframe, start_date, end_date,
+                                funding)
+
+    config = {'strategy': strategy_name, 'par_tuples': sorted(windowset),
+              'cash': cash, 'commission': commission}
+    state = _load_state(state_path, config)
+
+    progress = telemetry.SweepTelemetry(strat_name, len(windowset),
+                                        'refresh')
+    if state is not None and state['causal'] and _continues(state, df):
+        appended = len(df) - state['bars']
+        advance_sweep(state, df.iloc[state['bars']:], progress)
+        print('Advanced {0} candidates by {1} bars'.format(len(windowset),
+                                                          appended))
+    else:
+        state = start_sweep(strategy_name, sorted(windowset), df, cash,
+                            commission, progress)
+        print('Swept {0} candidates over {1} bars'.format(len(windowset),
+                                                         len(df)))
+
+    snapshot.write_snapshot(state_path, state)
+    progress.finish()
+
+    return ranked(state, rank)
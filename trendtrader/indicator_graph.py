@@ -0,0 +1,838 @@
+"""Implements a shared indicator graph for strategies on the same feed.
+
+Description
+----------
+Strategies that run on the same data feed build many identical
+indicator chains. AroonStc, StcSmaShort and StcVol all build the same
+STC with its MACD, Highest/Lowest and EMA chain and DRSIDMALong and
+DRSIDMAShort build identical TEMA -> BackwardDifferenceQuotient -> SMA
+and RSI(ROC) chains. The indicator graph computes every indicator as a
+numpy array, keyed by the operation, its inputs and its parameters, so
+that each identical subexpression is computed exactly once per feed no
+matter how many strategies or parameter sets ask for it.
+
+The arrays follow the backtrader conventions: values before the
+minimum period of an indicator are NaN and the minimum period of every
+node is tracked so that the results can be fed back into backtrader
+through custom_indicators.GraphLine. Rolling extremes, Aroon and the
+rolling standard deviation are computed with the constant time
+primitives of rolling.
+
+A graph can be extended by appended bars without computing its nodes
+again, only the new values of every node are computed. Appending to a
+tail of the graph that covers the longest minimum period gives the same
+new values, which lets incremental keep a few hundred bars per feed.
+
+Classes
+----------
+Node: Inherits from namedtuple
+    A computed node of the graph holding its key, its values and its
+    minimum period.
+IndicatorGraph:
+    A memoized graph of indicator computations on one price series.
+
+Functions
+----------
+feed_graph: IndicatorGraph
+    Return the shared indicator graph for the price data of a
+    DataFrame.
+strategy_nodes: dict
+    Return the graph nodes a strategy uses for a given parameter set.
+indicator_key: tuple
+    Return the parameters of a parameter set the indicators use.
+warmup_bars: int
+    Return the number of bars a strategy needs before it can trade.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+from collections import namedtuple, OrderedDict
+import hashlib
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import rolling
+
+
+Node = namedtuple('Node', ('key', 'array', 'minperiod'))
+
+# Number of feeds whose graphs are kept alive by feed_graph
+GRAPH_CACHE_SIZE = 8
+
+# Minimum period of the lines a strategy adds outside of the graph
+STRATEGY_MINPERIODS = {'SMAC': 30}
+
+# Number of past values of its nodes the next method of a strategy reads
+STRATEGY_LOOKBACKS = {'SMAC': 1}
+
+_graphs = OrderedDict()
+
+
+def _nan_array(size):
+    return np.full(size, np.nan)
+
+
+def _columns_key(columns):
+    """Fingerprint a dict of price columns."""
+
+    digest = hashlib.sha1()
+    for name, values in columns.items():
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(values, dtype=float).tobytes())
+
+    return digest.hexdigest()
+
+
+class IndicatorGraph:
+    """A memoized graph of indicator computations on one price series.
+
+    Description
+    ----------
+    Every method returns a Node. Nodes are identified by a key made of
+    the operation name, the keys of the input nodes and the parameters,
+    so asking twice for the same indicator returns the cached node.
+    The computations reproduce the values backtrader produces in
+    runonce mode.
+
+    Attributes
+    ----------
+    size : int
+        The number of bars in the price series.
+    hits : int
+        The number of node requests answered from the cache.
+    misses : int
+        The number of nodes that had to be computed.
+    """
+
+    def __init__(self, columns: dict):
+        """Initialize the graph from a dict of equally long columns."""
+
+        self._nodes = dict()
+        self.size = len(next(iter(columns.values())))
+        self.hits = 0
+        self.misses = 0
+
+        for name, values in columns.items():
+            key = (name,)
+            self._nodes[key] = Node(key, np.asarray(values, dtype=float), 1)
+        self.key = _columns_key(columns)
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build a graph from a DataFrame as returned by read_data."""
+
+        return cls(_frame_columns(df))
+
+    def __reduce__(self):
+        # Only ship the price columns, a worker process shares one graph
+        # per feed across all the runs it executes
+        columns = OrderedDict((key[0], node.array)
+                              for key, node in self._nodes.items()
+                              if len(key) == 1)
+        return _registered_graph, (self.key, columns)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def causal(self):
+        """Return if appending bars leaves the values of the past alone.
+
+        The backward difference quotient scales the whole series by its
+        last value like backtrader in runonce mode, so every new bar
+        changes it on all bars.
+        """
+
+        return not any(key[0] == 'bdq' for key in self._nodes)
+
+    @classmethod
+    def from_nodes(cls, nodes: list):
+        """Build a graph from the nodes of another one, see nodes."""
+
+        graph = cls(OrderedDict((node.key[0], node.array) for node in nodes
+                                if len(node.key) == 1))
+        for node in nodes:
+            if len(node.key) > 1:
+                graph._nodes[node.key] = node
+
+        return graph
+
+    def nodes(self):
+        """Return all nodes, every node after the nodes it is computed from.
+
+        Pickling a graph only keeps its price columns, the nodes can be
+        kept instead and handed to from_nodes.
+        """
+
+        return list(self._nodes.values())
+
+    def tail(self, length: int):
+        """Return a graph of the last bars holding the tails of all nodes.
+
+        Description
+        ----------
+        The minimum periods stay those of the whole series, so a tail
+        of at least context bars holds every value append needs.
+        """
+
+        return IndicatorGraph.from_nodes([
+            Node(node.key, node.array[-length:].copy(), node.minperiod)
+            for node in self._nodes.values()])
+
+    def context(self):
+        """Return the number of bars a tail needs to be appended to."""
+
+        return max(node.minperiod for node in self._nodes.values()) + 1
+
+    def append(self, df):
+        """Return the graph with bars appended and every node extended.
+
+        Description
+        ----------
+        Only the values of the new bars are computed, from the values
+        of the inputs within the window of every operation, and the
+        smoothed averages from their last value. Every node keeps its
+        past values. A graph of the whole series or a tail of at least
+        context bars gives the values a graph of the longer series
+        computes, up to the rounding of the rolling standard deviation,
+        which is taken from the values of every window rather than from
+        running sums. A node crossing a level looks for the last bar it
+        differed from the level within the tail. Appending bars one by
+        one or at once gives the same values. Graphs that are not causal
+        give other values than a graph of the longer series.
+
+        Parameters:
+        ----------
+        df: DataFrame
+            Give the new bars like from_frame takes them.
+
+        Returns:
+        ----------
+        graph: IndicatorGraph
+            The graph of the longer series with all nodes of this one.
+
+        Raises:
+        ----------
+        KeyError
+            If a price column of the graph is missing.
+        """
+
+        old = self.size
+        columns = _frame_columns(df)
+        graph = IndicatorGraph(OrderedDict(
+            (key[0], np.concatenate((node.array,
+                                     np.asarray(columns[key[0]],
+                                                dtype=float))))
+            for key, node in self._nodes.items() if len(key) == 1))
+
+        # Inputs are always cached before the nodes computed from them
+        for key, node in self._nodes.items():
+            if len(key) == 1:
+                continue
+            if key[0] in ('ema', 'smma') and old >= node.minperiod:
+                array = _smooth(graph._nodes[key[1]].array, node.array,
+                                2.0 / (1.0 + key[2]) if key[0] == 'ema'
+                                else 1.0 / key[2])
+            elif key[0] == 'stddev' and old >= node.minperiod:
+                array = _window_std(graph._nodes[key[1]].array, node.array,
+                                    key[2])
+            else:
+                array = _replay(graph, key).array.copy()
+                array[:old] = node.array
+            graph._nodes[key] = Node(key, array, node.minperiod)
+
+        return graph
+
+    def _node(self, key, compute):
+        """Return the node for key, computing it if it is not cached."""
+
+        node = self._nodes.get(key)
+        if node is not None:
+            self.hits += 1
+            return node
+
+        self.misses += 1
+        array, minperiod = compute()
+        node = Node(key, array, minperiod)
+        self._nodes[key] = node
+        return node
+
+    def base(self, name: str = 'close'):
+        """Return the node of a raw price column."""
+
+        return self._nodes[(name,)]
+
+    def const(self, value: float):
+        """Return a node holding a constant value on every bar."""
+
+        return self._node(('const', float(value)),
+                          lambda: (np.full(self.size, float(value)), 1))
+
+    def binary(self, op: str, a: Node, b: Node):
+        """Combine two nodes element wise with add, sub, mul or div."""
+
+        funcs = {'add': np.add, 'sub': np.subtract,
+                 'mul': np.multiply, 'div': np.divide}
+
+        def compute():
+            with np.errstate(divide='ignore', invalid='ignore'):
+                array = funcs[op](a.array, b.array)
+            minperiod = max(a.minperiod, b.minperiod)
+            array[:minperiod - 1] = np.nan
+            return array, minperiod
+
+        return self._node((op, a.key, b.key), compute)
+
+    def scale(self, a: Node, factor: float):
+        """Multiply a node by a constant factor."""
+
+        def compute():
+            return a.array * factor, a.minperiod
+
+        return self._node(('scale', a.key, float(factor)), compute)
+
+    def div_by_zero(self, a: Node, b: Node, zero: float = 0.0):
+        """Divide two nodes, returning zero where the divisor is zero."""
+
+        def compute():
+            with np.errstate(divide='ignore', invalid='ignore'):
+                array = np.where(b.array != 0, a.array / b.array, zero)
+            minperiod = max(a.minperiod, b.minperiod)
+            array[:minperiod - 1] = np.nan
+            return array, minperiod
+
+        return self._node(('divbyzero', a.key, b.key, float(zero)), compute)
+
+    def delay(self, a: Node, period: int):
+        """Shift a node backwards by period bars."""
+
+        period = int(period)
+
+        def compute():
+            array = _nan_array(self.size)
+            array[period:] = a.array[:self.size - period]
+            return array, a.minperiod + period
+
+        return self._node(('delay', a.key, period), compute)
+
+    def _window(self, a: Node, period: int, name: str, func):
+        period = int(period)
+
+        def compute():
+            array = _nan_array(self.size)
+            minperiod = a.minperiod + period - 1
+            if self.size >= minperiod:
+                windows = sliding_window_view(a.array[a.minperiod - 1:],
+                                              period)
+                array[minperiod - 1:] = func(windows)
+            return array, minperiod
+
+        return self._node((name, a.key, period), compute)
+
+    def sma(self, a: Node, period: int):
+        """Simple moving average of a node."""
+
+        return self._window(a, period, 'sma',
+                            lambda w: w.sum(axis=1) / w.shape[1])
+
+    def _rolling(self, a: Node, period: int, name: str, func):
+        period = int(period)
+
+        def compute():
+            array = _nan_array(self.size)
+            minperiod = a.minperiod + period - 1
+            if self.size >= minperiod:
+                array[a.minperiod - 1:] = func(a.array[a.minperiod - 1:],
+                                               period)
+            return array, minperiod
+
+        return self._node((name, a.key, period), compute)
+
+    def highest(self, a: Node, period: int):
+        """Highest value of a node over period bars."""
+
+        return self._rolling(a, period, 'highest', rolling.rolling_max)
+
+    def lowest(self, a: Node, period: int):
+        """Lowest value of a node over period bars."""
+
+        return self._rolling(a, period, 'lowest', rolling.rolling_min)
+
+    def _smoothing(self, a: Node, period: int, alpha: float, name: str):
+        period = int(period)
+
+        def compute():
+            seed = self.sma(a, period)
+            array = _nan_array(self.size)
+            minperiod = seed.minperiod
+            if self.size >= minperiod:
+                src = a.array
+                alpha1 = 1.0 - alpha
+                prev = seed.array[minperiod - 1]
+                array[minperiod - 1] = prev
+                for i in range(minperiod, self.size):
+                    prev = prev * alpha1 + src[i] * alpha
+                    array[i] = prev
+            return array, minperiod
+
+        return self._node((name, a.key, period), compute)
+
+    def ema(self, a: Node, period: int):
+        """Exponential moving average of a node, seeded with the SMA."""
+
+        return self._smoothing(a, period, 2.0 / (1.0 + int(period)), 'ema')
+
+    def smma(self, a: Node, period: int):
+        """Wilder's smoothed moving average of a node."""
+
+        return self._smoothing(a, period, 1.0 / int(period), 'smma')
+
+    def macd(self, a: Node, fast: int, slow: int):
+        """MACD line of a node, the difference of two EMAs."""
+
+        return self.binary('sub', self.ema(a, fast), self.ema(a, slow))
+
+    def warmup(self, a: Node, minperiod: int):
+        """Extend the minimum period of a node, NaN before it."""
+
+        minperiod = max(int(minperiod), a.minperiod)
+
+        def compute():
+            array = a.array.copy()
+            array[:minperiod - 1] = np.nan
+            return array, minperiod
+
+        return self._node(('warmup', a.key, minperiod), compute)
+
+    def stc(self, a: Node, fast: int, slow: int, cycle: int,
+            d1_length: int, d2_length: int):
+        """Schaff Trend Cycle of a node, see custom_indicators.STC."""
+
+        # backtrader hands the MACD indicator on with the minimum period
+        # of its signal line, whose period is the cycle length
+        mac = self.warmup(self.macd(a, fast, slow), slow + cycle - 1)
+        mac_low = self.lowest(mac, cycle)
+        mac_high = self.highest(mac, cycle)
+        k = self.scale(self.div_by_zero(self.binary('sub', mac, mac_low),
+                                        self.binary('sub', mac_high,
+                                                    mac_low)), 100)
+        d = self.ema(k, d1_length)
+
+        d_low = self.lowest(d, cycle)
+        d_high = self.highest(d, cycle)
+        kd = self.scale(self.div_by_zero(self.binary('sub', d, d_low),
+                                         self.binary('sub', d_high, d_low)),
+                        100)
+        return self.ema(kd, d2_length)
+
+    def _cross(self, a: Node, level: float, up: bool):
+        level = float(level)
+
+        def compute():
+            array = _nan_array(self.size)
+            minperiod = a.minperiod + 1
+            if self.size >= minperiod:
+                # Last non zero difference between the node and the level
+                diff = a.array - level
+                nzd = np.where(diff != 0, diff, np.nan)
+                nzd[a.minperiod - 1] = diff[a.minperiod - 1]
+                nzd[:a.minperiod - 1] = 0.0
+                idx = np.where(~np.isnan(nzd), np.arange(self.size), 0)
+                nzd = nzd[np.maximum.accumulate(idx)]
+                if up:
+                    cross = (nzd[:-1] < 0) & (a.array[1:] > level)
+                else:
+                    cross = (nzd[:-1] > 0) & (a.array[1:] < level)
+                array[minperiod - 1:] = cross[minperiod - 2:]
+            return array, minperiod
+
+        return self._node(('cross', a.key, level, up), compute)
+
+    def crossup(self, a: Node, level: float):
+        """1.0 on bars where a node crosses a level upwards."""
+
+        return self._cross(a, level, True)
+
+    def crossdown(self, a: Node, level: float):
+        """1.0 on bars where a node crosses a level downwards."""
+
+        return self._cross(a, level, False)
+
+    def _aroon(self, a: Node, period: int, up: bool):
+        period = int(period)
+
+        def compute():
+            array = _nan_array(self.size)
+            minperiod = a.minperiod + period
+            if self.size >= minperiod:
+                since = (rolling.rolling_argmax if up
+                         else rolling.rolling_argmin)(
+                             a.array[a.minperiod - 1:], period + 1)
+                array[a.minperiod - 1:] = (100.0 / period) * (period - since)
+            return array, minperiod
+
+        return self._node(('aroon', a.key, period, up), compute)
+
+    def aroonup(self, period: int):
+        """AroonUp of the high prices."""
+
+        return self._aroon(self.base('high'), period, True)
+
+    def aroondown(self, period: int):
+        """AroonDown of the low prices."""
+
+        return self._aroon(self.base('low'), period, False)
+
+    def roc(self, a: Node, period: int):
+        """Rate of change of a node over period bars."""
+
+        past = self.delay(a, period)
+        return self.binary('div', self.binary('sub', a, past), past)
+
+    def pct_change(self, a: Node, period: int):
+        """Percentage change of a node over period bars."""
+
+        def compute():
+            ratio = self.binary('div', a, self.delay(a, period))
+            return ratio.array - 1.0, ratio.minperiod
+
+        return self._node(('pctchange', a.key, int(period)), compute)
+
+    def stddev(self, a: Node, period: int):
+        """Rolling population standard deviation of a node."""
+
+        return self._rolling(a, period, 'stddev', rolling.rolling_std)
+
+    def _updown(self, a: Node, up: bool):
+        # Gains or losses of a node from bar to bar
+        diff = self.binary('sub', a, self.delay(a, 1))
+
+        return self._node(('upday' if up else 'downday', a.key),
+                          lambda: (np.maximum(diff.array if up
+                                              else -diff.array, 0.0),
+                                   diff.minperiod))
+
+    def rsi(self, a: Node, period: int):
+        """Relative strength index of a node using Wilder's smoothing."""
+
+        def compute():
+            upday = self._updown(a, True)
+            downday = self._updown(a, False)
+            rs = self.binary('div', self.smma(upday, period),
+                             self.smma(downday, period))
+            return 100.0 - 100.0 / (1.0 + rs.array), rs.minperiod
+
+        return self._node(('rsi', a.key, int(period)), compute)
+
+    def tema(self, a: Node, period: int):
+        """Triple exponential moving average of a node."""
+
+        def compute():
+            ema1 = self.ema(a, period)
+            ema2 = self.ema(ema1, period)
+            ema3 = self.ema(ema2, period)
+            array = 3.0 * ema1.array - 3.0 * ema2.array + ema3.array
+            return array, ema3.minperiod
+
+        return self._node(('tema', a.key, int(period)), compute)
+
+    def backward_difference_quotient(self, a: Node, period: int):
+        """Backward difference quotient of a node.
+
+        Description
+        ----------
+        Reproduces custom_basicops.BackwardDifferenceQuotient in
+        runonce mode, which scales the difference by the last value of
+        the input series rather than by the current one.
+        """
+
+        period = int(period)
+
+        def compute():
+            array = _nan_array(self.size)
+            minperiod = a.minperiod + period - 1
+            src = a.array
+            if self.size >= minperiod:
+                idx = np.arange(minperiod - 1, self.size)
+                array[idx] = (src[idx] - src[idx - period]) \
+                             / (src[-1] * period)
+            return array, minperiod
+
+        return self._node(('bdq', a.key, period), compute)
+
+
+def _smooth(src, past, alpha):
+    # Continue a smoothed average from its last value
+    array = np.concatenate((past, _nan_array(len(src) - len(past))))
+    prev = past[-1]
+    alpha1 = 1.0 - alpha
+    for i in range(len(past), len(src)):
+        prev = prev * alpha1 + src[i] * alpha
+        array[i] = prev
+
+    return array
+
+
+def _window_std(src, past, period):
+    # Standard deviations of the new windows, each from its own values
+    # so that they do not depend on how the bars were appended
+    windows = sliding_window_view(src[len(past) - period + 1:], period)
+    return np.concatenate((past, np.sqrt(windows.var(axis=1))))
+
+
+def _replay(graph, key):
+    """Compute the node of a key on a graph from its cached inputs."""
+
+    op = key[0]
+    nodes = graph._nodes
+    if op == 'const':
+        return graph.const(key[1])
+    if op in ('add', 'sub', 'mul', 'div'):
+        return graph.binary(op, nodes[key[1]], nodes[key[2]])
+    if op == 'divbyzero':
+        return graph.div_by_zero(nodes[key[1]], nodes[key[2]], key[3])
+    if op == 'cross':
+        return graph._cross(nodes[key[1]], key[2], key[3])
+    if op == 'aroon':
+        return graph._aroon(nodes[key[1]], key[2], key[3])
+    if op in ('upday', 'downday'):
+        return graph._updown(nodes[key[1]], op == 'upday')
+
+    methods = {'scale': graph.scale, 'delay': graph.delay,
+               'warmup': graph.warmup, 'sma': graph.sma,
+               'highest': graph.highest, 'lowest': graph.lowest,
+               'stddev': graph.stddev, 'ema': graph.ema, 'smma': graph.smma,
+               'pctchange': graph.pct_change, 'rsi': graph.rsi,
+               'tema': graph.tema, 'bdq': graph.backward_difference_quotient}
+    return methods[op](nodes[key[1]], key[2])
+
+
+def _frame_columns(df):
+    columns = OrderedDict()
+    for name in ('open', 'high', 'low', 'close', 'funding'):
+        if name in df.columns:
+            columns[name] = df[name].to_numpy(dtype=float)
+
+    return columns
+
+
+def _register(graph):
+    _graphs.pop(graph.key, None)
+    _graphs[graph.key] = graph
+
+    while len(_graphs) > GRAPH_CACHE_SIZE:
+        _graphs.popitem(last=False)
+
+    return graph
+
+
+def _registered_graph(key, columns):
+    """Return the registered graph for key, used when unpickling."""
+
+    graph = _graphs.get(key)
+    if graph is None:
+        graph = IndicatorGraph(columns)
+
+    return _register(graph)
+
+
+def feed_graph(df):
+    """Return the shared indicator graph for the data of a DataFrame.
+
+    Description
+    ----------
+    Graphs are registered under a fingerprint of the price data, so
+    strategies that are tested back to back on the same feed share all
+    indicators that have already been computed. A graph that is pickled
+    to a worker process resolves to the graph registered there for the
+    same data.
+
+    Parameters:
+    ----------
+    df: DataFrame
+        A DataFrame as returned by optimizer.read_data.
+
+    Returns:
+    ----------
+    graph: IndicatorGraph
+        The indicator graph for the data.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    columns = _frame_columns(df)
+    return _registered_graph(_columns_key(columns), columns)
+
+
+def _stc_nodes(graph, par_tuple, rules=True):
+    nodes = {'stc': graph.stc(graph.base('close'), *par_tuple[0:5])}
+    if rules:
+        nodes['crossup'] = graph.crossup(nodes['stc'], par_tuple[5])
+        nodes['crossdown'] = graph.crossdown(nodes['stc'], par_tuple[6])
+    return nodes
+
+
+def _smac_nodes(graph, par_tuple, rules=True):
+    close = graph.base('close')
+    fastma = graph.sma(close, par_tuple[0])
+    slowma = graph.sma(close, par_tuple[1])
+    return {'fastma': fastma, 'slowma': slowma,
+            'regime': graph.binary('sub', fastma, slowma)}
+
+
+def _aroon_stc_nodes(graph, par_tuple, rules=True):
+    nodes = _stc_nodes(graph, par_tuple, rules)
+    nodes['aroonup'] = graph.aroonup(par_tuple[7])
+    nodes['aroondown'] = graph.aroondown(par_tuple[7])
+    return nodes
+
+
+def _stc_sma_nodes(graph, par_tuple, rules=True):
+    nodes = _stc_nodes(graph, par_tuple, rules)
+    nodes['sma'] = graph.sma(graph.base('close'), par_tuple[7])
+    return nodes
+
+
+def _stc_vol_nodes(graph, par_tuple, rules=True):
+    nodes = _stc_nodes(graph, par_tuple, rules)
+    returns = graph.pct_change(graph.base('close'), 1)
+    nodes['vol'] = graph.scale(graph.stddev(returns, par_tuple[7]),
+                               100 * math.sqrt(365))
+    return nodes
+
+
+def _drsidma_nodes(graph, par_tuple, rules=True):
+    close = graph.base('close')
+    tema = graph.tema(close, par_tuple[0])
+    div_tema = graph.backward_difference_quotient(tema, par_tuple[1])
+    mom = graph.rsi(graph.roc(close, par_tuple[3]), par_tuple[3])
+    div_mom = graph.backward_difference_quotient(mom, par_tuple[4])
+    return {'tema': tema, 'divTema': div_tema,
+            'smoothAvg': graph.sma(div_tema, par_tuple[2]),
+            'mom': mom, 'divMom': div_mom,
+            'smoothMom': graph.sma(div_mom, par_tuple[5])}
+
+
+_STRATEGY_NODES = {'SMAC': _smac_nodes,
+                   'Stc': _stc_nodes,
+                   'AroonStc': _aroon_stc_nodes,
+                   'StcSmaShort': _stc_sma_nodes,
+                   'StcVol': _stc_vol_nodes,
+                   'DRSIDMALong': _drsidma_nodes,
+                   'DRSIDMAShort': _drsidma_nodes}
+
+# Positions of the parameters that only enter the decision rules of a
+# strategy, the levels of the STC crosses and the thresholds on the
+# volatility and the trend
+RULE_PARAMETERS = {'SMAC': (),
+                   'Stc': (5, 6),
+                   'AroonStc': (5, 6),
+                   'StcSmaShort': (5, 6),
+                   'StcVol': (5, 6, 8, 9),
+                   'DRSIDMALong': (6, 7),
+                   'DRSIDMAShort': (6, 7)}
+
+
+def strategy_nodes(graph: IndicatorGraph, strategy_name: str,
+                   par_tuple: tuple, rules: bool = True):
+    """Return the graph nodes a strategy uses for a parameter set.
+
+    Description
+    ----------
+    The returned dict maps the attribute names the strategies in
+    strategies.py use for their indicators to the matching nodes.
+
+    Parameters:
+    ----------
+    graph: IndicatorGraph
+        Give the graph to compute the nodes on.
+    strategy_name: string
+        Give the class name of the strategy.
+    par_tuple: tuple
+        Give the parameter set of the strategy.
+    rules: bool
+        Indicate if the nodes that depend on the parameters of
+        RULE_PARAMETERS, the crosses of the STC levels, should be
+        computed as well.
+
+    Returns:
+    ----------
+    nodes: dict
+        The nodes of the strategy keyed by attribute name.
+
+    Raises:
+    ----------
+    KeyError
+        If the strategy has no graph description.
+    """
+
+    return _STRATEGY_NODES[strategy_name](graph, par_tuple, rules)
+
+
+def indicator_key(strategy_name: str, par_tuple: tuple):
+    """Return the parameters of a parameter set the indicators use.
+
+    Parameters:
+    ----------
+    strategy_name: string
+        Give the class name of the strategy.
+    par_tuple: tuple
+        Give the parameter set of the strategy.
+
+    Returns:
+    ----------
+    key: tuple
+        The parameter set without the parameters of RULE_PARAMETERS,
+        parameter sets with the same key share all their indicators.
+
+    Raises:
+    ----------
+    KeyError
+        If the strategy has no graph description.
+    """
+
+    rules = RULE_PARAMETERS[strategy_name]
+    return tuple(par for i, par in enumerate(par_tuple) if i not in rules)
+
+
+def warmup_bars(strategy_name: str, par_tuple: tuple):
+    """Return the number of bars a strategy needs before it can trade.
+
+    Description
+    ----------
+    The minimum periods of the nodes do not depend on the data, so they
+    are taken from a graph of a single bar. Prepending this many bars to
+    a window lets the strategy trade from the first bar of the window.
+
+    Parameters:
+    ----------
+    strategy_name: string
+        Give the class name of the strategy.
+    par_tuple: tuple
+        Give the parameter set of the strategy.
+
+    Returns:
+    ----------
+    bars: int
+        The number of bars before the first bar a signal can be given
+        on.
+
+    Raises:
+    ----------
+    KeyError
+        If the strategy has no graph description.
+    """
+
+    graph = IndicatorGraph(OrderedDict(
+        (name, np.ones(1)) for name in ('open', 'high', 'low', 'close',
+                                        'funding')))
+    nodes = strategy_nodes(graph, strategy_name, par_tuple)
+    minperiod = max(node.minperiod for node in nodes.values()) \
+        + STRATEGY_LOOKBACKS.get(strategy_name, 0)
+
+    return max(minperiod, STRATEGY_MINPERIODS.get(strategy_name, 1)) - 1
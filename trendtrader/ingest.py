@@ -0,0 +1,606 @@
+"""Implements the ingestion of candles and funding from an exchange.
+
+Description
+----------
+Brings the CSV files in ./data up to date by fetching the candles and
+funding rates of many pairs and timeframes concurrently. Requests go
+through a pool of persistent HTTP connections and a client side rate
+limit, history is paged through in bulk and responses telling the
+client to slow down are retried after the time the exchange asks for.
+Only closed candles newer than the last one stored are appended to the
+files.
+
+The exchange is expected to answer
+
+    GET /candles?symbol=BTC-USD&timeframe=1D&start=<ms>&end=<ms>&limit=<n>
+
+with a JSON list of [time in ms, open, high, low, close] and
+
+    GET /funding?symbol=BTC-USD&timeframe=1D&start=<ms>&end=<ms>&limit=<n>
+
+with a JSON list of [time in ms, funding], both in ascending order of
+time. MockExchange serves the same API locally from DataFrames, so the
+ingestion can be run end to end without network access.
+
+Classes
+----------
+ConnectionPool:
+    A pool of persistent HTTP/1.1 connections to one host.
+RateLimiter:
+    Spaces requests to stay below a number of requests per second.
+ExchangeClient:
+    Fetches candles and funding, paging through the history.
+MockExchange: Inherits from ThreadingHTTPServer
+    Serves the exchange API locally from DataFrames.
+
+Functions
+----------
+data_path: string
+    Returns the CSV file of a pair and a timeframe.
+last_stored_time: datetime
+    Returns the time of the last candle of a CSV file.
+update_store: int
+    Appends the new candles of a pair and a timeframe to its CSV file.
+ingest: dict
+    Updates the CSV files of many pairs and timeframes concurrently.
+run_ingestion: dict
+    Runs ingest in a new event loop.
+
+Exceptions
+----------
+ExchangeError: Inherits from Exception
+    Raised if the exchange answers with an error.
+"""
+
+import asyncio
+import datetime as dt
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import json
+import os
+import threading
+import time
+from urllib.parse import urlencode, urlsplit, parse_qs
+
+import numpy as np
+import pandas as pd
+
+
+TIMEFRAME_MS = {'1D': 86400000, '8H': 28800000}
+
+DEFAULT_START = dt.datetime(2014,12,1,0,0,0,0,
+                            dt.timezone(dt.timedelta(hours=0)))
+
+CSV_HEADER = 'time,open,high,low,close,funding\n'
+
+
+class ExchangeError(Exception):
+    """Raised if the exchange answers with an error."""
+
+
+def data_path(pair: str, timeframe: str, data_dir: str = './data'):
+    """Return the CSV file of a pair and a timeframe."""
+
+    return os.path.join(data_dir, 'COINBASE_' + pair.replace('-', '')
+                        + '_' + timeframe + '.csv')
+
+
+def _to_ms(time_: dt.datetime):
+    return int(time_.timestamp() * 1000)
+
+
+def _from_ms(ms: int):
+    return dt.datetime.fromtimestamp(ms / 1000, dt.timezone.utc)
+
+
+class ConnectionPool:
+    """A pool of persistent HTTP/1.1 connections to one host.
+
+    Description
+    ----------
+    Opens up to size connections and keeps them open between
+    requests. Responses have to carry a Content-Length.
+
+    Parameters:
+    ----------
+    host: string
+        Give the host of the exchange.
+    port: int
+        Give the port of the exchange.
+    size: int
+        Give the maximum number of open connections.
+    timeout: float
+        Give the seconds to wait for a response, see request.
+    """
+
+    def __init__(self, host: str, port: int, size: int = 8,
+                 timeout: float = 30.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._idle = list()
+        self._slots = asyncio.Semaphore(size)
+        self.opened = 0
+
+    async def _connect(self, fresh=False):
+        if self._idle and not fresh:
+            return self._idle.pop()
+        self.opened += 1
+        return await asyncio.open_connection(self.host, self.port)
+
+    async def _exchange(self, reader, writer, path: str):
+        writer.write(('GET ' + path + ' HTTP/1.1\r\n'
+                      'Host: ' + self.host + '\r\n'
+                      'Connection: keep-alive\r\n\r\n').encode())
+        await writer.drain()
+
+        status = int((await reader.readline()).split()[1])
+        headers = dict()
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get('content-length',
+                                                        0)))
+
+        return status, headers, body
+
+    async def request(self, path: str):
+        """Send a GET request and return status, headers and body.
+
+        Description
+        ----------
+        A connection that is closed by the server, gives no response
+        within timeout seconds or answers with a malformed response is
+        closed and the request is sent once more on a new connection.
+        A connection is never put back into the pool after an error.
+
+        Parameters:
+        ----------
+        path: string
+            Give the path and query of the request.
+
+        Returns:
+        ----------
+        response: tuple
+            The status, the headers with lower case names and the body.
+
+        Raises:
+        ----------
+        ConnectionError, asyncio.IncompleteReadError
+            If the new connection is closed as well.
+        asyncio.TimeoutError
+            If the new connection gives no response in time either.
+        IndexError, ValueError
+            If the response on the new connection is malformed too.
+        """
+
+        async with self._slots:
+            for attempt in range(2):
+                reader, writer = await self._connect(fresh=bool(attempt))
+                try:
+                    response = await asyncio.wait_for(
+                        self._exchange(reader, writer, path), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError,
+                        asyncio.TimeoutError, IndexError, ValueError):
+                    # The server closed an idle connection, stalled or
+                    # answered garbage, retry once on a new one
+                    writer.close()
+                    if attempt:
+                        raise
+                    continue
+                except BaseException:
+                    # E.g. a cancelled task, the state of the connection
+                    # is unknown
+                    writer.close()
+                    raise
+
+                if response[1].get('connection', '').lower() == 'close':
+                    writer.close()
+                else:
+                    self._idle.append((reader, writer))
+                return response
+
+    async def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle = list()
+
+
+class RateLimiter:
+    """Space requests to stay below a number of requests per second."""
+
+    def __init__(self, rate: float = 10.0):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class ExchangeClient:
+    """Fetch candles and funding, paging through the history.
+
+    Parameters:
+    ----------
+    pool: ConnectionPool
+        Give the connections to the exchange.
+    limiter: RateLimiter
+        Give the rate limit shared by all requests.
+    page_size: int
+        Give the number of rows to request at once.
+    max_retries: int
+        Give the number of times a request is retried after the
+        exchange asked to slow down.
+    """
+
+    def __init__(self, pool: ConnectionPool, limiter: RateLimiter = None,
+                 page_size: int = 1000, max_retries: int = 5):
+        self.pool = pool
+        self.limiter = limiter or RateLimiter()
+        self.page_size = page_size
+        self.max_retries = max_retries
+        self.requests = 0
+        self.throttled = 0
+
+    async def get(self, endpoint: str, params: dict):
+        """Request an endpoint and return the decoded JSON.
+
+        Raises:
+        ----------
+        ExchangeError
+            If the exchange answers with an error or keeps asking to
+            slow down.
+        """
+
+        path = endpoint + '?' + urlencode(params)
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.wait()
+            status, headers, body = await self.pool.request(path)
+            self.requests += 1
+            if status == 200:
+                return json.loads(body)
+            if status != 429 or attempt == self.max_retries:
+                raise ExchangeError('{0} {1}: {2}'.format(
+                    status, path, body.decode(errors='replace')))
+
+            self.throttled += 1
+            await asyncio.sleep(float(headers.get('retry-after',
+                                                  2 ** attempt)))
+
+    async def fetch(self, endpoint: str, symbol: str, timeframe: str,
+                    start: dt.datetime, end: dt.datetime):
+        """Fetch all rows of an endpoint between two times.
+
+        Parameters:
+        ----------
+        endpoint: string
+            Give the endpoint, '/candles' or '/funding'.
+        symbol: string
+            Give the currency pair.
+        timeframe: string
+            Give the time frame of the chart.
+        start: datetime.datetime
+            Give the time of the first row, inclusive.
+        end: datetime.datetime
+            Give the time of the last row, inclusive.
+
+        Returns:
+        ----------
+        rows: list
+            The rows in ascending order of time.
+
+        Raises:
+        ----------
+        ExchangeError
+            If the exchange answers with an error.
+        """
+
+        rows = list()
+        start_ms, end_ms = _to_ms(start), _to_ms(end)
+        while start_ms <= end_ms:
+            page = await self.get(endpoint, {'symbol': symbol,
+                                             'timeframe': timeframe,
+                                             'start': start_ms,
+                                             'end': end_ms,
+                                             'limit': self.page_size})
+            if not page:
+                break
+            # The exchange may cut pages shorter than requested, so page
+            # on until the end is reached
+            rows.extend(page)
+            start_ms = page[-1][0] + 1
+
+        return rows
+
+
+def last_stored_time(path: str):
+    """Return the time of the last candle of a CSV file, None if empty."""
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        lines = f.read().decode().strip().splitlines()
+
+    if not lines or lines[-1].startswith('time'):
+        return None
+
+    return pd.Timestamp(lines[-1].split(',')[0]).to_pydatetime()
+
+
+def _ends_with_newline(path: str):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def _format_rows(candles: list, funding: list):
+    funding = pd.Series(dict((row[0], row[1]) for row in funding),
+                        dtype=float)
+    frame = pd.DataFrame(candles, columns=('ms', 'open', 'high', 'low',
+                                           'close'))
+    # Carry the last known funding rate over candles without one
+    frame['funding'] = funding.reindex(frame['ms']).ffill().values
+
+    lines = list()
+    for row in frame.itertuples(index=False):
+        lines.append(','.join((
+            _from_ms(row.ms).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            repr(row.open), repr(row.high), repr(row.low), repr(row.close),
+            '' if np.isnan(row.funding) else repr(row.funding))) + '\n')
+
+    return ''.join(lines)
+
+
+async def update_store(client: ExchangeClient, pair: str, timeframe: str,
+                       data_dir: str = './data',
+                       start_date: dt.datetime = DEFAULT_START,
+                       now: dt.datetime = None):
+    """Append the new candles of a pair and a timeframe to its CSV file.
+
+    Parameters:
+    ----------
+    client: ExchangeClient
+        Give the client of the exchange.
+    pair: string
+        Give the currency pair.
+    timeframe: string
+        Give the time frame of the chart.
+    data_dir: string
+        Give the directory of the CSV files.
+    start_date: datetime.datetime
+        Give the date to start from if the file does not exist yet.
+    now: datetime.datetime
+        Give the current time, only candles closed by then are stored.
+
+    Returns:
+    ----------
+    appended: int
+        The number of candles appended to the file.
+
+    Raises:
+    ----------
+    ExchangeError
+        If the exchange answers with an error.
+    """
+
+    now = now or dt.datetime.now(dt.timezone.utc)
+    step = dt.timedelta(milliseconds=TIMEFRAME_MS[timeframe])
+    path = data_path(pair, timeframe, data_dir)
+
+    last = last_stored_time(path)
+    start = start_date if last is None else last + step
+    # The candle starting at end closes at now
+    end = now - step
+    if start > end:
+        return 0
+
+    candles, funding = await asyncio.gather(
+        client.fetch('/candles', pair, timeframe, start, end),
+        client.fetch('/funding', pair, timeframe, start, end))
+    if not candles:
+        return 0
+
+    exists = os.path.exists(path)
+    with open(path, 'a+') as f:
+        if not exists:
+            f.write(CSV_HEADER)
+        elif f.tell() and not _ends_with_newline(path):
+            f.write('\n')
+        f.write(_format_rows(candles, funding))
+
+    return len(candles)
+
+
+async def ingest(host: str, port: int, pairs: tuple = ('BTC-USD', 'ETH-USD'),
+                 timeframes: tuple = ('1D', '8H'), data_dir: str = './data',
+                 connections: int = 8, rate: float = 10.0,
+                 page_size: int = 1000, now: dt.datetime = None):
+    """Update the CSV files of many pairs and timeframes concurrently.
+
+    Parameters:
+    ----------
+    host: string
+        Give the host of the exchange.
+    port: int
+        Give the port of the exchange.
+    pairs: tuple
+        Give the currency pairs to update.
+    timeframes: tuple
+        Give the time frames to update.
+    data_dir: string
+        Give the directory of the CSV files.
+    connections: int
+        Give the maximum number of open connections.
+    rate: float
+        Give the maximum number of requests per second.
+    page_size: int
+        Give the number of rows to request at once.
+    now: datetime.datetime
+        Give the current time, only candles closed by then are stored.
+
+    Returns:
+    ----------
+    appended: dict
+        The number of candles appended per pair and timeframe.
+
+    Raises:
+    ----------
+    ExchangeError
+        If the exchange answers with an error.
+    """
+
+    pool = ConnectionPool(host, port, connections)
+    client = ExchangeClient(pool, RateLimiter(rate), page_size)
+    keys = [(pair, timeframe) for pair in pairs for timeframe in timeframes]
+    try:
+        counts = await asyncio.gather(*(
+            update_store(client, pair, timeframe, data_dir, now=now)
+            for pair, timeframe in keys))
+    finally:
+        await pool.close()
+
+    print('Appended {0} candles with {1} requests over {2} connections, '
+          'throttled {3} times'.format(sum(counts), client.requests,
+                                       pool.opened, client.throttled))
+
+    return dict(zip(keys, counts))
+
+
+def run_ingestion(host: str, port: int, **kwargs):
+    """Run ingest in a new event loop, see ingest for the arguments."""
+
+    return asyncio.run(ingest(host, port, **kwargs))
+
+
+class _ExchangeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload, headers: dict = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or dict()).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        exchange = self.server
+        url = urlsplit(self.path)
+        query = dict((key, values[0])
+                     for key, values in parse_qs(url.query).items())
+
+        retry_after = exchange.throttle()
+        if retry_after:
+            self._send(429, {'error': 'rate limit'},
+                       {'Retry-After': '{0:.3f}'.format(retry_after)})
+            return
+
+        frame = exchange.frames.get((query.get('symbol'),
+                                     query.get('timeframe')))
+        if frame is None or url.path not in ('/candles', '/funding'):
+            self._send(404, {'error': 'unknown market'})
+            return
+
+        limit = min(int(query.get('limit', exchange.max_page)),
+                    exchange.max_page)
+        ms = frame.index.values
+        first = np.searchsorted(ms, int(query['start']), side='left')
+        last = np.searchsorted(ms, int(query['end']), side='right')
+        rows = frame.iloc[first:min(last, first + limit)]
+
+        columns = ['open', 'high', 'low', 'close'] \
+            if url.path == '/candles' else ['funding']
+        self._send(200, [[int(t)] + values
+                         for t, values in zip(rows.index,
+                                              rows[columns].values.tolist())])
+
+
+class MockExchange(ThreadingHTTPServer):
+    """Serve the exchange API locally from DataFrames.
+
+    Description
+    ----------
+    A stand-in for the exchange to run the ingestion against. Pages
+    are cut to max_page rows and more than max_requests requests per
+    second are answered with 429 and a Retry-After header.
+
+    Parameters:
+    ----------
+    frames: dict
+        Give DataFrames with the columns open, high, low, close and
+        funding indexed by time, keyed by pair and timeframe.
+    max_page: int
+        Give the maximum number of rows of a page.
+    max_requests: int
+        Give the maximum number of requests per second.
+    address: tuple
+        Give the host and port to listen on, any free port if 0.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, frames: dict, max_page: int = 300,
+                 max_requests: int = 50,
+                 address: tuple = ('127.0.0.1', 0)):
+        super().__init__(address, _ExchangeHandler)
+        self.frames = dict()
+        for key, df in frames.items():
+            frame = df.copy()
+            frame.index = [_to_ms(t) for t in
+                           pd.to_datetime(df.index, utc=True)]
+            self.frames[key] = frame
+        self.max_page = max_page
+        self.max_requests = max_requests
+        self.requests = 0
+        self._window = list()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_data(cls, data_dir: str = './data', **kwargs):
+        """Serve the CSV files of a data directory."""
+
+        frames = dict()
+        for pair in ('BTC-USD', 'ETH-USD'):
+            for timeframe in TIMEFRAME_MS:
+                path = data_path(pair, timeframe, data_dir)
+                if os.path.exists(path):
+                    frames[(pair, timeframe)] = pd.read_csv(
+                        path, index_col='time', parse_dates=True)
+
+        return cls(frames, **kwargs)
+
+    def throttle(self):
+        """Count a request, return the seconds to wait if over the limit."""
+
+        with self._lock:
+            self.requests += 1
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.max_requests:
+                return 1.0 - (now - self._window[0])
+            self._window.append(now)
+
+        return 0.0
+
+    def start(self):
+        """Serve in a background thread and return the bound address."""
+
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+        return self.server_address
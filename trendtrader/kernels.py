@@ -0,0 +1,963 @@
+"""Implements compiled kernels for the position loop of the strategies.
+
+Description
+----------
+The indicators of the strategies are precomputed as arrays by
+indicator_graph, what remains sequential is the state machine in the
+next methods of strategies.py that goes flat to long or short on an
+entry signal and back to flat on an exit signal, together with the
+sizing and the accounting of the broker. This module turns the rules of
+every strategy into arrays of entry and exit signals and runs the state
+machine as a kernel over them, compiled to machine code with numba
+when it is installed and as plain Python otherwise. Both run the same
+source and give the same results.
+
+The kernel follows the BackBroker of backtrader as configured in
+optimizer: orders are sized with the cash at the close of the signal,
+checked against the cash at the created price, filled at the next
+open, charged the percentage commission and refused if the cash does
+not cover them.
+
+The position only changes on the bar after a signal, and while flat
+only entries matter, while in a position only exits. The event loop
+therefore does not visit every bar: it takes the sorted bars of the
+entry and exit signals, searches the next one that matters for the
+current state and jumps there, so its cost grows with the number of
+trades instead of the number of bars. Between two changes of the
+position the account value is the cash plus the position at the close,
+it is filled in segment by segment afterwards. Both loops give the same
+results. The position loop keeps its state in an array, so that a run
+can be continued over appended bars, see incremental.
+
+Many parameters only enter the decision rules, the levels of the STC
+crosses and the thresholds on the volatility and on the trend, see
+indicator_graph.RULE_PARAMETERS. sweep groups the parameter sets that
+share all other parameters and evaluates them in two stages: the
+indicators once per group and the rules of all its parameter sets at
+once as one matrix of signals, without caching a cross of every level
+in the graph.
+
+Classes
+----------
+    Implements no classes.
+
+Functions
+----------
+strategy_signals: tuple
+    Computes the entry and exit signals of a strategy on a graph.
+rule_signals: tuple
+    Computes the signals of parameter sets that share their
+    indicators at once.
+position_loop: tuple
+    Runs the position loop over precomputed signals.
+advance_loop: tuple
+    Continues the position loop from a saved state.
+event_loop: tuple
+    Runs the position loop from signal to signal.
+fill_values:
+    Computes the account value on every bar from the changes of the
+    position.
+run_strategy: dict
+    Runs a strategy for one parameter set and returns its account
+    values and trades.
+run_rules: list
+    Runs parameter sets that share their indicators from one
+    indicator stage.
+rule_chunks: list
+    Returns the parameter sets that are run together from one stage.
+run_metrics: dict
+    Computes the metrics of run_sweep from a run.
+sweep: DataFrame
+    Runs a strategy for many parameter sets like optimizer.run_sweep.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import indicator_graph
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+JIT_AVAILABLE = numba is not None
+
+# Signals of a rule stage held in memory at once, in parameter sets
+# times bars
+RULE_CHUNK = 20000000
+
+# Length of the state advance_loop continues from
+LOOP_STATE = 6
+
+
+def _jit(func):
+    if numba is None:
+        return func
+    return numba.njit(cache=True, nogil=True)(func)
+
+
+def _previous(array):
+    return np.concatenate(([np.nan], array[:-1]))
+
+
+def _smac_signals(graph, nodes, par_tuple):
+    regime = nodes['regime'].array
+    last = _previous(regime)
+    return (regime > 0) & (last <= 0), (regime <= 0) & (last > 0), 1
+
+
+def _stc_signals(graph, nodes, par_tuple):
+    return nodes['crossup'].array > 0, nodes['crossdown'].array > 0, 1
+
+
+def _aroon_stc_signals(graph, nodes, par_tuple):
+    entry = (nodes['crossup'].array > 0) & (nodes['aroonup'].array > 50) \
+        & (nodes['aroondown'].array < 50)
+    return entry, nodes['crossdown'].array > 0, 1
+
+
+def _stc_sma_signals(graph, nodes, par_tuple):
+    close = graph.base('close').array
+    sma = nodes['sma'].array
+    entry = (nodes['crossdown'].array > 0) & (close < sma)
+    exit_ = (nodes['crossup'].array > 0) | (close > sma)
+    return entry, exit_, -1
+
+
+def _stc_vol_signals(graph, nodes, par_tuple):
+    vol = nodes['vol'].array
+    entry = (nodes['crossup'].array > 0) & (vol < par_tuple[8])
+    exit_ = (nodes['crossdown'].array > 0) | (vol > par_tuple[9])
+    return entry, exit_, 1
+
+
+def _drsidma_rules(nodes, par_tuple):
+    smooth_avg = nodes['smoothAvg'].array
+    smooth_mom = nodes['smoothMom'].array
+    bullish = (smooth_avg >= par_tuple[6]) & (smooth_mom > par_tuple[6])
+    bearish = (smooth_avg < -par_tuple[7]) & (smooth_mom < -par_tuple[7])
+    return bullish, bearish
+
+
+def _drsidma_long_signals(graph, nodes, par_tuple):
+    bullish, bearish = _drsidma_rules(nodes, par_tuple)
+    return bullish, bearish, 1
+
+
+def _drsidma_short_signals(graph, nodes, par_tuple):
+    # Shorts are only opened while funding is negative, but closed
+    # whenever the trend turns bullish
+    bullish, bearish = _drsidma_rules(nodes, par_tuple)
+    return bearish & (graph.base('funding').array < 0), bullish, -1
+
+
+_STRATEGY_SIGNALS = {'SMAC': _smac_signals,
+                     'Stc': _stc_signals,
+                     'AroonStc': _aroon_stc_signals,
+                     'StcSmaShort': _stc_sma_signals,
+                     'StcVol': _stc_vol_signals,
+                     'DRSIDMALong': _drsidma_long_signals,
+                     'DRSIDMAShort': _drsidma_short_signals}
+
+
+def strategy_signals(graph, strategy_name: str, par_tuple: tuple):
+    """Compute the entry and exit signals of a strategy on a graph.
+
+    Parameters:
+    ----------
+    graph: indicator_graph.IndicatorGraph
+        Give the indicator graph of the feed.
+    strategy_name: string
+        Give the class name of the strategy in strategies.py.
+    par_tuple: tuple
+        Give the parameter set of the strategy.
+
+    Returns:
+    ----------
+    entry: ndarray
+        True where the strategy opens a position when flat.
+    exit: ndarray
+        True where the strategy closes an open position.
+    direction: int
+        1 for long, -1 for short positions.
+    start: int
+        The first bar the strategy trades on, its minimum period - 1.
+
+    Raises:
+    ----------
+    KeyError
+        If the strategy has no description of its signals.
+    """
+
+    nodes = indicator_graph.strategy_nodes(graph, strategy_name, par_tuple)
+    entry, exit_, direction = _STRATEGY_SIGNALS[strategy_name](
+        graph, nodes, par_tuple)
+
+    minperiod = max([node.minperiod for node in nodes.values()]
+                    + [indicator_graph.STRATEGY_MINPERIODS.get(strategy_name,
+                                                               1)])
+
+    return entry, exit_, direction, minperiod - 1
+
+
+def _batch_cross(graph, node, levels, up):
+    # IndicatorGraph.crossup and crossdown for many levels at once,
+    # every distinct level is computed once
+    levels, rows = np.unique(np.asarray(levels, dtype=float),
+                             return_inverse=True)
+    cross = np.zeros((len(levels), graph.size), dtype=bool)
+    if graph.size < node.minperiod + 1:
+        return cross[rows]
+
+    levels = levels[:, None]
+    diff = node.array - levels
+    nzd = np.where(diff != 0, diff, np.nan)
+    nzd[:, node.minperiod - 1] = diff[:, node.minperiod - 1]
+    nzd[:, :node.minperiod - 1] = 0.0
+    idx = np.where(~np.isnan(nzd), np.arange(graph.size), 0)
+    nzd = np.take_along_axis(nzd, np.maximum.accumulate(idx, axis=1), axis=1)
+    if up:
+        crossed = (nzd[:, :-1] < 0) & (node.array[1:] > levels)
+    else:
+        crossed = (nzd[:, :-1] > 0) & (node.array[1:] < levels)
+    cross[:, node.minperiod:] = crossed[:, node.minperiod - 1:]
+
+    return cross[rows]
+
+
+def _stc_crosses(graph, nodes, rules):
+    return (_batch_cross(graph, nodes['stc'], rules[:, 0], True),
+            _batch_cross(graph, nodes['stc'], rules[:, 1], False))
+
+
+def _stc_rules(graph, nodes, rules):
+    crossup, crossdown = _stc_crosses(graph, nodes, rules)
+    return crossup, crossdown, 1
+
+
+def _aroon_stc_rules(graph, nodes, rules):
+    crossup, crossdown = _stc_crosses(graph, nodes, rules)
+    entry = crossup & (nodes['aroonup'].array > 50) \
+        & (nodes['aroondown'].array < 50)
+    return entry, crossdown, 1
+
+
+def _stc_sma_rules(graph, nodes, rules):
+    crossup, crossdown = _stc_crosses(graph, nodes, rules)
+    close = graph.base('close').array
+    sma = nodes['sma'].array
+    return crossdown & (close < sma), crossup | (close > sma), -1
+
+
+def _stc_vol_rules(graph, nodes, rules):
+    crossup, crossdown = _stc_crosses(graph, nodes, rules)
+    vol = nodes['vol'].array
+    entry = crossup & (vol < rules[:, 2, None])
+    exit_ = crossdown | (vol > rules[:, 3, None])
+    return entry, exit_, 1
+
+
+def _drsidma_batch_rules(nodes, rules):
+    smooth_avg = nodes['smoothAvg'].array
+    smooth_mom = nodes['smoothMom'].array
+    upper = rules[:, 0, None]
+    lower = rules[:, 1, None]
+    bullish = (smooth_avg >= upper) & (smooth_mom > upper)
+    bearish = (smooth_avg < -lower) & (smooth_mom < -lower)
+    return bullish, bearish
+
+
+def _drsidma_long_rules(graph, nodes, rules):
+    bullish, bearish = _drsidma_batch_rules(nodes, rules)
+    return bullish, bearish, 1
+
+
+def _drsidma_short_rules(graph, nodes, rules):
+    bullish, bearish = _drsidma_batch_rules(nodes, rules)
+    return bearish & (graph.base('funding').array < 0), bullish, -1
+
+
+_STRATEGY_RULES = {'Stc': _stc_rules,
+                   'AroonStc': _aroon_stc_rules,
+                   'StcSmaShort': _stc_sma_rules,
+                   'StcVol': _stc_vol_rules,
+                   'DRSIDMALong': _drsidma_long_rules,
+                   'DRSIDMAShort': _drsidma_short_rules}
+
+
+def rule_signals(graph, strategy_name: str, par_tuples: list):
+    """Compute the signals of parameter sets that share their indicators.
+
+    Parameters:
+    ----------
+    graph: indicator_graph.IndicatorGraph
+        Give the indicator graph of the feed.
+    strategy_name: string
+        Give the class name of the strategy in strategies.py.
+    par_tuples: list
+        Give parameter sets that only differ in the parameters of
+        indicator_graph.RULE_PARAMETERS.
+
+    Returns:
+    ----------
+    entry, exit: ndarray
+        The entry and exit signals of every parameter set, one row per
+        parameter set, like strategy_signals.
+    direction: int
+        1 for long, -1 for short positions.
+    start: int
+        The first bar the strategy trades on.
+
+    Raises:
+    ----------
+    KeyError
+        If the strategy has no description of its rules.
+    ValueError
+        If the parameter sets do not share their indicators.
+    """
+
+    par_tuples = list(par_tuples)
+    key = indicator_graph.indicator_key(strategy_name, par_tuples[0])
+    if any(indicator_graph.indicator_key(strategy_name, par_tuple) != key
+           for par_tuple in par_tuples):
+        raise ValueError('Parameter sets with different indicators')
+
+    # The indicators are computed once, the rules for all thresholds
+    nodes = indicator_graph.strategy_nodes(graph, strategy_name,
+                                           par_tuples[0], rules=False)
+    rules = np.array([[par_tuple[i] for i in
+                       indicator_graph.RULE_PARAMETERS[strategy_name]]
+                      for par_tuple in par_tuples], dtype=float)
+    entry, exit_, direction = _STRATEGY_RULES[strategy_name](graph, nodes,
+                                                             rules)
+
+    minperiods = [node.minperiod for node in nodes.values()] \
+        + [indicator_graph.STRATEGY_MINPERIODS.get(strategy_name, 1)]
+    if 'stc' in nodes:
+        # The crosses of the levels start one bar after the STC
+        minperiods.append(nodes['stc'].minperiod + 1)
+
+    return entry, exit_, direction, max(minperiods) - 1
+
+
+@_jit
+def position_loop(open_, close, entry, exit_, direction, start, cash,
+                  commission, values, trade_pnl):
+    """Run the position loop over precomputed signals.
+
+    Parameters:
+    ----------
+    open_, close: ndarray
+        Give the open and close prices.
+    entry, exit_: ndarray
+        Give the entry and exit signals as booleans.
+    direction: int
+        Give 1 to open long and -1 to open short positions.
+    start: int
+        Give the first bar to trade on.
+    cash: float
+        Give the amount of starting capital.
+    commission: float
+        Give the commission as a fraction of the traded value.
+    values: ndarray
+        Receives the value of the account on every bar.
+    trade_pnl: ndarray
+        Receives the net profit of every closed trade, needs room for
+        one trade every two bars.
+
+    Returns:
+    ----------
+    cash: float
+        The cash at the end.
+    position: float
+        The size of the position still open at the end.
+    trades: int
+        The number of closed trades.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    state = np.zeros(LOOP_STATE)
+    state[0] = cash
+    trades, _ = advance_loop(open_, close, entry, exit_, direction, start,
+                             state, commission, values, trade_pnl)
+
+    return state[0], state[1], trades
+
+
+@_jit
+def advance_loop(open_, close, entry, exit_, direction, start, state,
+                 commission, values, trade_pnl):
+    """Continue the position loop over the signals of further bars.
+
+    Parameters:
+    ----------
+    open_, close: ndarray
+        Give the open and close prices of the bars.
+    entry, exit_: ndarray
+        Give the entry and exit signals of the bars as booleans.
+    direction: int
+        Give 1 to open long and -1 to open short positions.
+    start: int
+        Give the first of the bars to trade on, 0 if the strategy
+        traded before them.
+    state: ndarray
+        Give the cash, the position, its price and opening commission
+        and the size and created price of the pending order at the end
+        of the bars before, receives them at the end of the bars. Zeros
+        and the starting capital as cash for a new run.
+    commission: float
+        Give the commission as a fraction of the traded value.
+    values: ndarray
+        Receives the value of the account on every bar.
+    trade_pnl: ndarray
+        Receives the net profit of every closed trade, needs room for
+        one trade every two bars.
+
+    Returns:
+    ----------
+    trades: int
+        The number of closed trades.
+    opened: int
+        The number of opened trades.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    cash = state[0]
+    position = state[1]
+    price = state[2]
+    open_comm = state[3]
+    order = state[4]
+    created = state[5]
+    trades = 0
+    opened = 0
+
+    for t in range(len(close)):
+        if order != 0.0:
+            # Check the order against the cash at the created price
+            check = cash
+            if position == 0.0:
+                check -= order * created
+                check -= abs(order) * commission * created
+            else:
+                check += -order * created
+                check -= abs(order) * commission * created
+
+            if check >= 0.0:
+                fill = open_[t]
+                comm = abs(order) * commission * fill
+                if position == 0.0:
+                    # Refused if the cash does not cover it at the open
+                    rest = cash - order * fill - comm
+                    if rest >= 0.0:
+                        cash = rest
+                        position = order
+                        price = fill
+                        open_comm = comm
+                        opened += 1
+                else:
+                    pnl = position * (fill - price)
+                    cash += position * price + pnl
+                    cash -= comm
+                    trade_pnl[trades] = pnl - (0.0 + open_comm + comm)
+                    trades += 1
+                    position = 0.0
+                    price = 0.0
+            order = 0.0
+
+        if t >= start:
+            if position == 0.0:
+                if entry[t]:
+                    # backtrader does not place orders of size zero
+                    size = math.floor(cash / close[t])
+                    if size > 0:
+                        order = direction * size
+                        created = close[t]
+            elif exit_[t]:
+                order = -position
+                created = close[t]
+
+        if position > 0.0:
+            unrealized = position * (close[t] - price)
+            values[t] = cash + ((0.0 + (position * close[t] - unrealized))
+                                + unrealized)
+        else:
+            values[t] = cash + (0.0 + position * close[t])
+
+    state[0] = cash
+    state[1] = position
+    state[2] = price
+    state[3] = open_comm
+    state[4] = order
+    state[5] = created
+
+    return trades, opened
+
+
+@_jit
+def event_loop(open_, close, entries, exits, direction, cash, commission,
+               changes, states, trade_pnl):
+    """Run the position loop from signal to signal.
+
+    Parameters:
+    ----------
+    open_, close: ndarray
+        Give the open and close prices.
+    entries, exits: ndarray
+        Give the sorted bars of the entry and exit signals from the
+        first bar to trade on.
+    direction: int
+        Give 1 to open long and -1 to open short positions.
+    cash: float
+        Give the amount of starting capital.
+    commission: float
+        Give the commission as a fraction of the traded value.
+    changes: ndarray
+        Receives the bars on which the position changed, needs room
+        for len(entries) + len(exits) changes.
+    states: ndarray
+        Receives the cash, the position and its price from every
+        change on, one row per change.
+    trade_pnl: ndarray
+        Receives the net profit of every closed trade, needs room for
+        len(exits) trades.
+
+    Returns:
+    ----------
+    cash: float
+        The cash at the end.
+    position: float
+        The size of the position still open at the end.
+    trades: int
+        The number of closed trades.
+    n_changes: int
+        The number of changes of the position.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    n_bars = len(close)
+    position = 0.0
+    price = 0.0
+    open_comm = 0.0
+    trades = 0
+    n_changes = 0
+    t = 0
+
+    while True:
+        # The next signal that matters in the current state
+        signals = entries if position == 0.0 else exits
+        i = np.searchsorted(signals, t)
+        if i == len(signals):
+            break
+        signal = signals[i]
+        t = signal + 1
+        if t >= n_bars:
+            # Orders of the last bar are never filled
+            break
+
+        created = close[signal]
+        if position == 0.0:
+            # backtrader does not place orders of size zero
+            size = math.floor(cash / created)
+            if size <= 0:
+                continue
+            order = direction * size
+        else:
+            order = -position
+
+        # Check the order against the cash at the created price
+        check = cash - order * created
+        check -= abs(order) * commission * created
+        if check < 0.0:
+            continue
+
+        fill = open_[t]
+        comm = abs(order) * commission * fill
+        if position == 0.0:
+            # Refused if the cash does not cover it at the open
+            opened = cash - order * fill - comm
+            if opened < 0.0:
+                continue
+            cash = opened
+            position = order
+            price = fill
+            open_comm = comm
+        else:
+            pnl = position * (fill - price)
+            cash += position * price + pnl
+            cash -= comm
+            trade_pnl[trades] = pnl - (0.0 + open_comm + comm)
+            trades += 1
+            position = 0.0
+            price = 0.0
+
+        changes[n_changes] = t
+        states[n_changes, 0] = cash
+        states[n_changes, 1] = position
+        states[n_changes, 2] = price
+        n_changes += 1
+
+    return cash, position, trades, n_changes
+
+
+@_jit
+def fill_values(close, cash, changes, states, values):
+    """Compute the account value on every bar from the position changes.
+
+    Parameters:
+    ----------
+    close: ndarray
+        Give the close prices.
+    cash: float
+        Give the amount of starting capital.
+    changes: ndarray
+        Give the bars on which the position changed, see event_loop.
+    states: ndarray
+        Give the cash, the position and its price from every change on.
+    values: ndarray
+        Receives the value of the account on every bar, computed like
+        position_loop does.
+
+    Returns:
+    ----------
+    Returns no value.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    # Cash, position and price are constant between two changes
+    position = 0.0
+    price = 0.0
+    first = 0
+    for k in range(len(changes) + 1):
+        last = changes[k] if k < len(changes) else len(close)
+        if position == 0.0:
+            values[first:last] = cash
+        elif position > 0.0:
+            for t in range(first, last):
+                unrealized = position * (close[t] - price)
+                values[t] = cash + ((0.0 + (position * close[t] - unrealized))
+                                    + unrealized)
+        else:
+            for t in range(first, last):
+                values[t] = cash + (0.0 + position * close[t])
+
+        if k < len(changes):
+            cash = states[k, 0]
+            position = states[k, 1]
+            price = states[k, 2]
+        first = last
+
+
+def _max_drawdown(values):
+    peak = np.maximum.accumulate(values)
+    return float(np.max(100.0 * (peak - values) / peak))
+
+
+def _sharpe(values, years, cash):
+    # Yearly returns as the SharpeRatio analyzer of backtrader computes
+    # them, each year starting from the value at the end of the last
+    last = np.flatnonzero(np.diff(years)).tolist() + [len(values) - 1]
+    returns = list()
+    start = cash
+    for i in last:
+        returns.append(values[i] / start - 1.0)
+        start = values[i]
+
+    rate = pow(1.0 + 0.01, 1.0 / 1) - 1.0
+    ret_free = [r - rate for r in returns]
+    ret_free_avg = math.fsum(ret_free) / len(ret_free)
+    retdev = math.sqrt(math.fsum([(r - ret_free_avg) ** 2 for r in ret_free])
+                       / len(ret_free))
+    try:
+        return ret_free_avg / retdev
+    except ZeroDivisionError:
+        return None
+
+
+def run_strategy(graph, strategy_name: str, par_tuple: tuple,
+                 cash: float = 10000, commission: float = 0.0007,
+                 jit: bool = True, events: bool = False):
+    """Run a strategy for one parameter set and return its metrics.
+
+    Parameters:
+    ----------
+    graph: indicator_graph.IndicatorGraph
+        Give the indicator graph of the feed.
+    strategy_name: string
+        Give the class name of the strategy in strategies.py.
+    par_tuple: tuple
+        Give the parameter set of the strategy.
+    cash: float
+        Give the amount of starting capital.
+    commission: float
+        Give the commission as a fraction of the traded value.
+    jit: bool
+        Indicate if the compiled kernel should be used if available,
+        the plain Python one is used otherwise.
+    events: bool
+        Indicate if the event loop should jump from signal to signal
+        instead of running the position loop over every bar.
+
+    Returns:
+    ----------
+    metrics: dict
+        The value of the account on every bar, the net profit of the
+        closed trades, whether a position is still open and the end
+        value.
+
+    Raises:
+    ----------
+    KeyError
+        If the strategy has no description of its signals.
+    """
+
+    entry, exit_, direction, start = strategy_signals(graph, strategy_name,
+                                                      par_tuple)
+
+    return _run_signals(graph, entry, exit_, direction, start, cash,
+                        commission, jit, events)
+
+
+def _run_signals(graph, entry, exit_, direction, start, cash, commission,
+                 jit, events):
+    open_ = graph.base('open').array
+    close = graph.base('close').array
+
+    if events:
+        entries = np.flatnonzero(entry[start:]) + start
+        exits = np.flatnonzero(exit_[start:]) + start
+        changes = np.empty(len(entries) + len(exits), dtype=np.int64)
+        states = np.empty((len(changes), 3))
+        trade_pnl = np.empty(len(exits))
+
+        compiled = jit or numba is None
+        loop = event_loop if compiled else event_loop.py_func
+        fill = fill_values if compiled else fill_values.py_func
+        _, position, trades, n_changes = loop(
+            open_, close, entries, exits, direction, float(cash),
+            commission, changes, states, trade_pnl)
+        values = np.empty(len(close))
+        fill(close, float(cash), changes[:n_changes], states[:n_changes],
+             values)
+    else:
+        values = np.empty(len(close))
+        trade_pnl = np.empty(len(close) // 2 + 1)
+
+        state = np.zeros(LOOP_STATE)
+        state[0] = cash
+        loop = advance_loop if jit or numba is None \
+            else advance_loop.py_func
+        trades, _ = loop(open_, close, entry, exit_, direction, start,
+                         state, commission, values, trade_pnl)
+        position = state[1]
+
+    return {'values': values, 'pnl': trade_pnl[:trades],
+            'open': position != 0.0, 'end': values[-1]}
+
+
+def run_rules(graph, strategy_name: str, par_tuples: list,
+              cash: float = 10000, commission: float = 0.0007,
+              jit: bool = True, events: bool = False):
+    """Run parameter sets that share their indicators from one stage.
+
+    Parameters:
+    ----------
+    graph: indicator_graph.IndicatorGraph
+        Give the indicator graph of the feed.
+    strategy_name: string
+        Give the class name of the strategy in strategies.py.
+    par_tuples: list
+        Give parameter sets that only differ in the parameters of
+        indicator_graph.RULE_PARAMETERS.
+    cash: float
+        Give the amount of starting capital.
+    commission: float
+        Give the commission as a fraction of the traded value.
+    jit: bool
+        Indicate if the compiled kernel should be used if available.
+    events: bool
+        Indicate if the event loop should be used, see run_strategy.
+
+    Returns:
+    ----------
+    runs: list
+        The run of every parameter set like run_strategy returns it.
+
+    Raises:
+    ----------
+    KeyError
+        If the strategy has no description of its rules.
+    ValueError
+        If the parameter sets do not share their indicators.
+    """
+
+    entry, exit_, direction, start = rule_signals(graph, strategy_name,
+                                                  par_tuples)
+
+    return [_run_signals(graph, entry[i], exit_[i], direction, start, cash,
+                         commission, jit, events)
+            for i in range(len(entry))]
+
+
+def rule_chunks(strategy_name: str, par_tuples: list, size: int,
+                batch: bool = True):
+    """Return the parameter sets that are run together from one stage.
+
+    Parameters:
+    ----------
+    strategy_name: string
+        Give the class name of the strategy in strategies.py.
+    par_tuples: list
+        Give the parameter sets to run the strategy with.
+    size: int
+        Give the number of bars of the feed.
+    batch: bool
+        Indicate if parameter sets that share their indicators should
+        be run together, every parameter set is run alone otherwise.
+
+    Returns:
+    ----------
+    chunks: list
+        The positions of the parameter sets of every chunk, parameter
+        sets of a chunk share their indicators and the signals of a
+        chunk hold at most RULE_CHUNK values.
+
+    Raises:
+    ----------
+    KeyError
+        If the strategy has no graph description.
+    """
+
+    if not batch:
+        return [[i] for i in range(len(par_tuples))]
+
+    groups = dict()
+    for i, par_tuple in enumerate(par_tuples):
+        groups.setdefault(indicator_graph.indicator_key(strategy_name,
+                                                        par_tuple),
+                          list()).append(i)
+
+    step = max(1, RULE_CHUNK // max(size, 1))
+    return [group[first:first + step] for group in groups.values()
+            for first in range(0, len(group), step)]
+
+
+def run_metrics(run: dict, years, cash: float = 10000):
+    """Compute the metrics of run_sweep from a run.
+
+    Parameters:
+    ----------
+    run: dict
+        Give a run as returned by run_strategy.
+    years: ndarray
+        Give the year of every bar.
+    cash: float
+        Give the amount of starting capital.
+
+    Returns:
+    ----------
+    metrics: dict
+        The number of trades, win rate, sharpe ratio, maximum draw down
+        and net profit as the analyzers of backtrader compute them.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    trades = len(run['pnl']) + int(run['open'])
+    sharpe = _sharpe(run['values'], years, cash)
+
+    return {'# trades': trades,
+            'win rate': (np.sum(run['pnl'] >= 0.0) / trades
+                         if trades else 0),
+            'sharpe': np.nan if sharpe is None else sharpe,
+            'max DD': _max_drawdown(run['values']),
+            'pnl': sum(run['pnl'].tolist(), 0.0)}
+
+
+def sweep(strategy_name: str, par_tuples: list, df, cash: float = 10000,
+          commission: float = 0.0007, jit: bool = True, events: bool = False,
+          progress=None, batch: bool = True):
+    """Run a strategy for many parameter sets like optimizer.run_sweep.
+
+    Parameters:
+    ----------
+    strategy_name: string
+        Give the class name of the strategy in strategies.py.
+    par_tuples: list
+        Give the parameter sets to run the strategy with.
+    df: DataFrame
+        Give the data to run the strategy on.
+    cash: float
+        Give the amount of starting capital.
+    commission: float
+        Give the commission as a fraction of the traded value.
+    jit: bool
+        Indicate if the compiled kernel should be used if available.
+    events: bool
+        Indicate if the event loop should be used, see run_strategy.
+    progress: telemetry.SweepTelemetry
+        Give the telemetry to count the finished runs in, if any.
+    batch: bool
+        Indicate if parameter sets that share their indicators should
+        be run together from one indicator stage, see run_rules.
+
+    Returns:
+    ----------
+    analysis: DataFrame
+        The number of trades, win rate, sharpe ratio, maximum draw down
+        and net profit of every parameter set, indexed by the
+        parameter sets, with the same columns as run_sweep.
+
+    Raises:
+    ----------
+    KeyError
+        If the strategy has no description of its signals.
+    """
+
+    graph = indicator_graph.feed_graph(df)
+    years = df.index.year.values
+
+    par_tuples = list(par_tuples)
+    rows = [None] * len(par_tuples)
+    batch = batch and bool(indicator_graph.RULE_PARAMETERS.get(strategy_name))
+    for chunk in rule_chunks(strategy_name, par_tuples, graph.size, batch):
+        start = time.perf_counter()
+        if batch:
+            runs = run_rules(graph, strategy_name,
+                             [par_tuples[i] for i in chunk], cash,
+                             commission, jit, events)
+        else:
+            runs = [run_strategy(graph, strategy_name, par_tuples[chunk[0]],
+                                 cash, commission, jit, events)]
+        for i, run in zip(chunk, runs):
+            rows[i] = run_metrics(run, years, cash)
+        if progress is not None:
+            progress.update(runs=len(chunk), worker=os.getpid(),
+                            busy=time.perf_counter() - start)
+
+    return pd.DataFrame(rows, columns=['# trades', 'win rate', 'sharpe',
+                                       'max DD', 'pnl'],
+                        index=pd.MultiIndex.from_tuples(par_tuples))
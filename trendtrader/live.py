@@ -0,0 +1,657 @@
+"""Implements a service emitting live signals of the tuned strategies.
+
+Description
+----------
+Runs the strategies with the parameters of parameters.py continuously
+on bars arriving from a feed and publishes a decision for every closed
+candle. Every configured (strategy, pair, timeframe) is a stream that
+keeps its own backtrader instance running in live mode, so indicators,
+positions and cash are carried from bar to bar instead of testing the
+whole history again for every new candle.
+
+Feeds are iterables of Bar. ReplayFeed stands in for an exchange by
+streaming the bundled CSV files at an accelerated rate. Decisions are
+published to a queue.Queue or as newline delimited JSON to the clients
+of a local TCP socket. The time from the arrival of a bar to the
+publication of its decision is recorded for every stream, and so are
+its trades, sharpe ratio and draw down in constant memory, see metrics.
+
+Given a directory for their state, the streams write a snapshot after
+every live bar and when they stop, see snapshot. It holds the last
+SNAPSHOT_BARS bars of the stream, the cash and position of its broker
+and its metrics. A restarted stream warms up its indicators on the kept
+bars without placing orders or counting them in its metrics, takes over
+cash, position and open trade of the snapshot and skips the bars of the
+feed up to the last one it has seen, so a restart does not run the
+whole history again. The orders of the last kept bar are placed anew,
+they were pending when the snapshot was written.
+
+Classes
+----------
+Bar: Inherits from namedtuple
+    Represents a closed candle of a pair and a timeframe.
+ReplayFeed:
+    Streams the bars of a bundled CSV file at an accelerated rate.
+QueuePublisher:
+    Publishes decisions to a queue.Queue.
+SocketPublisher:
+    Publishes decisions to the clients of a local TCP socket.
+QueueData: Inherits from DataBase
+    A live backtrader data feed reading bars from a queue.
+SignalMixin:
+    Reports the orders of a strategy as decisions of a stream.
+SignalService:
+    Runs the streams and dispatches the bars of the feeds to them.
+
+Functions
+----------
+configured_streams: list
+    Lists the streams of the strategies tuned in parameters.py.
+
+Notes
+----------
+In live mode backtrader calls the next methods of the indicators.
+BackwardDifferenceQuotient divides by the value of the current candle
+there, whereas its vectorized form used in backtests divides by the
+last value of the whole series, so the decisions of the DRSIDMA
+strategies can differ from a backtest on the same bars.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+from collections import namedtuple, deque
+import datetime as dt
+import json
+import os
+import queue
+import socket
+import threading
+import time
+
+import backtrader as bt
+import numpy as np
+
+import metrics
+import optimizer
+import parameters
+import scheduler
+import snapshot
+import strategies
+
+
+Bar = namedtuple('Bar', ('pair', 'timeframe', 'time', 'open', 'high', 'low',
+                         'close', 'funding'))
+
+TIMEFRAME_SECONDS = {'1D': 86400, '8H': 28800}
+
+# Number of latencies kept per stream for the percentiles
+LATENCY_WINDOW = 10000
+
+# Number of bars kept in the snapshot of a stream to warm up on
+SNAPSHOT_BARS = 1000
+
+# Label, strategy and name of the parameter getters in parameters.py
+LIVE_STRATEGIES = (('SMAC', strategies.SMAC, 'smac'),
+                   ('AROON_STC', strategies.AroonStc, 'aroonStc'),
+                   ('STC_SMA_Short', strategies.StcSmaShort, 'stcSmaShort'),
+                   ('STC_Vol', strategies.StcVol, 'stcVol'),
+                   ('DRSIDMALong', strategies.DRSIDMALong, 'drsidma'),
+                   ('DRSIDMAShort', strategies.DRSIDMAShort, 'drsidma'))
+
+
+class ReplayFeed:
+    """Stream the bars of a bundled CSV file at an accelerated rate.
+
+    Description
+    ----------
+    The first warmup bars are handed out at once as history to warm up
+    the indicators. Every following bar is handed out when it would
+    have closed, with the time between two bars divided by speed. Bars
+    up to resume, the last bar all streams restored from snapshots have
+    seen, are skipped at once, resume is set by SignalService.
+
+    Parameters:
+    ----------
+    pair: string
+        Give the currency pair of the bars.
+    timeframe: string
+        Give the time frame of the bars.
+    speed: float
+        Give the factor by which the replay is faster than real time.
+    warmup: int
+        Give the number of bars handed out at once as history.
+    start_date: datetime.datetime
+        Give the date where the data starts.
+    end_date: datetime.datetime
+        Give the date where the data ends, all data if None.
+    """
+
+    def __init__(self, pair: str = 'BTC-USD', timeframe: str = '1D',
+                 speed: float = 86400.0, warmup: int = 300,
+                 start_date: dt.datetime = dt.datetime(
+                     2014,12,1,0,0,0,0,dt.timezone(dt.timedelta(hours=0))),
+                 end_date: dt.datetime = None):
+        self.pair = pair
+        self.timeframe = timeframe
+        self.interval = TIMEFRAME_SECONDS[timeframe] / speed
+        self.warmup = warmup
+        self.start_date = start_date
+        self.end_date = end_date
+        self.resume = None
+
+    def __iter__(self):
+        """Yield tuples of a bar and whether it arrived live."""
+
+        end_date = self.end_date or dt.datetime.now(dt.timezone.utc)
+        df, _ = optimizer.read_data(self.pair, self.timeframe,
+                                    self.start_date, end_date, funding=False)
+
+        next_close = time.monotonic()
+        for i, row in enumerate(df.itertuples()):
+            if self.resume is not None and row.Index <= self.resume:
+                continue
+            live = i >= self.warmup
+            if live:
+                # Do not catch up on bars while the consumer was busy
+                next_close = max(next_close, time.monotonic()) \
+                    + self.interval
+                time.sleep(max(0.0, next_close - time.monotonic()))
+            yield Bar(self.pair, self.timeframe, row.Index.to_pydatetime(),
+                      row.open, row.high, row.low, row.close,
+                      row.funding), live
+
+
+class QueuePublisher:
+    """Publish decisions to a queue.Queue."""
+
+    def __init__(self, decisions: queue.Queue = None):
+        self.queue = decisions if decisions is not None else queue.Queue()
+
+    def publish(self, decision: dict):
+        self.queue.put(decision)
+
+    def close(self):
+        pass
+
+
+class SocketPublisher:
+    """Publish decisions to the clients of a local TCP socket.
+
+    Description
+    ----------
+    Every decision is sent as one line of JSON to all connected
+    clients. Clients that disconnect are dropped.
+
+    Parameters:
+    ----------
+    host: string
+        Give the address to listen on.
+    port: int
+        Give the port to listen on, any free port if 0.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self._server = socket.create_server((host, port))
+        self.address = self._server.getsockname()
+        self._clients = list()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._accept, daemon=True)
+        self._thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._clients.append(client)
+
+    def publish(self, decision: dict):
+        line = (json.dumps(decision) + '\n').encode()
+        with self._lock:
+            for client in list(self._clients):
+                try:
+                    client.sendall(line)
+                except OSError:
+                    self._clients.remove(client)
+                    client.close()
+
+    def close(self):
+        self._server.close()
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients = list()
+
+
+class QueueData(bt.feed.DataBase):
+    """A live backtrader data feed reading bars from a queue.
+
+    Description
+    ----------
+    The queue holds tuples of a bar, the time it arrived and whether it
+    arrived live, None ends the feed. The bars loaded are appended to
+    history, if any.
+    """
+
+    lines = ('funding',)
+    params = (('queue', None),
+              ('qcheck', 0.5),
+              ('history', None))
+
+    def __init__(self):
+        self.bar = None
+        self.arrived = None
+        self.live = False
+
+    def islive(self):
+        return True
+
+    def haslivedata(self):
+        return not self.p.queue.empty()
+
+    def _load(self):
+        try:
+            item = self.p.queue.get(timeout=self.p.qcheck)
+        except queue.Empty:
+            return None
+        if item is None:
+            return False
+
+        bar, self.arrived, self.live = item
+        self.bar = bar
+        if self.p.history is not None:
+            self.p.history.append(bar)
+        timestamp = bar.time.astimezone(dt.timezone.utc).replace(tzinfo=None)
+        self.lines.datetime[0] = bt.date2num(timestamp)
+        self.lines.open[0] = bar.open
+        self.lines.high[0] = bar.high
+        self.lines.low[0] = bar.low
+        self.lines.close[0] = bar.close
+        self.lines.volume[0] = 0.0
+        self.lines.openinterest[0] = 0.0
+        self.lines.funding[0] = bar.funding
+
+        return True
+
+
+class SignalMixin:
+    """Report the orders of a strategy as decisions of a stream.
+
+    Description
+    ----------
+    Mixed into a strategy by SignalService. The buy and sell calls the
+    strategy makes during next are translated into actions, a candle
+    without orders is a hold. Positions are closed by backtrader
+    through buy and sell as well. No orders are placed on the bars a
+    stream restored from a snapshot warms up on.
+    """
+
+    stream = None
+
+    def __init__(self):
+        super().__init__()
+        self._actions = list()
+
+    def start(self):
+        super().start()
+        self.stream.seed(self)
+
+    def stop(self):
+        super().stop()
+        self.stream.save(self)
+
+    def buy(self, *args, **kwargs):
+        if self.stream.replays(self.data.bar):
+            return None
+        self._actions.append('exit_short' if self.position.size < 0
+                             else 'enter_long')
+        return super().buy(*args, **kwargs)
+
+    def sell(self, *args, **kwargs):
+        if self.stream.replays(self.data.bar):
+            return None
+        self._actions.append('exit_long' if self.position.size > 0
+                             else 'enter_short')
+        return super().sell(*args, **kwargs)
+
+    def next(self):
+        self._actions = list()
+        super().next()
+        self.stream.decide(self, self._actions or ['hold'])
+
+
+class _StreamAnalyzer(metrics.MetricsAnalyzer):
+    """Feed the metrics of a stream and write its snapshots."""
+
+    def next(self):
+        # The metrics of the kept bars are those of the snapshot
+        bar = self.strategy.data.bar
+        if self.strategy.stream.replays(bar):
+            return
+        super().next()
+        if self.strategy.data.live:
+            self.strategy.stream.save(self.strategy)
+
+
+class _Stream:
+    """Hold the state of one strategy running on one pair and timeframe."""
+
+    def __init__(self, name, strategy, par_tuple, pair, timeframe, cash,
+                 publisher, state_path=None):
+        self.name = name
+        self.strategy = strategy
+        self.par_tuple = par_tuple
+        self.pair = pair
+        self.timeframe = timeframe
+        self.cash = cash
+        self.publisher = publisher
+        self.bars = queue.Queue()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.last_decision = None
+        self.stats = metrics.OnlineMetrics(cash)
+        self.thread = None
+        self.state_path = state_path
+        self.history = deque(maxlen=SNAPSHOT_BARS)
+        self.broker = None
+        self.resume = None
+
+    def config(self):
+        return {'name': self.name, 'strategy': self.strategy.__name__,
+                'par_tuple': tuple(self.par_tuple), 'pair': self.pair,
+                'timeframe': self.timeframe, 'cash': self.cash}
+
+    def restore(self):
+        # Queue the kept bars of a snapshot of the same stream, if any
+        if self.state_path is None:
+            return
+        try:
+            state = snapshot.read_stream(self.state_path)
+        except (OSError, ValueError):
+            return
+        if state['config'] != self.config():
+            return
+
+        self.stats = state['metrics']
+        self.broker = state['broker']
+        self.resume = state['last']
+        arrived = time.perf_counter()
+        for row in state['bars'].tolist():
+            bar = Bar(self.pair, self.timeframe,
+                      dt.datetime.fromtimestamp(row[0], dt.timezone.utc),
+                      *row[1:])
+            self.bars.put((bar, arrived, False))
+
+    def replays(self, bar):
+        return self.resume is not None and bar.time < self.resume
+
+    def seed(self, strategy):
+        # Take over the position and open trade of the snapshot, so
+        # that closing it is counted like in the stream that wrote it
+        if self.broker is None or not self.broker['size']:
+            return
+        size, price = self.broker['size'], self.broker['price']
+        opened = self.resume.astimezone(dt.timezone.utc).replace(tzinfo=None)
+        strategy.broker.getposition(strategy.data).update(size, price,
+                                                          opened)
+        trade = bt.Trade(data=strategy.data,
+                         historyon=strategy._tradehistoryon, size=size,
+                         price=price, value=size * price,
+                         commission=self.broker['commission'])
+        trade.isopen = True
+        trade.long = size > 0
+        trade.status = trade.Open
+        strategy._trades[strategy.data][0].append(trade)
+
+    def save(self, strategy):
+        if self.state_path is None or not self.history:
+            return
+        trades = strategy._trades[strategy.data][0]
+        commission = trades[-1].commission \
+            if trades and trades[-1].isopen else 0.0
+        position = strategy.position
+        snapshot.write_stream(self.state_path, {
+            'config': self.config(),
+            'last': self.history[-1].time,
+            'broker': {'cash': strategy.broker.getcash(),
+                       'size': position.size, 'price': position.price,
+                       'commission': commission},
+            'bars': [(bar.time.timestamp(), bar.open, bar.high, bar.low,
+                      bar.close, bar.funding) for bar in self.history],
+            'metrics': self.stats})
+
+    def run(self):
+        strategy = type(self.strategy.__name__, (SignalMixin, self.strategy),
+                        {'stream': self})
+
+        cerebro = bt.Cerebro(stdstats=False)
+        cerebro.adddata(QueueData(queue=self.bars, history=self.history))
+        cerebro.addstrategy(strategy, par_tuple=self.par_tuple)
+        cerebro.addanalyzer(_StreamAnalyzer, stats=self.stats)
+        cerebro.broker.setcash(self.cash if self.broker is None
+                               else self.broker['cash'])
+        cerebro.broker.setcommission(0.0007)
+        cerebro.run()
+
+    def decide(self, strategy, actions):
+        data = strategy.data
+        if not data.live:
+            return
+
+        decision = {'stream': self.name,
+                    'strategy': self.strategy.__name__,
+                    'pair': self.pair,
+                    'timeframe': self.timeframe,
+                    'time': data.datetime.datetime(0).isoformat(),
+                    'close': data.close[0],
+                    'actions': actions,
+                    'position': strategy.position.size,
+                    'value': strategy.broker.get_value()}
+        self.publisher.publish(decision)
+
+        self.latencies.append(time.perf_counter() - data.arrived)
+        self.last_decision = decision
+
+
+def _percentiles(seconds, percentiles):
+    values = np.percentile(np.asarray(seconds), percentiles) * 1000
+    return {p: float(v) for p, v in zip(percentiles, values)}
+
+
+def configured_streams(pairs: tuple = ('BTC-USD', 'ETH-USD'),
+                       timeframes: tuple = ('1D', '8H')):
+    """List the streams of the strategies tuned in parameters.py.
+
+    Parameters:
+    ----------
+    pairs: tuple
+        Give the currency pairs to be traded.
+    timeframes: tuple
+        Give the time frames of the charts to be traded on.
+
+    Returns:
+    ----------
+    streams: list
+        Tuples of name, strategy, parameter set, pair and timeframe to
+        pass to SignalService.add_stream.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    streams = list()
+    for label, strategy, getter in LIVE_STRATEGIES:
+        for pair in pairs:
+            for timeframe in timeframes:
+                coin = pair.split('-')[0]
+                par_tuple = getattr(parameters, 'get_{0}_{1}_{2}'.format(
+                    getter, coin, timeframe.lower()))()
+                streams.append(('_'.join((label, coin, timeframe)), strategy,
+                                par_tuple, pair, timeframe))
+
+    return streams
+
+
+class SignalService:
+    """Run the streams and dispatch the bars of the feeds to them.
+
+    Parameters:
+    ----------
+    publisher: QueuePublisher or SocketPublisher
+        Give the publisher of the decisions.
+    cash: dict
+        Give the amount of starting capital per pair.
+    state_dir: string
+        Give the directory to keep the snapshots of the streams in,
+        the streams are neither saved nor restored if None.
+    """
+
+    def __init__(self, publisher=None, cash: dict = None,
+                 state_dir: str = None):
+        self.publisher = publisher or QueuePublisher()
+        self.cash = cash or scheduler.DEFAULT_CASH
+        self.state_dir = state_dir
+        self.streams = list()
+        self._feed_threads = list()
+
+    def add_stream(self, name: str, strategy: bt.Strategy, par_tuple: tuple,
+                   pair: str, timeframe: str):
+        """Add a strategy running on the bars of a pair and timeframe."""
+
+        state_path = None if self.state_dir is None \
+            else os.path.join(self.state_dir, name + '.snap')
+        self.streams.append(_Stream(name, strategy, par_tuple, pair,
+                                    timeframe, self.cash[pair],
+                                    self.publisher, state_path))
+
+    def _dispatch(self, feed):
+        subscribers = [stream for stream in self.streams
+                       if (stream.pair, stream.timeframe)
+                       == (feed.pair, feed.timeframe)]
+        resumes = [stream.resume for stream in subscribers]
+        if hasattr(feed, 'resume') and resumes and None not in resumes:
+            feed.resume = min(resumes)
+        warm = False
+        for bar, live in feed:
+            if live and not warm:
+                # Let the streams work through the history first, so
+                # the latencies are not those of the warm up
+                while any(not stream.bars.empty()
+                          for stream in subscribers):
+                    time.sleep(0.001)
+                warm = True
+            arrived = time.perf_counter()
+            for stream in subscribers:
+                # Restored streams have seen the bars up to resume
+                if stream.resume is None or bar.time > stream.resume:
+                    stream.bars.put((bar, arrived, live))
+        for stream in subscribers:
+            stream.bars.put(None)
+
+    def start(self, feeds: list):
+        """Start the streams and the feeds in background threads.
+
+        Description
+        ----------
+        Streams with a snapshot in the state directory are restored
+        from it first.
+
+        Parameters:
+        ----------
+        feeds: list
+            Give the feeds, each one handing out the bars of a pair
+            and a timeframe.
+
+        Returns:
+        ----------
+        Returns no value.
+
+        Raises:
+        ----------
+        Does not raise any exceptions.
+        """
+
+        for stream in self.streams:
+            stream.restore()
+            stream.thread = threading.Thread(target=stream.run, daemon=True,
+                                             name=stream.name)
+            stream.thread.start()
+
+        for feed in feeds:
+            thread = threading.Thread(target=self._dispatch, args=(feed,),
+                                      daemon=True)
+            thread.start()
+            self._feed_threads.append(thread)
+
+    def join(self):
+        """Wait until all feeds are exhausted and the streams stopped."""
+
+        for thread in self._feed_threads:
+            thread.join()
+        for stream in self.streams:
+            if stream.thread is not None:
+                stream.thread.join()
+
+    def run(self, feeds: list):
+        """Run the streams until all feeds are exhausted."""
+
+        self.start(feeds)
+        self.join()
+
+    def latency_percentiles(self, percentiles: tuple = (50, 90, 99)):
+        """Compute the bar to signal latency percentiles of every stream.
+
+        Parameters:
+        ----------
+        percentiles: tuple
+            Give the percentiles to compute.
+
+        Returns:
+        ----------
+        latencies: dict
+            The percentiles in milliseconds keyed by stream name, and
+            over all streams under 'all'.
+
+        Raises:
+        ----------
+        Does not raise any exceptions.
+        """
+
+        latencies = dict()
+        samples = list()
+        for stream in self.streams:
+            if stream.latencies:
+                samples.extend(stream.latencies)
+                latencies[stream.name] = _percentiles(stream.latencies,
+                                                      percentiles)
+        if samples:
+            latencies['all'] = _percentiles(samples, percentiles)
+
+        return latencies
+
+    def metrics(self):
+        """Return the running metrics of every stream.
+
+        Parameters:
+        ----------
+        Gets no parameters.
+
+        Returns:
+        ----------
+        metrics: dict
+            The number of trades, win rate, sharpe ratio, maximum draw
+            down and net profit of every stream since it started, keyed
+            by stream name, see metrics.OnlineMetrics.
+
+        Raises:
+        ----------
+        Does not raise any exceptions.
+        """
+
+        return {stream.name: stream.stats.metrics()
+                for stream in self.streams}
@@ -0,0 +1,259 @@
+"""Implements streaming accumulators of the metrics of a run.
+
+Description
+----------
+The SharpeRatio, DrawDown and TradeAnalyzer analyzers of backtrader and
+the AcctValue observer keep series as long as the run, although a sweep
+only ranks by a handful of numbers at its end. The accumulators of this
+module keep constant memory per run instead:
+
+    RunningMoments keeps the count, mean and sum of squared deviations
+    of the yearly returns after Welford. The sharpe ratio follows from
+    them like SharpeRatio computes it, from the returns of calendar
+    years less a risk free rate of 1 %.
+
+    DrawdownTracker keeps the peak of the account value and the
+    largest drawdown from it in percent like DrawDown.
+
+    TradeCounter keeps the number of opened trades and the number of
+    won trades and the net profit of the closed ones like
+    TradeAnalyzer.
+
+OnlineMetrics combines them and takes one account value per bar and
+one call per opened or closed trade, so the live service can feed it
+as well. Its state is a short list of floats that can be kept in a
+snapshot, see snapshot. MetricsAnalyzer feeds it from a backtrader run
+and reports the metrics optimizer.run_metrics reports from the
+analyzers.
+
+Classes
+----------
+RunningMoments:
+    Streams the mean and variance of a series.
+DrawdownTracker:
+    Streams the peak and the maximum drawdown of the account value.
+TradeCounter:
+    Streams the number, wins and net profit of the trades.
+OnlineMetrics:
+    Streams the metrics of a run bar by bar.
+MetricsAnalyzer: Inherits from Analyzer
+    Feeds OnlineMetrics from a backtrader run.
+
+Functions
+----------
+    Implements no functions.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+import math
+
+import backtrader as bt
+
+
+# Risk free rate SharpeRatio subtracts from the yearly returns
+RISK_FREE_RATE = 0.01
+
+
+class RunningMoments:
+    """Streams the mean and population variance of a series."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.squares = 0.0
+
+    def update(self, value: float):
+        """Add a value to the series."""
+
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.squares += delta * (value - self.mean)
+
+    def variance(self):
+        """Return the population variance, NaN for an empty series."""
+
+        if not self.count:
+            return math.nan
+        return max(self.squares, 0.0) / self.count
+
+
+class DrawdownTracker:
+    """Streams the peak and the maximum drawdown of the account value."""
+
+    def __init__(self):
+        self.peak = -math.inf
+        self.drawdown = 0.0
+        self.max_drawdown = 0.0
+
+    def update(self, value: float):
+        """Add the account value of a bar."""
+
+        self.peak = max(self.peak, value)
+        self.drawdown = 100.0 * (self.peak - value) / self.peak
+        self.max_drawdown = max(self.max_drawdown, self.drawdown)
+
+
+class TradeCounter:
+    """Streams the number, wins and net profit of the trades.
+
+    Trades count when they are opened, so open trades count as well,
+    and a closed trade is won if its net profit is not negative.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.closed = 0
+        self.won = 0
+        self.pnl = 0.0
+
+    def open(self):
+        """Count an opened trade."""
+
+        self.total += 1
+
+    def close(self, pnl: float):
+        """Count a closed trade with its net profit."""
+
+        self.closed += 1
+        self.won += int(pnl >= 0.0)
+        self.pnl += pnl
+
+    @property
+    def lost(self):
+        """Return the number of closed trades that were lost."""
+
+        return self.closed - self.won
+
+
+class OnlineMetrics:
+    """Streams the metrics of a run bar by bar.
+
+    Parameters:
+    ----------
+    cash: float
+        Give the account value at the start, the first yearly return
+        is taken from it.
+    """
+
+    def __init__(self, cash: float):
+        self.returns = RunningMoments()
+        self.drawdown = DrawdownTracker()
+        self.trades = TradeCounter()
+        self.year = None
+        self.start = cash
+        self.value = cash
+
+    def update(self, year: int, value: float):
+        """Add the year and the account value of a bar."""
+
+        if self.year is not None and year != self.year:
+            # The year is over, the next one starts from its last value
+            self.returns.update(self.value / self.start - 1.0)
+            self.start = self.value
+        self.year = year
+        self.value = value
+        self.drawdown.update(value)
+
+    def sharpe(self):
+        """Return the sharpe ratio of the yearly returns, None if flat."""
+
+        count, mean, squares = \
+            self.returns.count, self.returns.mean, self.returns.squares
+        if self.year is not None:
+            # Count the running year as SharpeRatio does at the end
+            value = self.value / self.start - 1.0
+            count += 1
+            delta = value - mean
+            mean += delta / count
+            squares += delta * (value - mean)
+        if not count:
+            return None
+
+        deviation = math.sqrt(max(squares, 0.0) / count)
+        if deviation == 0.0:
+            return None
+        return (mean - RISK_FREE_RATE) / deviation
+
+    def state(self):
+        """Return the accumulators as floats, see from_state.
+
+        The running year is NaN before the first bar.
+        """
+
+        return [float(self.returns.count), self.returns.mean,
+                self.returns.squares, self.drawdown.peak,
+                self.drawdown.drawdown, self.drawdown.max_drawdown,
+                float(self.trades.total), float(self.trades.closed),
+                float(self.trades.won), self.trades.pnl,
+                math.nan if self.year is None else float(self.year),
+                self.start, self.value]
+
+    @classmethod
+    def from_state(cls, state):
+        """Return the accumulators of a state as returned by state."""
+
+        stats = cls(state[11])
+        stats.returns.count = int(state[0])
+        stats.returns.mean = float(state[1])
+        stats.returns.squares = float(state[2])
+        stats.drawdown.peak = float(state[3])
+        stats.drawdown.drawdown = float(state[4])
+        stats.drawdown.max_drawdown = float(state[5])
+        stats.trades.total = int(state[6])
+        stats.trades.closed = int(state[7])
+        stats.trades.won = int(state[8])
+        stats.trades.pnl = float(state[9])
+        stats.year = None if math.isnan(state[10]) else int(state[10])
+        stats.value = float(state[12])
+
+        return stats
+
+    def metrics(self):
+        """Return the metrics of run_sweep, see optimizer.run_metrics."""
+
+        trades = self.trades.total
+        return {'pnl': self.trades.pnl,
+                '# trades': trades,
+                'win rate': self.trades.won / trades if trades else 0,
+                'sharpe': self.sharpe(),
+                'max DD': self.drawdown.max_drawdown}
+
+
+class MetricsAnalyzer(bt.Analyzer):
+    """Feeds OnlineMetrics from a backtrader run.
+
+    Parameters
+    ----------
+    stats : OnlineMetrics
+        The accumulator to feed, e.g. one whose metrics are read while
+        the run is going. A new one starting from the value of the
+        broker if None.
+    """
+
+    params = (('stats', None),)
+
+    def start(self):
+        self.stats = self.p.stats
+        if self.stats is None:
+            self.stats = OnlineMetrics(self.strategy.broker.getvalue())
+        self.value = None
+
+    def notify_fund(self, cash, value, fundvalue, shares):
+        self.value = value
+
+    def notify_trade(self, trade):
+        if trade.justopened:
+            self.stats.trades.open()
+        elif trade.status == trade.Closed:
+            self.stats.trades.close(trade.pnlcomm)
+
+    def next(self):
+        self.stats.update(self.strategy.datetime.datetime(0).year,
+                          self.value)
+
+    def get_analysis(self):
+        return self.stats.metrics()
@@ -0,0 +1,304 @@
+"""Implements coarse to fine optimization across time frames.
+
+Description
+----------
+A sweep on 8H data runs three times as many bars as the same sweep on
+1D data, although most candidates are discarded either way. The coarse
+to fine search screens all candidates on a coarse series first, the
+bundled data of a longer time frame or the target data with every few
+bars merged into one, and only runs the best fraction of them on the
+target time frame, e.g.
+
+    optimizer.optimize('SMAC_BTC_8H', strategies.SMAC, windowset,
+                       timeframe='8H', coarse='1D', promote=0.1)
+
+To look at the same stretch of time on the coarse series the periods of
+the indicators are divided by the number of target bars per coarse
+bar. Thresholds on slopes per bar grow with it and thresholds on the
+volatility of the returns of a bar with its square root. The screen
+orders the candidates by Pareto front like selection.select without
+constraints. The promoted candidates are ranked like optimize ranks a
+sweep of all candidates: the drawdown ranking keeps up to
+optimizer.DRAWDOWN_KEEP of all candidates rather than of the promoted
+ones. A full sweep takes that fraction of the feasible candidates only,
+which are not known without it, so the coarse ranking can hold a few
+more rows. The report tells
+which fraction of the bars and of the time of a full sweep on the
+target time frame was spent.
+
+Classes
+----------
+    Implements no classes.
+
+Functions
+----------
+scale_parameters: tuple
+    Scales a parameter set from the target to the coarse series.
+coarsen: DataFrame
+    Merges every few bars of a series into one.
+coarse_series: DataFrame, float
+    Returns the coarse series of a target series.
+coarse_to_fine: DataFrame, dict
+    Screens candidates on a coarse series and evaluates the best on
+    the target time frame.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+import math
+import time
+
+import numpy as np
+
+import optimizer
+import selection
+import synthetic
+
+
+# Positions of the periods, of the thresholds on slopes per bar and of
+# the thresholds on the volatility of the returns of a bar in the
+# parameter sets of a strategy
+SCALING = {'SMAC': {'periods': (0, 1)},
+           'Stc': {'periods': (0, 1, 2, 3, 4)},
+           'AroonStc': {'periods': (0, 1, 2, 3, 4, 7)},
+           'StcSmaShort': {'periods': (0, 1, 2, 3, 4, 7)},
+           'StcVol': {'periods': (0, 1, 2, 3, 4, 7),
+                      'volatilities': (8, 9)},
+           'DRSIDMALong': {'periods': (0, 1, 2, 3, 4, 5),
+                           'slopes': (6, 7)},
+           'DRSIDMAShort': {'periods': (0, 1, 2, 3, 4, 5),
+                            'slopes': (6, 7)}}
+
+
+def scale_parameters(strategy_name: str, par_tuple: tuple, factor: float):
+    """Scale a parameter set from the target to the coarse series.
+
+    Parameters:
+    ----------
+    strategy_name: string
+        Give the class name of the strategy in strategies.py.
+    par_tuple: tuple
+        Give the parameter set on the target series.
+    factor: float
+        Give the number of target bars per coarse bar.
+
+    Returns:
+    ----------
+    par_tuple: tuple
+        The parameter set on the coarse series, periods rounded to at
+        least one bar.
+
+    Raises:
+    ----------
+    KeyError
+        If the strategy has no description of its parameters.
+    """
+
+    scaling = SCALING[strategy_name]
+    scaled = list(par_tuple)
+    for i in scaling.get('periods', ()):
+        scaled[i] = max(1, int(round(par_tuple[i] / factor)))
+    for i in scaling.get('slopes', ()):
+        scaled[i] = par_tuple[i] * factor
+    for i in scaling.get('volatilities', ()):
+        scaled[i] = par_tuple[i] * math.sqrt(factor)
+
+    return tuple(scaled)
+
+
+def coarsen(df, factor: int):
+    """Merge every few bars of a series into one.
+
+    Parameters:
+    ----------
+    df: DataFrame
+        Give the series as returned by optimizer.read_data.
+    factor: int
+        Give the number of bars merged into one, counted from the
+        first bar.
+
+    Returns:
+    ----------
+    df: DataFrame
+        The merged bars indexed by the time of their first bar, with
+        the open of the first, the highest high, the lowest low and the
+        close and funding of the last bar.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    groups = df.groupby(np.arange(len(df)) // int(factor))
+    coarse = groups.agg({'open': 'first', 'high': 'max', 'low': 'min',
+                         'close': 'last', 'funding': 'last'})
+    coarse.index = df.index[::int(factor)]
+
+    return coarse
+
+
+def _sweep(strategy, par_tuples, df, cash, engine, maxcpus, progress,
+           graph=None, record_dir=None):
+    if engine == 'backtrader':
+        return optimizer.run_sweep(strategy, par_tuples,
+                                   optimizer.data_feed(df), cash=cash,
+                                   graph=graph, maxcpus=maxcpus,
+                                   record_dir=record_dir, progress=progress)
+
+    import kernels
+    return kernels.sweep(strategy.__name__, par_tuples, df, cash=cash,
+                         events=engine == 'events', progress=progress)
+
+
+def coarse_series(df, pair: str, timeframe: str, coarse, **kwargs):
+    """Return the coarse series of a target series.
+
+    Parameters:
+    ----------
+    df: DataFrame
+        Give the target series as returned by optimizer.read_data.
+    pair: string
+        Give the currency pair of the series.
+    timeframe: string
+        Give the time frame of the target series.
+    coarse: string or int
+        Give the time frame of the coarse series, e.g. '1D', or the
+        number of target bars merged into one coarse bar.
+    kwargs:
+        Give the arguments the target series was read with, see
+        optimizer.read_data.
+
+    Returns:
+    ----------
+    df: DataFrame
+        The coarse series over the time of the target series.
+    factor: float
+        The number of target bars per coarse bar.
+
+    Raises:
+    ----------
+    ValueError
+        If a time frame is unknown.
+    """
+
+    if isinstance(coarse, str):
+        factor = synthetic.bar_duration(coarse) \
+            / synthetic.bar_duration(timeframe)
+        # The bundled files of the time frames cover different years
+        df_coarse = optimizer.read_data(pair, coarse, **kwargs)[0]
+        return df_coarse.loc[df.index[0]:df.index[-1]], factor
+
+    return coarsen(df, coarse), int(coarse)
+
+
+def coarse_to_fine(strategy, par_tuples: list, df, df_coarse,
+                   factor: float, promote: float = 0.1, cash: int = 10000,
+                   engine: str = 'backtrader', rank: str = 'drawdown',
+                   maxcpus: int = None, progress=None, graph=None,
+                   record_dir: str = None):
+    """Screen candidates on a coarse series and evaluate the best.
+
+    Parameters:
+    ----------
+    strategy: backtrader.Strategy
+        Give the strategy to optimize.
+    par_tuples: list
+        Give the parameter sets on the target series.
+    df: DataFrame
+        Give the target series as returned by optimizer.read_data.
+    df_coarse: DataFrame
+        Give the coarse series, see coarse_series.
+    factor: float
+        Give the number of target bars per coarse bar.
+    promote: float
+        Give the fraction of the candidates evaluated on the target
+        series, at least one.
+    cash: int
+        Give the amount of starting capital.
+    engine: string
+        Give 'backtrader', 'kernel' or 'events' to run the sweeps with,
+        see optimizer.optimize.
+    rank: string
+        Give the method that ranks the promoted candidates, see
+        optimizer.rank_results. The drawdown ranking keeps up to
+        optimizer.DRAWDOWN_KEEP of all candidates.
+    maxcpus: int
+        Give the number of processes a backtrader sweep may use.
+    progress: telemetry.SweepTelemetry
+        Give the telemetry to count the runs of both sweeps in, if any.
+    graph: indicator_graph.IndicatorGraph
+        Give the shared indicator graph of the target series for a
+        backtrader sweep, if any.
+    record_dir: string
+        Give a directory to stream the runs of a backtrader sweep on the
+        target series to, see optimizer.run_sweep.
+
+    Returns:
+    ----------
+    analysis: DataFrame
+        The metrics of the promoted parameter sets on the target series
+        that passed the filters, best first.
+    report: dict
+        The number of candidates, of distinct coarse parameter sets
+        and of promoted candidates, the bars of both series, the
+        seconds of both sweeps and the fractions of the bars and of the
+        time of a full sweep on the target series that were spent.
+
+    Raises:
+    ----------
+    ValueError
+        If the engine or the ranking method is unknown.
+    KeyError
+        If the strategy has no description of its parameters.
+    """
+
+    if engine not in ('backtrader', 'kernel', 'events'):
+        raise ValueError('Unknown engine: ' + engine)
+
+    # Candidates whose periods round to the same coarse ones share
+    # their screening run
+    par_tuples = list(par_tuples)
+    scaled = [scale_parameters(strategy.__name__, par_tuple, factor)
+              for par_tuple in par_tuples]
+    distinct = list(dict.fromkeys(scaled))
+    rows = {par_tuple: i for i, par_tuple in enumerate(distinct)}
+    keep = max(1, math.ceil(promote * len(par_tuples)))
+    if progress is not None:
+        progress.total = len(distinct) + keep
+
+    start = time.perf_counter()
+    screen = _sweep(strategy, distinct, df_coarse, cash, engine, maxcpus,
+                    progress)
+    coarse_seconds = time.perf_counter() - start
+
+    screen = screen.iloc[[rows[par_tuple] for par_tuple in scaled]]
+    screen.index = range(len(par_tuples))
+    promoted = [par_tuples[i]
+                for i in selection.select(screen, keep, constraints={}).index]
+
+    start = time.perf_counter()
+    analysis = _sweep(strategy, promoted, df, cash, engine, maxcpus,
+                      progress, graph, record_dir)
+    fine_seconds = time.perf_counter() - start
+
+    full_seconds = fine_seconds / len(promoted) * len(par_tuples)
+    report = {'candidates': len(par_tuples),
+              'screened': len(distinct),
+              'promoted': len(promoted),
+              'coarse bars': len(df_coarse),
+              'bars': len(df),
+              'coarse seconds': coarse_seconds,
+              'seconds': fine_seconds,
+              'bar fraction': (len(df_coarse) * len(distinct)
+                               + len(df) * len(promoted))
+                              / (len(df) * len(par_tuples)),
+              'time fraction': (coarse_seconds + fine_seconds)
+                               / full_seconds}
+
+    # Cut like a sweep of all candidates, whose feasible ones are only
+    # known among the promoted
+    keep = max(1, math.floor(len(par_tuples) * optimizer.DRAWDOWN_KEEP))
+
+    return optimizer.rank_results(analysis, rank, keep=keep), report
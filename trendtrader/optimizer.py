@@ -9,7 +9,8 @@ Classes
 ----------
     TimeSeriesSplitImproved: Inherits from TimeSeriesSplit
         A class representing windows of data on which to perform cross
-        validation such as walk forward optimization.
+        validation such as walk forward optimization. Lives in splits
+        and is imported from there on first use.
 
     AcctValue: Inherits from Observer
         Tracks the value of the account.
@@ -17,24 +18,71 @@ Classes
     AcctStats: Inherits from Analyzer
         Keeps track of important statistics of the account.
 
+    EquityCurve: Inherits from Analyzer
+        Records the value of the account on every bar.
+
+    TradeList: Inherits from Analyzer
+        Records the net profit of every closed trade.
+
 Functions
 ----------
     read_data: DataFrame, datafeed
         Reads data from a CSV file into a pandas DataFrame and creates
         a backtrader pandas data feed.
 
-    walk_forward:
+    data_feed: datafeed
+        Creates the backtrader data feed of read_data for a DataFrame.
+
+    train_fold: tuple
+        Selects the parameter set of a strategy on a training window.
+
+    fold_slice: DataFrame, int
+        Slices a fold out of the data together with the bars the
+        indicators of a strategy need to warm up.
+
+    test_fold: dict, Series
+        Runs a strategy with one parameter set on a testing window.
+
+    walk_forward: DataFrame, Series
         Executes walk forward optimization on a given strategy and
         dataset.
 
+    stitch_folds: Series
+        Chains the equity curves of the test folds, carrying the
+        capital from fold to fold.
+
+    equity_metrics: dict
+        Computes the return, sharpe ratio and maximum drawdown of an
+        equity curve.
+
+    anchored_folds: generator
+        Generates walk forward folds of fixed size that do not move
+        when data is appended.
+
+    refresh_walk_forward: DataFrame, Series
+        Executes walk forward optimization incrementally, recomputing
+        only the folds that changed since the last refresh.
+
     optimize:
         Executes optimization on a given strategy and sets of
         parameters. Can be both grid search or random search
         depending on how the parameter set is being
         constructed.
 
+    run_sweep: DataFrame
+        Runs a strategy for many parameter sets and collects the
+        metrics of every run.
+
+    run_metrics: dict
+        Collects the metrics of a sweep from the analyzers of a run.
+
+    rank_results: DataFrame
+        Filters and orders the metrics of a sweep by preference.
+
     test_strategy:
         Runs and evaluates a strategy for one set of parameters.
+        Strategies can take their indicators from the shared
+        indicator graph of the feed, see indicator_graph.
 
 Exceptions
 ----------
@@ -43,111 +91,36 @@ Exceptions
 
 
 import datetime as dt
-from copy import deepcopy
 from collections import OrderedDict
+import hashlib
 import math
+import os
+import pickle
 import pytz
 
 import backtrader as bt
-from sklearn.model_selection import TimeSeriesSplit
-from sklearn.utils import indexable
-from sklearn.utils.validation import _num_samples
 import numpy as np
 import pandas as pd
 
-class TimeSeriesSplitImproved(TimeSeriesSplit):
-    """Time Series cross-validator
-
-    Provides train/test indices to split time series data samples
-    that are observed at fixed time intervals, in train/test sets.
-    In each split, test indices must be higher than before, and thus
-    shuffling in cross validator is inappropriate.
-    This cross-validation object is a variation of :class:`KFold`.
-    In the kth split, it returns first k folds as train set and the
-    (k+1)th fold as test set.
-    Note that unlike standard cross-validation methods, successive
-    training sets are supersets of those that come before them.
-    Read more in the :ref:`User Guide `.
-
-    Source:
-    ----------
-    https://ntguardian.wordpress.com/2017/06/19/
-        walk-forward-analysis-demonstration-backtrader/
-
-    Parameters
-    ----------
-    n_splits : int, default=3
-        Number of splits. Must be at least 1.
-
-    Notes
-    -----
-    When ``fixed_length`` is ``False``, the training set has size
-    ``i * train_splits * n_samples // (n_splits + 1) + n_samples %
-    (n_splits + 1)`` in the ``i``th split, with a test set of size
-    ``n_samples//(n_splits + 1) * test_splits``, where ``n_samples``
-    is the number of samples. If fixed_length is True, replace ``i``
-    in the above formulation with 1, and ignore ``n_samples %
-    (n_splits + 1)`` except for the first training set. The number
-    of test sets is ``n_splits + 2 - train_splits - test_splits``.
-    """
+import indicator_graph
+import ingest
+import metrics
+import selection
+import telemetry
+
+
+# Fraction of the feasible parameter sets the drawdown ranking keeps
+DRAWDOWN_KEEP = 0.05
+
+
+def __getattr__(name):
+    # sklearn takes longer to import than everything else together,
+    # the splitters are only loaded when they are used
+    if name == 'TimeSeriesSplitImproved':
+        from splits import TimeSeriesSplitImproved
+        return TimeSeriesSplitImproved
+    raise AttributeError("module 'optimizer' has no attribute " + repr(name))
 
-    def split(self, X, y=None, groups=None, fixed_length=False,
-              train_splits=1, test_splits=1):
-        """Generate indices to split data into training and test set.
-
-        Parameters
-        ----------
-        X : array-like, shape (n_samples, n_features)
-            Training data, where n_samples is the number of samples
-            and n_features is the number of features.
-        y : array-like, shape (n_samples,)
-            Always ignored, exists for compatibility.
-        groups : array-like, with shape (n_samples,), optional
-            Always ignored, exists for compatibility.
-        fixed_length : bool, whether training sets should always have
-            common length
-        train_splits : positive int, for the minimum number of
-            splits to include in training sets
-        test_splits : positive int, for the number of splits to
-            include in the test set
-
-        Returns
-        -------
-        train : ndarray
-            The training set indices for that split.
-        test : ndarray
-            The testing set indices for that split.
-        """
-
-        X, y, groups = indexable(X, y, groups)
-        n_samples = _num_samples(X)
-        n_splits = self.n_splits
-        n_folds = n_splits + 1
-        train_splits, test_splits = int(train_splits), int(test_splits)
-        if n_folds > n_samples:
-            raise ValueError(
-                ("Cannot have number of folds ={0} greater"
-                 " than the number of samples: {1}.").format(n_folds,
-                                                             n_samples))
-        indices = np.arange(n_samples)
-        split_size = (n_samples // n_folds)
-        test_size = split_size * test_splits
-        train_size = split_size * train_splits
-        test_starts = range(train_size + n_samples % n_folds,
-                            n_samples - (test_size - split_size),
-                            split_size)
-        if fixed_length:
-            for i, test_start in zip(range(len(test_starts)),
-                                     test_starts):
-                rem = 0
-                if i == 0:
-                    rem = n_samples % n_folds
-                yield (indices[(test_start - train_size - rem):test_start],
-                       indices[test_start:test_start + test_size])
-        else:
-            for test_start in test_starts:
-                yield (indices[:test_start],
-                       indices[test_start:test_start + test_size])
 
 class AcctValue(bt.Observer):
     '''A simple observer that tracks the account value'''
@@ -176,12 +149,39 @@ class AcctStats(bt.Analyzer):
                 "return": self.end_val / self.start_val}
 
 
+class EquityCurve(bt.Analyzer):
+    """An analyzer that records the account value on every bar"""
+
+    def __init__(self):
+        self.values = list()
+
+    def next(self):
+        self.values.append(self.strategy.broker.get_value())
+
+    def get_analysis(self):
+        return {"values": self.values}
+
+
+class TradeList(bt.Analyzer):
+    """An analyzer that records the net profit of every closed trade"""
+
+    def __init__(self):
+        self.pnl = list()
+
+    def notify_trade(self, trade):
+        if trade.isclosed:
+            self.pnl.append(trade.pnlcomm)
+
+    def get_analysis(self):
+        return {"pnl": self.pnl}
+
+
 def read_data(pair: str = 'BTC-USD', timeframe: str = '1D',
               start_date: dt.datetime =
               dt.datetime(
                   2014,12,1,0,0,0,0,dt.timezone(dt.timedelta(hours=0))),
               end_date: dt.datetime = dt.datetime.now(pytz.utc),
-              funding: bool = True):
+              funding: bool = True, data_dir: str = './data'):
     """Read in data from a CSV file.
 
     Description
@@ -202,6 +202,9 @@ def read_data(pair: str = 'BTC-USD', timeframe: str = '1D',
     funding: bool
         If funding data is needed, the data has to be restricted to the
         time from which funding data is available.
+    data_dir: string
+        Give the directory of the CSV files, see ingest.data_path and
+        synthetic for other pairs and time frames.
 
     Returns:
     ----------
@@ -232,15 +235,10 @@ def read_data(pair: str = 'BTC-USD', timeframe: str = '1D',
     #ydf = web.DataReader(pair, data_source='yahoo',
     #                   start = '2018-01-01', end=datetime.today())
 
-    df = pd.DataFrame()
-    if pair == 'BTC-USD':
-        df = pd.read_csv('./data/COINBASE_BTCUSD_' + str(timeframe) + '.csv',
-                         encoding='utf7')
-    elif pair == 'ETH-USD':
-        df = pd.read_csv('./data/COINBASE_ETHUSD_' + str(timeframe) + '.csv',
-                         encoding='utf7')
+    df = pd.read_csv(ingest.data_path(pair, str(timeframe), data_dir),
+                     encoding='utf7')
 
-    df['time'] = df['time'].apply(pd.to_datetime)
+    df['time'] = pd.to_datetime(df['time'])
     df = df[df['time'] > start_date]
     df = df[df['time'] < end_date]
 
@@ -253,7 +251,13 @@ def read_data(pair: str = 'BTC-USD', timeframe: str = '1D',
 
     df.set_index('time', inplace=True)
 
-    data = bt.feeds.PandasDataFunding(
+    return df, data_feed(df)
+
+
+def data_feed(df):
+    """Create the backtrader data feed of read_data for a DataFrame."""
+
+    return bt.feeds.PandasDataFunding(
         dataname=df,
         datetime=None,
         high='high',
@@ -263,7 +267,188 @@ def read_data(pair: str = 'BTC-USD', timeframe: str = '1D',
         funding='funding'
     )
 
-    return df, data
+
+def _fold_cerebro(cash: int):
+    """Create a Cerebro for the training or testing of one fold."""
+
+    cerebro = bt.Cerebro(stdstats=False, maxcpus=1)
+    cerebro.broker.set_cash(cash)
+    cerebro.broker.setcommission(0.0007)
+
+    cerebro.addanalyzer(AcctStats)
+    cerebro.addanalyzer(bt.analyzers.SharpeRatio)
+    cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
+
+    return cerebro
+
+
+def _fold_data(df):
+    return bt.feeds.PandasData(dataname=df,
+                               datetime=None,
+                               high='high',
+                               low='low',
+                               open='open',
+                               close='close')
+
+
+def train_fold(strategy: bt.Strategy, windowset: set, df, cash: int,
+               progress=None):
+    """Select the parameter set of a strategy on a training window.
+
+    Parameters:
+    ----------
+    strategy: backtrader.Strategy
+        Give the strategy to optimize.
+    windowset: set
+        Give the parameter sets to choose from.
+    df: DataFrame
+        Give the data of the training window.
+    cash: int
+        Give the amount of starting capital.
+    progress: telemetry.SweepTelemetry
+        Give the telemetry to count the runs in, if any.
+
+    Returns:
+    ----------
+    par_tuple: tuple
+        The selected parameter set.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    trainer = _fold_cerebro(cash)
+    trainer.optstrategy(strategy, par_tuple=list(windowset))
+    trainer.adddata(_fold_data(df))
+    if progress is not None:
+        trainer.addanalyzer(telemetry.WorkerClock)
+        trainer.optcallback(progress.callback)
+
+    res = trainer.run()
+
+    # Get the combination with the smallest draw down over all runs
+    drawdowns = pd.DataFrame(
+        {'max DD': [run[0].analyzers.drawdown.get_analysis().max.drawdown
+                    for run in res]})
+
+    return res[selection.best(drawdowns, 'max DD')][0].params.par_tuple
+
+
+class _WarmUp:
+    """Mixin that keeps a strategy from trading during the warm up."""
+
+    warmup = 0
+
+    def buy(self, *args, **kwargs):
+        if len(self) <= self.warmup:
+            return None
+        return super().buy(*args, **kwargs)
+
+    def sell(self, *args, **kwargs):
+        if len(self) <= self.warmup:
+            return None
+        return super().sell(*args, **kwargs)
+
+
+def _warmup_bars(strategy: bt.Strategy, par_tuple: tuple):
+    try:
+        return indicator_graph.warmup_bars(strategy.__name__, par_tuple)
+    except KeyError:
+        # Strategies without a graph description start cold
+        return 0
+
+
+def fold_slice(df, start: int, stop: int, warmup: int = 0):
+    """Slice a fold out of the data together with its warm up bars.
+
+    Parameters:
+    ----------
+    df: DataFrame
+        Give the data the fold is taken from.
+    start: int
+        Give the position of the first bar of the fold.
+    stop: int
+        Give the position after the last bar of the fold.
+    warmup: int
+        Give the number of bars to prepend so the indicators are warmed
+        up at the start of the fold, see indicator_graph.warmup_bars.
+
+    Returns:
+    ----------
+    df: DataFrame
+        The bars of the fold with as many warm up bars before it as the
+        data has. A positional slice, it shares the arrays of the data
+        instead of copying them.
+    warmup: int
+        The number of warm up bars that were prepended.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    first = max(0, start - warmup)
+
+    return df.iloc[first:stop], start - first
+
+
+def test_fold(strategy: bt.Strategy, par_tuple: tuple, df, cash: int,
+              warmup: int = 0):
+    """Run a strategy with one parameter set on a testing window.
+
+    Parameters:
+    ----------
+    strategy: backtrader.Strategy
+        Give the strategy to test.
+    par_tuple: tuple
+        Give the parameter set to test.
+    df: DataFrame
+        Give the data of the testing window, see fold_slice.
+    cash: int
+        Give the amount of starting capital.
+    warmup: int
+        Give the number of bars at the start of the data that only warm
+        up the indicators, no orders are placed on them.
+
+    Returns:
+    ----------
+    res_dict: dict
+        The start and end value, growth and return of the account.
+    equity: Series
+        The value of the account on every bar of the window after the
+        warm up bars, empty if the data is too short for the strategy
+        to give a signal.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    # backtrader fails in runonce mode if the data is not longer than
+    # the warm up of the indicators, nothing could be traded on it
+    if len(df) <= _warmup_bars(strategy, par_tuple):
+        return ({"start": cash, "end": cash, "growth": 0, "return": 1.0},
+                pd.Series(dtype=float))
+
+    if warmup:
+        strategy = type(strategy.__name__, (_WarmUp, strategy),
+                        {'warmup': warmup})
+
+    tester = _fold_cerebro(cash)
+    tester.addanalyzer(EquityCurve, _name='equity')
+    tester.addstrategy(strategy, par_tuple=par_tuple)
+    tester.adddata(_fold_data(df))
+
+    res = tester.run()
+
+    # The analyzer records every bar, prenext calls next, the prepended
+    # warm up bars are not part of the window
+    values = res[0].analyzers.equity.get_analysis()['values']
+    equity = pd.Series(values[warmup:], index=df.index[warmup:],
+                       dtype=float)
+
+    return res[0].analyzers.acctstats.get_analysis(), equity
 
 
 def walk_forward(strat_name: str, strategy: bt.Strategy,
@@ -281,7 +466,11 @@ def walk_forward(strat_name: str, strategy: bt.Strategy,
     Description
     ----------
     Split the data into several windows to train and test a strategy on
-    and apply walk forward optimization on the split data.
+    and apply walk forward optimization on the split data. The out of
+    sample equity curve is stitched from the test folds, each fold
+    starts with the capital the previous one ended with. The folds are
+    only replayed in one run of the walk forward strategy to plot or
+    save it.
 
     Parameters:
     ----------
@@ -291,7 +480,8 @@ def walk_forward(strat_name: str, strategy: bt.Strategy,
         Give the strategy to optimize.
     walk_forward_strat: backtrader.Strategy
         Give the container for a walk forward strategy that can have
-        different sets of parameters on different data windows.
+        different sets of parameters on different data windows. Only
+        run to plot or save the result.
     windowset: set
         Give a set of parameter sets for which to optimize the strategy
         on the training data splits.
@@ -318,7 +508,10 @@ def walk_forward(strat_name: str, strategy: bt.Strategy,
 
     Returns:
     ----------
-    Does not return anything.
+    wfdf: DataFrame
+        The results of the test folds with the chosen parameters.
+    equity: Series
+        The stitched value of the account over all test folds.
 
     Raises:
     ----------
@@ -329,69 +522,55 @@ def walk_forward(strat_name: str, strategy: bt.Strategy,
 
     df, data = read_data(pair, timeframe, start_date, end_date, funding)
 
+    from splits import TimeSeriesSplitImproved
+
     tscv = TimeSeriesSplitImproved(split)
-    split = tscv.split(df, fixed_length=True, train_splits=2)
+    split = list(tscv.split(df, fixed_length=True, train_splits=2))
+
+    # Every fold trains on the whole windowset and tests once
+    progress = telemetry.SweepTelemetry(
+        strat_name, len(split) * (len(windowset) + 1), 'walk_forward',
+        'fold 1 of {0}'.format(len(split)))
 
     walk_forward_results = list()
+    fold_curves = list()
+
+    for n, (train, test) in enumerate(split):
+        progress.current = 'fold {0} of {1}'.format(n + 1, len(split))
 
-    for train, test in split:
         # TRAINING
-        windows = list(windowset)
-
-        trainer = bt.Cerebro(stdstats=False, maxcpus=1)
-        trainer.broker.set_cash(cash)
-        trainer.broker.setcommission(0.0007)
-
-        trainer.addanalyzer(AcctStats)
-        trainer.addanalyzer(bt.analyzers.SharpeRatio)
-        trainer.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
-
-        tester = deepcopy(trainer)
-
-        trainer.optstrategy(strategy, par_tuple=windows)
-
-        data = bt.feeds.PandasData(dataname=df.iloc[train],
-
-                                    datetime = None,
-                                    high = 'high',
-                                    low = 'low',
-                                    open = 'open',
-                                    close = 'close')
-        # Add a subset of data to the trainer
-        trainer.adddata(data)
-
-        res = trainer.run()
-        # Get optimal combination
-        opt_res = pd.DataFrame(
-            {r[0].params.par_tuple: r[0].analyzers.acctstats.get_analysis()
-            for r in res}
-            ).T.loc[:, "return"].sort_values(ascending=False).index[0]
-        sharpe = pd.DataFrame(
-            {r[0].params.par_tuple : r[0].analyzers.sharperatio.get_analysis()
-            for r in res}
-            ).T.loc[:, "sharperatio"].sort_values(ascending=False).index[0]
-        max_dd = pd.DataFrame(
-            {res[0][0].params.par_tuple :
-                 OrderedDict(res[0][0].analyzers.drawdown.get_analysis().max)}
-            ).T.loc[:, 'drawdown'].sort_values(ascending=True).index[0]
+        max_dd = train_fold(strategy, windowset,
+                            df.iloc[train[0]:train[-1] + 1], cash, progress)
 
         # TESTING
-        tester.addstrategy(strategy, par_tuple=max_dd)
-        data = bt.feeds.PandasData(dataname=df.iloc[test])
-        # Add a subset of data to the tester
-        tester.adddata(data)
-
-        res = tester.run()
-
-        res_dict = res[0].analyzers.acctstats.get_analysis()
+        df_test, warmup = fold_slice(df, test[0], test[-1] + 1,
+                                     _warmup_bars(strategy, max_dd))
+        res_dict, fold_equity = test_fold(strategy, max_dd, df_test, cash,
+                                          warmup)
+        fold_curves.append(fold_equity / cash)
+        progress.update()
         res_dict['params'] = max_dd
-        res_dict['start_date'] = df.iloc[test[0]].name
-        res_dict['end_date'] = df.iloc[test[-1]].name
-#        res_dict['sharpe'] = sharpe
+        res_dict['start_date'] = df.index[test[0]]
+        res_dict['end_date'] = df.index[test[-1]]
         walk_forward_results.append(res_dict)
         print(res_dict)
 
     wfdf = pd.DataFrame(walk_forward_results)
+    progress.finish()
+
+    equity = stitch_folds(fold_curves, cash)
+    print(equity_metrics(equity, cash))
+
+    if plot or save:
+        _replay_walk_forward(strat_name, walk_forward_strat, wfdf, df, cash,
+                             plot, save)
+
+    return wfdf, equity
+
+
+def _replay_walk_forward(strat_name, walk_forward_strat, wfdf, df, cash,
+                         plot, save):
+    """Replay the folds in one Cerebro to plot the stitched run."""
 
     cerebro_wf = bt.Cerebro()
 
@@ -405,8 +584,6 @@ def walk_forward(strat_name: str, strategy: bt.Strategy,
     )
 
     cerebro_wf.adddata(data)
-    bt.Strategy.lines
-    cerebro_wf.broker.getcash
     cerebro_wf.broker.setcash(cash)
     cerebro_wf.broker.setcommission(0.0007)
     cerebro_wf.addstrategy(walk_forward_strat,
@@ -429,13 +606,468 @@ def walk_forward(strat_name: str, strategy: bt.Strategy,
                              file_path=fpath)
 
 
+def stitch_folds(curves: list, cash: int):
+    """Chain the equity curves of the test folds into one.
+
+    Parameters:
+    ----------
+    curves: list
+        Give the value of the account on every bar of every test fold
+        in the order of the folds, each divided by the capital the
+        fold started with, see test_fold.
+    cash: int
+        Give the amount of starting capital of the first fold.
+
+    Returns:
+    ----------
+    equity: Series
+        The value of the account over all test folds, each fold starts
+        with the value the previous one ended with.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    stitched = list()
+    value = cash
+    for curve in curves:
+        stitched.append(curve * value)
+        if len(curve):
+            value *= curve.iloc[-1]
+    return pd.concat(stitched) if stitched else pd.Series(dtype=float)
+
+
+def equity_metrics(equity, cash: int):
+    """Compute the metrics of the account from its value on every bar.
+
+    Parameters:
+    ----------
+    equity: Series
+        Give the value of the account indexed by the time of the bars,
+        e.g. the stitched curve of stitch_folds.
+    cash: int
+        Give the amount of starting capital.
+
+    Returns:
+    ----------
+    stats: dict
+        The start and end value, growth and return of the account like
+        AcctStats, and the sharpe ratio of the yearly returns and the
+        maximum drawdown in percent like the analyzers of run_sweep.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    stats = metrics.OnlineMetrics(cash)
+    for time, value in zip(equity.index, equity.values):
+        stats.update(time.year, float(value))
+
+    return {'start': cash, 'end': stats.value,
+            'growth': stats.value - cash, 'return': stats.value / cash,
+            'sharpe': stats.sharpe(),
+            'max DD': stats.drawdown.max_drawdown}
+
+
+def anchored_folds(n_samples: int, train_size: int, test_size: int):
+    """Generate walk forward folds of fixed size anchored at the start.
+
+    Description
+    ----------
+    The k-th fold trains on the bars [k * test_size, k * test_size +
+    train_size) and tests on the following test_size bars. The last
+    fold may have a shorter test window. Unlike the folds of
+    TimeSeriesSplitImproved, the windows of the existing folds do not
+    move when bars are appended to the data, only the last test window
+    grows until it is full and new folds are added after it.
+
+    Parameters:
+    ----------
+    n_samples: int
+        Give the number of bars of the data.
+    train_size: int
+        Give the number of bars of a training window.
+    test_size: int
+        Give the number of bars of a testing window.
+
+    Returns:
+    ----------
+    folds: generator
+        The indices of the training and the testing window of every
+        fold.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    indices = np.arange(n_samples)
+    test_start = train_size
+    while test_start < n_samples:
+        yield (indices[test_start - train_size:test_start],
+               indices[test_start:test_start + test_size])
+        test_start += test_size
+
+
+def _frame_hash(df):
+    return hashlib.sha1(
+        pd.util.hash_pandas_object(df, index=True).values.tobytes()
+        ).hexdigest()
+
+
+def _load_walk_forward_state(state_path: str, config: dict):
+    if os.path.exists(state_path):
+        with open(state_path, 'rb') as f:
+            state = pickle.load(f)
+        if state['config'] == config:
+            return state
+
+    return {'config': config, 'folds': OrderedDict()}
+
+
+def _save_walk_forward_state(state_path: str, state: dict):
+    directory = os.path.dirname(state_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def refresh_walk_forward(strat_name: str, strategy: bt.Strategy,
+                         windowset: set, state_path: str,
+                         train_size: int = 500, test_size: int = 125,
+                         pair: str = 'BTC-USD', cash: int = 10000,
+                         timeframe: str = '1D',
+                         start_date: dt.datetime = dt.datetime(
+                             2014,12,1,0,0,0,0,
+                             dt.timezone(dt.timedelta(hours=0))),
+                         end_date: dt.datetime = None,
+                         funding: bool = False):
+    """Bring a walk forward optimization up to date with the data.
+
+    Description
+    ----------
+    Walk forward optimization on anchored_folds that keeps the chosen
+    parameters, the results and the equity of every fold in a state
+    file. When the data has grown since the last refresh, only the
+    folds whose windows changed are computed again: a fold is only
+    retrained if its training data changed, and only tested again if
+    its testing data changed as well. After appending a few candles
+    this is the test of the last fold plus any new fold. Every fold is
+    tested with the starting capital, the stitched equity curve
+    compounds the returns of the folds so that it can be extended
+    without replaying the earlier folds. The state is discarded if the
+    strategy, the parameter sets or the fold sizes changed.
+
+    Parameters:
+    ----------
+    strat_name: string
+        Give the name of the strategy to optimize.
+    strategy: backtrader.Strategy
+        Give the strategy to optimize.
+    windowset: set
+        Give a set of parameter sets for which to optimize the strategy
+        on the training data.
+    state_path: string
+        Give the file to keep the state of the folds in.
+    train_size: int
+        Give the number of bars of a training window.
+    test_size: int
+        Give the number of bars of a testing window.
+    pair: string
+        Give the currency pair to be traded.
+    cash: int
+        Give the amount of starting capital.
+    timeframe: string
+        Give the time frame of the chart to be traded on.
+    start_date: datetime.datetime
+        Give the date where the data starts.
+    end_date: datetime.datetime
+        Give the date where the data ends, all data if None.
+    funding: bool
+        Indicates if funding data should be considered.
+
+    Returns:
+    ----------
+    wfdf: DataFrame
+        The results of the test folds with the chosen parameters.
+    equity: Series
+        The stitched value of the account over all test folds.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    print('Refreshing: ' + strat_name + '\n')
+
+    if end_date is None:
+        end_date = dt.datetime.now(pytz.utc)
+    df, _ = read_data(pair, timeframe, start_date, end_date, funding)
+
+    config = {'strategy': strategy.__name__,
+              'windowset': sorted(windowset),
+              'train_size': train_size, 'test_size': test_size,
+              'pair': pair, 'cash': cash, 'timeframe': timeframe,
+              'start_date': start_date, 'funding': funding,
+              'selection': 'min max DD', 'warmup': True}
+    state = _load_walk_forward_state(state_path, config)
+
+    all_folds = list(anchored_folds(len(df), train_size, test_size))
+    # Folds taken from the state are taken off the planned runs
+    progress = telemetry.SweepTelemetry(
+        strat_name, len(all_folds) * (len(windowset) + 1), 'refresh',
+        'fold 1 of {0}'.format(len(all_folds)))
+
+    folds = OrderedDict()
+    retrained = retested = 0
+    for n, (train, test) in enumerate(all_folds):
+        progress.current = 'fold {0} of {1}'.format(n + 1, len(all_folds))
+        df_train = df.iloc[train[0]:train[-1] + 1]
+        key = (df_train.index[0], df_train.index[-1])
+        fold = state['folds'].get(key)
+        train_hash = _frame_hash(df_train)
+
+        if fold is None or fold['train_hash'] != train_hash:
+            fold = {'params': train_fold(strategy, windowset, df_train, cash,
+                                         progress),
+                    'train_hash': train_hash, 'test_hash': None}
+            retrained += 1
+        else:
+            progress.total -= len(windowset)
+
+        # The warm up bars depend on the parameters, they are hashed
+        # together with the window
+        df_test, warmup = fold_slice(df, test[0], test[-1] + 1,
+                                     _warmup_bars(strategy, fold['params']))
+        test_hash = _frame_hash(df_test)
+
+        if fold['test_hash'] != test_hash:
+            res_dict, fold_equity = test_fold(strategy, fold['params'],
+                                              df_test, cash, warmup)
+            res_dict['params'] = fold['params']
+            res_dict['start_date'] = df_test.index[warmup]
+            res_dict['end_date'] = df_test.index[-1]
+            fold.update(result=res_dict, equity=fold_equity / cash,
+                        test_hash=test_hash)
+            retested += 1
+            progress.update()
+        else:
+            progress.total -= 1
+
+        folds[key] = fold
+
+    state['folds'] = folds
+    _save_walk_forward_state(state_path, state)
+    progress.finish()
+
+    print('Retrained {0} and tested {1} of {2} folds'.format(
+        retrained, retested, len(folds)))
+
+    wfdf = pd.DataFrame([fold['result'] for fold in folds.values()])
+
+    equity = stitch_folds([fold['equity'] for fold in folds.values()], cash)
+
+    return wfdf, equity
+
+
+def run_sweep(strategy: bt.Strategy, par_tuples: list, data,
+              cash: int = 10000, graph=None, maxcpus: int = None,
+              record_dir: str = None, online: bool = True,
+              progress=None):
+    """Run a strategy for every parameter set and collect the metrics.
+
+    Parameters:
+    ----------
+    strategy: backtrader.Strategy
+        Give the strategy to run.
+    par_tuples: list
+        Give the parameter sets to run the strategy with.
+    data: datafeed
+        Give the backtrader data feed to run the strategy on.
+    cash: int
+        Give the amount of starting capital.
+    graph: indicator_graph.IndicatorGraph
+        Give the shared indicator graph of the feed, if the indicators
+        should be taken from it.
+    maxcpus: int
+        Give the number of processes the sweep may use, all available
+        cores if None.
+    record_dir: string
+        Give a directory to stream the fills, trades and account values
+        of every run to, see recorder. Nothing is recorded if None.
+    online: bool
+        Indicate if the metrics are accumulated in constant memory per
+        run, see metrics, instead of by the analyzers of backtrader.
+    progress: telemetry.SweepTelemetry
+        Give the telemetry to count the finished runs in, if any.
+
+    Returns:
+    ----------
+    analysis: DataFrame
+        The number of trades, win rate, sharpe ratio, maximum draw down
+        and net profit of every parameter set, indexed by the
+        parameter sets.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    cerebro_opt = bt.Cerebro(maxcpus=maxcpus)
+    cerebro_opt.adddata(data)
+
+    if graph is not None:
+        cerebro_opt.optstrategy(strategy, par_tuple=par_tuples,
+                                graph=[graph])
+    else:
+        cerebro_opt.optstrategy(strategy, par_tuple=par_tuples)
+
+    if online:
+        cerebro_opt.addanalyzer(metrics.MetricsAnalyzer, _name='metrics')
+    else:
+        cerebro_opt.addanalyzer(bt.analyzers.SharpeRatio, _name='mysharpe')
+        cerebro_opt.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
+        cerebro_opt.addanalyzer(bt.analyzers.AnnualReturn, _name='annual')
+        cerebro_opt.addanalyzer(bt.analyzers.TradeAnalyzer, _name='mytrade')
+    if record_dir is not None:
+        import recorder
+        cerebro_opt.addanalyzer(recorder.RunRecorder, directory=record_dir)
+    if progress is not None:
+        cerebro_opt.addanalyzer(telemetry.WorkerClock)
+        cerebro_opt.optcallback(progress.callback)
+
+    cerebro_opt.broker.setcash(cash)
+    cerebro_opt.broker.setcommission(commission=0.0007)
+
+    thestrats = cerebro_opt.run()
+
+    analysis = pd.DataFrame([run_metrics(thestrat[0])
+                             for thestrat in thestrats],
+                            columns=['# trades', 'win rate', 'sharpe',
+                                     'max DD', 'pnl'],
+                            index=pd.MultiIndex.from_tuples(
+                                [thestrat[0].params.par_tuple
+                                 for thestrat in thestrats]))
+
+    return analysis
+
+
+def run_metrics(thestrat):
+    """Collect the metrics of run_sweep from the analyzers of a run.
+
+    Parameters:
+    ----------
+    thestrat: backtrader.Strategy
+        Give a strategy that ran with the analyzers of run_sweep.
+
+    Returns:
+    ----------
+    metrics: dict
+        The number of trades, win rate, sharpe ratio, maximum draw down
+        and net profit, 0 where an analyzer has no value.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    online = getattr(thestrat.analyzers, 'metrics', None)
+    if online is not None:
+        return online.get_analysis()
+
+    metrics = dict()
+    try:
+        metrics['pnl'] = \
+            thestrat.analyzers.mytrade.get_analysis()['pnl']['net']['total']
+    except:
+        metrics['pnl'] = 0
+    try:
+        metrics['# trades'] = \
+            thestrat.analyzers.mytrade.get_analysis()['total']['total']
+    except:
+        metrics['# trades'] = 0
+    try:
+        metrics['win rate'] = \
+            thestrat.analyzers.mytrade.get_analysis()['won']['total'] / \
+            thestrat.analyzers.mytrade.get_analysis()['total']['total']
+    except:
+        metrics['win rate'] = 0
+    try:
+        metrics['sharpe'] = \
+            thestrat.analyzers.mysharpe.get_analysis()['sharperatio']
+    except:
+        metrics['sharpe'] = 0
+    try:
+        metrics['max DD'] = \
+            thestrat.analyzers.drawdown.get_analysis().max.drawdown
+    except:
+        metrics['max DD'] = 0
+
+    return metrics
+
+
+def rank_results(analysis, method: str = 'drawdown',
+                 k: int = selection.PARETO_KEEP, keep: int = None):
+    """Filter and order the metrics of a sweep by preference.
+
+    Parameters:
+    ----------
+    analysis: DataFrame
+        Give the metrics as returned by run_sweep.
+    method: string
+        Give 'drawdown' to keep the 5 % of the parameter sets with the
+        smallest draw down, or 'pareto' to keep the parameter sets on
+        the best Pareto fronts of profit, sharpe ratio, draw down and
+        number of trades, see selection.
+    k: int
+        Give the number of parameter sets to keep with 'pareto', all
+        if None, which sorts every candidate into a front and is slow
+        for large sweeps.
+    keep: int
+        Give the number of parameter sets to keep with 'drawdown',
+        DRAWDOWN_KEEP of the feasible ones if None, e.g. to rank a
+        subset of a sweep like the whole sweep.
+
+    Returns:
+    ----------
+    analysis: DataFrame
+        The parameter sets that passed the filters, best first.
+
+    Raises:
+    ----------
+    ValueError
+        If the method is unknown.
+    """
+
+    if method == 'pareto':
+        return selection.select(analysis, k)
+    if method != 'drawdown':
+        raise ValueError('Unknown ranking method: ' + method)
+
+    analysis = analysis[selection.feasible(analysis)]
+    if keep is None:
+        keep = max(1, math.floor(len(analysis) * DRAWDOWN_KEEP))
+    analysis = analysis.sort_values(by='max DD', ascending=True)[0:keep]
+
+    return analysis.sort_values(by=['pnl', 'sharpe'], ascending=False,
+                                kind='stable')
+
+
 def optimize(strat_name: str, strategy: bt.Strategy, par_tuples: list,
              pair: str = 'BTC-USD', cash: int = 10000,
              timeframe: str = '1D',
              start_date: dt.datetime = dt.datetime(
                  2014,12,1,0,0,0,0,dt.timezone(dt.timedelta(hours=0))),
              end_date: dt.datetime = dt.datetime.now(pytz.utc),
-             funding: bool =False, plot: bool = False, save: bool = False):
+             funding: bool =False, plot: bool = False, save: bool = False,
+             shared: bool = False, maxcpus: int = None,
+             engine: str = 'backtrader', rank: str = 'drawdown',
+             record_dir: str = None, coarse=None, promote: float = 0.1):
     """Optimize a given strategy on a given set of parameter sets.
 
     Description
@@ -471,83 +1103,84 @@ def optimize(strat_name: str, strategy: bt.Strategy, par_tuples: list,
         Indicate if the result should be plotted or not.
     save: bool
         Indicate if the result should be saved or not.
+    shared: bool
+        Indicate if the indicators should be taken from the shared
+        indicator graph of the feed.
+    maxcpus: int
+        Give the number of processes the sweep may use, all available
+        cores if None.
+    engine: string
+        Give 'backtrader' to run the sweep with cerebro, 'kernel' to
+        run it with the position loop of kernels, which is compiled
+        with numba if it is installed, or 'events' to run it with the
+        event loop of kernels, which jumps from signal to signal. The
+        final run with the chosen parameter set always uses cerebro.
+    rank: string
+        Give the method that ranks the parameter sets, 'drawdown' or
+        'pareto', which keeps the best selection.PARETO_KEEP, see
+        rank_results.
+    record_dir: string
+        Give a directory to stream the fills, trades and account values
+        of every run of the sweep to, only with the backtrader engine.
+        With a coarse screen only the runs on the time frame are
+        recorded.
+    coarse: string or int
+        Give a longer time frame, e.g. '1D', or a number of bars to
+        merge into one, to screen all parameter sets on the coarse
+        series first and only run the best of them on the time frame,
+        see multiresolution.coarse_to_fine. None to run all of them.
+    promote: float
+        Give the fraction of the parameter sets a coarse screen
+        promotes.
 
     Returns:
     ----------
-    Does not return anything.
+    analysis: DataFrame
+        The metrics of the parameter sets that passed the filters in
+        the order of preference.
 
     Raises:
     ----------
-    Does not raise any exceptions.
+    ValueError
+        If the engine or ranking method is unknown.
+    KeyError
+        If the kernel engines or the coarse screen have no description
+        of the strategy.
     """
 
+    if engine not in ('backtrader', 'kernel', 'events'):
+        raise ValueError('Unknown engine: ' + engine)
+
     print('Optimizing: ' + strat_name + '\n')
 
     df, data = read_data(pair=pair, timeframe=timeframe,
                          start_date=start_date, end_date=end_date, funding=funding)
 
-    cerebro_opt = bt.Cerebro()
-    cerebro_opt.adddata(data)
-
-    cerebro_opt.optstrategy(strategy, par_tuple=par_tuples)
-
-    cerebro_opt.addanalyzer(bt.analyzers.SharpeRatio, _name='mysharpe')
-    cerebro_opt.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
-    cerebro_opt.addanalyzer(bt.analyzers.AnnualReturn, _name='annual')
-    cerebro_opt.addanalyzer(bt.analyzers.TradeAnalyzer, _name='mytrade')
-
-    cerebro_opt.broker.setcash(cash)
-    cerebro_opt.broker.setcommission(commission=0.0007)
-
-    thestrats = cerebro_opt.run()
-
-    num_trades = []
-    sharpe = []
-    win_rate = []
-    max_dd = []
-    pnl = []
-    for thestrat in thestrats:
-        try:
-            pnl.append(
-                thestrat[0].analyzers.mytrade.get_analysis()['pnl']['net']['total'])
-        except:
-            pnl.append(0)
-        try:
-            num_trades.append(
-                thestrat[0].analyzers.mytrade.get_analysis()['total']['total'])
-        except:
-            num_trades.append(0)
-        try:
-            win_rate.append(
-                thestrat[0].analyzers.mytrade.get_analysis()['won']['total'] /
-                thestrat[0].analyzers.mytrade.get_analysis()['total']['total'])
-        except:
-            win_rate.append(0)
-        try:
-            sharpe.append(
-                thestrat[0].analyzers.mysharpe.get_analysis()['sharperatio'])
-        except:
-            sharpe.append(0)
-        try:
-            max_dd.append(
-                thestrat[0].analyzers.drawdown.get_analysis().max.drawdown)
-        except:
-            max_dd.append(0)
-
-    analysis = pd.DataFrame({'# trades' : num_trades,
-                            'win rate' : win_rate,
-                            'sharpe' : sharpe,
-                            'max DD' : max_dd,
-                            'pnl' : pnl},
-                            index=pd.MultiIndex.from_tuples(par_tuples))
-
-    analysis = analysis[analysis['# trades'] > 1]
-    analysis = analysis[analysis['sharpe'].notna()]
-    analysis = analysis[analysis['pnl'] >= 1000]
-    analysis = analysis[analysis['sharpe'] >= 0.1]
-    analysis = analysis.sort_values(by='max DD', ascending=True)[0:math.floor(len(analysis*0.05))]
-    analysis.sort_values(by='sharpe', ascending=False, inplace=True)
-    analysis.sort_values(by='pnl', ascending=False, inplace=True)
+    graph = indicator_graph.feed_graph(df) if shared else None
+
+    progress = telemetry.SweepTelemetry(strat_name, len(par_tuples),
+                                        'optimize')
+    if coarse is not None:
+        import multiresolution
+        df_coarse, factor = multiresolution.coarse_series(
+            df, pair, timeframe, coarse, start_date=start_date,
+            end_date=end_date, funding=funding)
+        analysis, report = multiresolution.coarse_to_fine(
+            strategy, par_tuples, df, df_coarse, factor, promote, cash=cash,
+            engine=engine, rank=rank, maxcpus=maxcpus, progress=progress,
+            graph=graph, record_dir=record_dir)
+        print(report)
+    elif engine in ('kernel', 'events'):
+        import kernels
+        analysis = kernels.sweep(strategy.__name__, par_tuples, df, cash=cash,
+                                 events=engine == 'events', progress=progress)
+    else:
+        analysis = run_sweep(strategy, par_tuples, data, cash=cash,
+                             graph=graph, maxcpus=maxcpus,
+                             record_dir=record_dir, progress=progress)
+    progress.finish()
+    if coarse is None:
+        analysis = rank_results(analysis, rank)
 
     print(analysis.head().to_markdown())
 
@@ -559,7 +1192,10 @@ def optimize(strat_name: str, strategy: bt.Strategy, par_tuples: list,
     cerebro_test.addanalyzer(AcctStats)
 
     opt_res = analysis.index[0]
-    cerebro_test.addstrategy(strategy, par_tuple = opt_res)
+    if shared:
+        cerebro_test.addstrategy(strategy, par_tuple=opt_res, graph=graph)
+    else:
+        cerebro_test.addstrategy(strategy, par_tuple = opt_res)
 
     cerebro_test.run()
 
@@ -569,6 +1205,8 @@ def optimize(strat_name: str, strategy: bt.Strategy, par_tuples: list,
         fpath = './plots/' + strat_name
         cerebro_test.saveplots(style='candlestick', volume=False, file_path=fpath)
 
+    return analysis
+
 
 def test_strategy(strat_name: str, strategy: bt.Strategy, par_tuple,
                   pair: str = 'BTC-USD', timeframe: str = '1D',
@@ -577,14 +1215,22 @@ def test_strategy(strat_name: str, strategy: bt.Strategy, par_tuple,
                      2014,12,1,0,0,0,0,dt.timezone(dt.timedelta(hours=0))),
                   end_date: dt.datetime = dt.datetime.now(pytz.utc),
                   funding: bool = False, plot: bool = False,
-                  save: bool = False):
-    """Test and visualize a strategy for a given parameter set."""
+                  save: bool = False, shared: bool = False):
+    """Test and visualize a strategy for a given parameter set.
+
+    Strategies tested back to back on the same feed with ``shared`` set
+    reuse the indicators already computed in the feed's indicator graph.
+    """
 
     df, data = read_data(pair, timeframe, start_date, end_date, funding)
 
     cerebro = bt.Cerebro()
 
-    cerebro.addstrategy(strategy, par_tuple=par_tuple)
+    if shared:
+        cerebro.addstrategy(strategy, par_tuple=par_tuple,
+                            graph=indicator_graph.feed_graph(df))
+    else:
+        cerebro.addstrategy(strategy, par_tuple=par_tuple)
     cerebro.adddata(data)
 
     cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='mysharpe')
@@ -619,4 +1265,6 @@ def test_strategy(strat_name: str, strategy: bt.Strategy, par_tuple,
         cerebro.plot(style='candlestick', volume=False)
     if save:
         fpath = './plots/' + strat_name
-        cerebro.saveplots(style='candlestick', volume=False, file_path=fpath)
\ No newline at end of file
+        cerebro.saveplots(style='candlestick', volume=False, file_path=fpath)
+
+    return stats
@@ -0,0 +1,337 @@
+"""Implements differential tests of the engines that run strategies.
+
+Description
+----------
+Strategies can be run by backtrader with their own indicators, by
+backtrader with the indicators of the shared indicator graph, by the
+position loop of kernels, as plain Python or compiled with numba, and
+by the event loop of kernels that jumps from signal to signal. The
+fast engines are only trusted if they reproduce backtrader. This module
+runs every strategy of main.STRATEGIES on every bundled data set with
+the tuned parameter set of parameters.py and a random sample of its
+windowset through every available engine. It compares the net profit
+of every closed trade, the account value on every bar and the metrics
+optimize ranks by against backtrader within tolerances and times every
+engine, e.g.
+
+    python trendtrader/parity.py --samples 5
+
+from the root of the repository prints the differences and a table of
+the speedup of every engine over backtrader per strategy.
+
+Classes
+----------
+    Implements no classes.
+
+Functions
+----------
+available_engines: list
+    Returns the engines that can run here.
+run_engine: dict
+    Runs a strategy with one parameter set through an engine.
+compare: dict
+    Compares a run with the run of the reference engine.
+parity_report: DataFrame, DataFrame
+    Runs all strategies through all engines and compares them.
+main:
+    Parses the command line arguments and prints the report.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+import argparse
+import random
+import time
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+import indicator_graph
+import kernels
+import main as tasks
+import optimizer
+import scheduler
+
+
+# backtrader with its own indicators is the reference of all others
+ENGINES = ('backtrader', 'graph', 'kernel', 'jit', 'events')
+
+METRICS = ('# trades', 'win rate', 'sharpe', 'max DD', 'pnl')
+
+COMMISSION = 0.0007
+
+
+def available_engines():
+    """Return the engines that can run here, jit needs numba."""
+
+    return [engine for engine in ENGINES
+            if engine != 'jit' or kernels.JIT_AVAILABLE]
+
+
+def _backtrader_run(strategy, par_tuple, df, cash, graph):
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(optimizer.data_feed(df))
+    if graph is None:
+        cerebro.addstrategy(strategy, par_tuple=par_tuple)
+    else:
+        cerebro.addstrategy(strategy, par_tuple=par_tuple, graph=graph)
+
+    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='mysharpe')
+    cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
+    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='mytrade')
+    cerebro.addanalyzer(optimizer.EquityCurve, _name='equity')
+    cerebro.addanalyzer(optimizer.TradeList, _name='trades')
+    cerebro.broker.setcash(cash)
+    cerebro.broker.setcommission(commission=COMMISSION)
+
+    thestrat = cerebro.run()[0]
+    metrics = optimizer.run_metrics(thestrat)
+    if metrics['sharpe'] is None:
+        metrics['sharpe'] = np.nan
+
+    return {'trades': np.array(thestrat.analyzers.trades.get_analysis()['pnl'],
+                               dtype=float),
+            'equity': np.array(
+                thestrat.analyzers.equity.get_analysis()['values'],
+                dtype=float),
+            'metrics': metrics}
+
+
+def run_engine(engine: str, strategy_name: str, par_tuple: tuple, df,
+               cash: float):
+    """Run a strategy with one parameter set through an engine.
+
+    Parameters:
+    ----------
+    engine: string
+        Give one of ENGINES.
+    strategy_name: string
+        Give the class name of the strategy in strategies.py.
+    par_tuple: tuple
+        Give the parameter set of the strategy.
+    df: DataFrame
+        Give the data as returned by optimizer.read_data.
+    cash: float
+        Give the amount of starting capital.
+
+    Returns:
+    ----------
+    run: dict
+        The net profit of every closed trade, the account value on
+        every bar and the metrics of run_sweep.
+
+    Raises:
+    ----------
+    ValueError
+        If the engine is unknown.
+    KeyError
+        If a fast engine has no description of the strategy.
+    """
+
+    if engine in ('backtrader', 'graph'):
+        import strategies
+
+        graph = indicator_graph.feed_graph(df) if engine == 'graph' else None
+        return _backtrader_run(getattr(strategies, strategy_name), par_tuple,
+                               df, cash, graph)
+    if engine not in ('kernel', 'jit', 'events'):
+        raise ValueError('Unknown engine: ' + engine)
+
+    run = kernels.run_strategy(indicator_graph.feed_graph(df), strategy_name,
+                               par_tuple, cash, COMMISSION, engine != 'kernel',
+                               engine == 'events')
+    return {'trades': run['pnl'], 'equity': run['values'],
+            'metrics': kernels.run_metrics(run, df.index.year.values, cash)}
+
+
+def _difference(a, b, atol, rtol):
+    """Return the largest difference of a and b in units of the tolerance."""
+
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    if a.shape != b.shape:
+        return np.inf
+    if not len(a):
+        return 0.0
+
+    nan = np.isnan(a) | np.isnan(b)
+    if np.any(np.isnan(a) != np.isnan(b)):
+        return np.inf
+
+    tolerance = atol + rtol * np.abs(b[~nan])
+    return float(np.max(np.abs(a[~nan] - b[~nan]) / tolerance, initial=0.0))
+
+
+def compare(run: dict, reference: dict, atol: float = 1e-6,
+            rtol: float = 1e-9):
+    """Compare a run with the run of the reference engine.
+
+    Parameters:
+    ----------
+    run: dict
+        Give the run to check, as returned by run_engine.
+    reference: dict
+        Give the run of the reference engine.
+    atol: float
+        Give the absolute tolerance.
+    rtol: float
+        Give the tolerance relative to the reference.
+
+    Returns:
+    ----------
+    differences: dict
+        The largest difference of the trades, the equity curve and
+        every metric in units of the tolerance, inf if the number of
+        trades or bars differs, and whether all are within tolerance.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    # Analyzers may start recording after the warm up, compare the bars
+    # both engines recorded
+    bars = min(len(run['equity']), len(reference['equity']))
+    differences = {
+        'trades': _difference(run['trades'], reference['trades'], atol, rtol),
+        'equity': _difference(run['equity'][len(run['equity']) - bars:],
+                              reference['equity'][
+                                  len(reference['equity']) - bars:],
+                              atol, rtol)}
+    for metric in METRICS:
+        differences[metric] = _difference([run['metrics'][metric]],
+                                          [reference['metrics'][metric]],
+                                          atol, rtol)
+    differences['ok'] = all(value <= 1.0 for value in differences.values())
+
+    return differences
+
+
+def parity_report(labels: list = None, pairs: tuple = ('BTC-USD', 'ETH-USD'),
+                  timeframes: tuple = ('1D', '8H'), samples: int = 5,
+                  engines: list = None, seed: int = 0, atol: float = 1e-6,
+                  rtol: float = 1e-9):
+    """Run all strategies through all engines and compare them.
+
+    Parameters:
+    ----------
+    labels: list
+        Give the labels of main.STRATEGIES to check, all if None.
+    pairs: tuple
+        Give the currency pairs whose data is used.
+    timeframes: tuple
+        Give the time frames whose data is used.
+    samples: int
+        Give the number of parameter sets drawn from the windowset of
+        every strategy in addition to the tuned one.
+    engines: list
+        Give the engines to compare with backtrader, all available ones
+        if None.
+    seed: int
+        Give the seed of the random windowsets.
+    atol: float
+        Give the absolute tolerance.
+    rtol: float
+        Give the tolerance relative to backtrader.
+
+    Returns:
+    ----------
+    differences: DataFrame
+        For every strategy, data set, parameter set and engine the
+        differences to backtrader, see compare.
+    speed: DataFrame
+        The seconds every engine took per strategy and its speedup over
+        backtrader.
+
+    Raises:
+    ----------
+    ValueError
+        If a label is unknown.
+    """
+
+    engines = [engine for engine in (engines or available_engines())
+               if engine != 'backtrader']
+    random.seed(seed)
+
+    if kernels.JIT_AVAILABLE and ('jit' in engines or 'events' in engines):
+        # Compile the kernels before they are timed
+        bars = np.ones(2)
+        kernels.position_loop(bars, bars, bars > 0, bars > 0, 1, 0, 1.0,
+                              COMMISSION, np.empty(2), np.empty(2))
+        signals = np.arange(2)
+        kernels.event_loop(bars, bars, signals, signals, 1, 1.0, COMMISSION,
+                           np.empty(4, dtype=np.int64), np.empty((4, 3)),
+                           np.empty(2))
+        kernels.fill_values(bars, 1.0, signals, np.ones((2, 3)), np.empty(2))
+
+    rows = list()
+    seconds = dict()
+    for label in tasks.select(labels):
+        strategy_name, _, _, funding, _ = tasks.STRATEGIES[label]
+        get_parameters = tasks.parameter_getter(label)
+        windowset = sorted(tasks.windowset(label))
+
+        for pair in pairs:
+            for timeframe in timeframes:
+                df, _ = optimizer.read_data(pair, timeframe, funding=funding)
+                cash = scheduler.DEFAULT_CASH[pair]
+                par_tuples = [tuple(get_parameters(pair, timeframe))] \
+                    + random.sample(windowset, samples)
+
+                for par_tuple in par_tuples:
+                    runs = dict()
+                    for engine in ['backtrader'] + engines:
+                        start = time.perf_counter()
+                        runs[engine] = run_engine(engine, strategy_name,
+                                                  par_tuple, df, cash)
+                        seconds[(label, engine)] = \
+                            seconds.get((label, engine), 0.0) \
+                            + time.perf_counter() - start
+
+                    for engine in engines:
+                        row = {'strategy': label, 'pair': pair,
+                               'timeframe': timeframe, 'params': par_tuple,
+                               'engine': engine}
+                        row.update(compare(runs[engine], runs['backtrader'],
+                                           atol, rtol))
+                        rows.append(row)
+
+    speed = pd.Series(seconds).unstack()
+    speed = pd.concat(
+        [speed, speed[engines].rdiv(speed['backtrader'], axis=0)
+         .add_suffix(' speedup')], axis=1)
+
+    return pd.DataFrame(rows), speed
+
+
+def main(argv: list = None):
+    """Parse the command line arguments and print the report."""
+
+    parser = argparse.ArgumentParser(
+        description='Compare the engines that run strategies.')
+    parser.add_argument('--strategy', nargs='+', choices=tasks.STRATEGIES)
+    parser.add_argument('--pair', nargs='+', default=('BTC-USD', 'ETH-USD'))
+    parser.add_argument('--timeframe', nargs='+', default=('1D', '8H'))
+    parser.add_argument('--samples', type=int, default=5)
+    parser.add_argument('--engine', nargs='+', choices=ENGINES)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    differences, speed = parity_report(args.strategy, args.pair,
+                                       args.timeframe, args.samples,
+                                       args.engine, args.seed)
+
+    failed = differences[~differences['ok']]
+    print(differences.groupby(['strategy', 'engine'])['ok']
+          .agg(['sum', 'count']).to_markdown())
+    if len(failed):
+        print(failed.to_markdown())
+    print(speed.to_markdown(floatfmt='.2f'))
+
+    return 1 if len(failed) else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
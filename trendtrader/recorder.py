@@ -0,0 +1,237 @@
+"""Implements a streaming recorder of fills, trades and equity of runs.
+
+Description
+----------
+TradeAnalyzer and the observers keep everything in memory until a run
+ends and a sweep only keeps their summary. The RunRecorder analyzer
+instead streams the fills, the closed trades and samples of the account
+value of a run into a columnar file while the run is going. Rows are
+buffered up to a batch size and then written as one record batch of an
+Arrow IPC file or one row group of a Parquet file, so the memory of a
+run stays bounded no matter how long it is.
+
+Every run writes its own file, named after the strategy and its
+parameter set, so runs in different worker processes never share a
+file. read_records reads the files of thousands of runs back as one
+DataFrame without running any of them again.
+
+Recording needs pyarrow, which is only imported when it is installed.
+
+Classes
+----------
+RunRecorder: Inherits from Analyzer
+    Streams the fills, trades and equity samples of a run to a file.
+
+Functions
+----------
+run_id: string
+    Returns the name of the file of a run.
+read_records: DataFrame
+    Reads the recorded rows of many runs.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+import os
+
+import backtrader as bt
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+FORMATS = {'arrow': '.arrow', 'parquet': '.parquet'}
+
+# Kinds of rows, a fill of an order, a closed trade or an equity sample
+KINDS = ('fill', 'trade', 'equity')
+
+
+def _schema():
+    return pa.schema([('run', pa.string()),
+                      ('kind', pa.string()),
+                      ('time', pa.timestamp('us')),
+                      ('size', pa.float64()),
+                      ('price', pa.float64()),
+                      ('value', pa.float64()),
+                      ('pnl', pa.float64()),
+                      ('commission', pa.float64()),
+                      ('bars', pa.int64())])
+
+
+def run_id(strategy_name: str, par_tuple: tuple):
+    """Return the name of the file of a run.
+
+    Parameters:
+    ----------
+    strategy_name: string
+        Give the class name of the strategy.
+    par_tuple: tuple
+        Give the parameter set of the run.
+
+    Returns:
+    ----------
+    run: string
+        The strategy name and the parameters joined by underscores.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    return '_'.join([strategy_name] + [str(par) for par in par_tuple])
+
+
+class RunRecorder(bt.Analyzer):
+    """Streams the fills, trades and equity samples of a run to a file.
+
+    Parameters
+    ----------
+    directory : string
+        The directory the file of the run is written to.
+    format : string
+        'arrow' for an Arrow IPC file or 'parquet' for a Parquet file.
+    run : string
+        The name of the run, from the strategy and its parameter set
+        if None, see run_id.
+    equity_every : int
+        The number of bars between two samples of the account value.
+    batch_size : int
+        The number of rows buffered before they are written.
+    """
+
+    params = (('directory', './records'),
+              ('format', 'arrow'),
+              ('run', None),
+              ('equity_every', 1),
+              ('batch_size', 4096))
+
+    def start(self):
+        if pa is None:
+            raise ImportError('Recording runs needs pyarrow')
+        if self.p.format not in FORMATS:
+            raise ValueError('Unknown format: ' + self.p.format)
+
+        self.run = self.p.run
+        if self.run is None:
+            self.run = run_id(type(self.strategy).__name__,
+                              self.strategy.p.par_tuple)
+
+        os.makedirs(self.p.directory, exist_ok=True)
+        self.path = os.path.join(self.p.directory,
+                                 self.run + FORMATS[self.p.format])
+        self.schema = _schema()
+        if self.p.format == 'parquet':
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        else:
+            self.writer = pa.ipc.new_file(self.path, self.schema)
+
+        self.rows = {name: list() for name in self.schema.names}
+        self.buffered = 0
+        self.written = 0
+        self.bars = 0
+
+    def _append(self, kind, time, size=None, price=None, value=None,
+                pnl=None, commission=None, bars=None):
+        row = (self.run, kind, time, size, price, value, pnl, commission,
+               bars)
+        for name, item in zip(self.schema.names, row):
+            self.rows[name].append(item)
+
+        self.buffered += 1
+        if self.buffered >= self.p.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self.buffered:
+            return
+
+        batch = pa.record_batch([self.rows[name]
+                                 for name in self.schema.names],
+                                schema=self.schema)
+        if self.p.format == 'parquet':
+            self.writer.write_batch(batch)
+        else:
+            self.writer.write(batch)
+
+        self.written += self.buffered
+        self.buffered = 0
+        for rows in self.rows.values():
+            rows.clear()
+
+    def notify_order(self, order):
+        if order.status == order.Completed:
+            self._append('fill', bt.num2date(order.executed.dt),
+                         size=order.executed.size,
+                         price=order.executed.price,
+                         value=order.executed.value,
+                         commission=order.executed.comm)
+
+    def notify_trade(self, trade):
+        if trade.isclosed:
+            self._append('trade', bt.num2date(trade.dtclose),
+                         price=trade.price, value=trade.value,
+                         pnl=trade.pnlcomm, commission=trade.commission,
+                         bars=trade.barlen)
+
+    def next(self):
+        if self.bars % self.p.equity_every == 0:
+            self._append('equity', self.strategy.datetime.datetime(0),
+                         size=self.strategy.position.size,
+                         price=self.strategy.data.close[0],
+                         value=self.strategy.broker.get_value())
+        self.bars += 1
+
+    def stop(self):
+        self._flush()
+        self.writer.close()
+        # Writers cannot be pickled back from worker processes
+        self.writer = None
+        self.rows = None
+
+    def get_analysis(self):
+        return {'path': self.path, 'rows': self.written}
+
+
+def read_records(directory: str, kind: str = None, columns: list = None,
+                 format: str = 'arrow'):
+    """Read the recorded rows of many runs.
+
+    Parameters:
+    ----------
+    directory: string
+        Give the directory the runs were recorded to.
+    kind: string
+        Give 'fill', 'trade' or 'equity' to read only rows of that
+        kind, all rows if None.
+    columns: list
+        Give the columns to read, all if None.
+    format: string
+        Give the format the runs were recorded in.
+
+    Returns:
+    ----------
+    records: DataFrame
+        The rows of all runs in the directory.
+
+    Raises:
+    ----------
+    ImportError
+        If pyarrow is not installed.
+    """
+
+    if pa is None:
+        raise ImportError('Reading recorded runs needs pyarrow')
+
+    dataset = ds.dataset(directory, format='ipc' if format == 'arrow'
+                         else format)
+    table = dataset.to_table(
+        columns=columns,
+        filter=None if kind is None else ds.field('kind') == kind)
+
+    return table.to_pandas()
@@ -0,0 +1,483 @@
+"""Implements Monte Carlo robustness checks for chosen parameter sets.
+
+Description
+----------
+Checks whether the Sharpe ratio, maximum draw down and profit of a
+parameter set hold up when the history is perturbed. A run is resampled
+thousands of times, either by a circular block bootstrap of its per
+bar returns or by shuffling and resampling its trades, and the metrics
+of all resamples are computed as one array computation. The resulting
+distributions are summarized as confidence intervals. Many candidates,
+e.g. the top parameter sets of a sweep, are checked in parallel.
+
+Classes
+----------
+    Implements no classes.
+
+Functions
+----------
+block_bootstrap: ndarray
+    Draws circular block bootstrap resamples of a return series.
+shuffle_trades: ndarray
+    Draws reordered or resampled sequences of trades.
+returns_metrics: dict
+    Computes Sharpe ratio, maximum draw down and profit of resampled
+    return series.
+trade_returns: ndarray
+    Converts the profits of consecutive trades into trade returns.
+trades_metrics: dict
+    Computes Sharpe ratio, maximum draw down and profit of resampled
+    trade sequences.
+confidence_intervals: DataFrame
+    Summarizes resampled metrics as confidence intervals.
+analyze_returns: DataFrame
+    Block bootstraps a return series and returns confidence intervals.
+analyze_trades: DataFrame
+    Resamples a trade list and returns confidence intervals.
+run_candidates: dict
+    Runs parameter sets in backtrader and records their returns and
+    trades.
+stress_test: DataFrame
+    Runs the robustness check for many candidates in parallel.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import math
+
+import numpy as np
+import pandas as pd
+
+
+# Resamples computed at once, bounds the memory of one computation
+CHUNK_SIZE = 1000
+
+
+def block_bootstrap(returns, n_samples: int = 1000, block_size: int = 10,
+                    seed: int = None):
+    """Draw circular block bootstrap resamples of a return series.
+
+    Parameters:
+    ----------
+    returns: array-like
+        Give the per bar returns of a run.
+    n_samples: int
+        Give the number of resamples to draw.
+    block_size: int
+        Give the number of consecutive bars that are drawn together to
+        preserve autocorrelation.
+    seed: int
+        Give the seed of the random number generator.
+
+    Returns:
+    ----------
+    samples: ndarray
+        An array of shape (n_samples, len(returns)) with the resampled
+        returns.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    returns = np.asarray(returns, dtype=float)
+    n_bars = len(returns)
+    block_size = max(1, min(int(block_size), n_bars))
+    n_blocks = -(-n_bars // block_size)
+
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, n_bars, size=(n_samples, n_blocks, 1))
+    idx = (starts + np.arange(block_size)).reshape(n_samples, -1)[:, :n_bars]
+
+    return returns[idx % n_bars]
+
+
+def shuffle_trades(pnl, n_samples: int = 1000, replace: bool = False,
+                   seed: int = None):
+    """Draw reordered or resampled sequences of trades.
+
+    Description
+    ----------
+    Without replacement every sample holds the same trades in a random
+    order, which leaves the compounded profit unchanged but varies the
+    draw down.
+    With replacement the trades are drawn with replacement, which also
+    varies the profit.
+
+    Parameters:
+    ----------
+    pnl: array-like
+        Give the profit or return of every trade of a run.
+    n_samples: int
+        Give the number of samples to draw.
+    replace: bool
+        Indicate if trades are drawn with replacement.
+    seed: int
+        Give the seed of the random number generator.
+
+    Returns:
+    ----------
+    samples: ndarray
+        An array of shape (n_samples, len(pnl)) with the trades.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    pnl = np.asarray(pnl, dtype=float)
+    rng = np.random.default_rng(seed)
+    if replace:
+        idx = rng.integers(0, len(pnl), size=(n_samples, len(pnl)))
+    else:
+        idx = rng.random((n_samples, len(pnl))).argsort(axis=1)
+
+    return pnl[idx]
+
+
+def _max_drawdown(equity):
+    """Maximum draw down in percent of every row of equity curves."""
+
+    peak = np.maximum.accumulate(equity, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = np.where(peak > 0, 1.0 - equity / peak, 0.0)
+
+    return 100.0 * drawdown.max(axis=1)
+
+
+def _sharpe(returns, periods_per_year: float):
+    """Annualized Sharpe ratio of every row of return series."""
+
+    std = returns.std(axis=1, ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = returns.mean(axis=1) / std * math.sqrt(periods_per_year)
+
+    return np.where(std > 0, sharpe, np.nan)
+
+
+def returns_metrics(samples, cash: float = 10000,
+                    periods_per_year: float = 365):
+    """Compute the metrics of resampled return series.
+
+    Parameters:
+    ----------
+    samples: ndarray
+        Give the resampled per bar returns, one sample per row.
+    cash: float
+        Give the amount of starting capital.
+    periods_per_year: float
+        Give the number of bars per year to annualize the Sharpe ratio,
+        365 for daily and 1095 for 8 hour bars.
+
+    Returns:
+    ----------
+    metrics: dict
+        Arrays with the sharpe ratio, the maximum draw down in percent
+        and the net profit of every sample.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    equity = cash * np.cumprod(1.0 + samples, axis=1)
+
+    return {'sharpe': _sharpe(samples, periods_per_year),
+            'max DD': _max_drawdown(equity),
+            'pnl': equity[:, -1] - cash}
+
+
+def trade_returns(pnl, cash: float = 10000):
+    """Convert the profits of consecutive trades into trade returns.
+
+    Description
+    ----------
+    The strategies size every trade with the whole account, so a trade
+    is resampled as its return on the equity before the trade rather
+    than as its absolute profit.
+
+    Parameters:
+    ----------
+    pnl: array-like
+        Give the net profit of every trade of a run in order.
+    cash: float
+        Give the amount of starting capital.
+
+    Returns:
+    ----------
+    returns: ndarray
+        The return of every trade.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    pnl = np.asarray(pnl, dtype=float)
+    equity = cash + np.concatenate(([0.0], np.cumsum(pnl)[:-1]))
+
+    return pnl / equity
+
+
+def trades_metrics(samples, cash: float = 10000):
+    """Compute the metrics of resampled trade sequences.
+
+    Description
+    ----------
+    The equity is only observed at the trade exits, so the draw down is
+    the draw down between closed trades. The Sharpe ratio is computed
+    per trade and not annualized.
+
+    Parameters:
+    ----------
+    samples: ndarray
+        Give the resampled trade returns, one sample per row.
+    cash: float
+        Give the amount of starting capital.
+
+    Returns:
+    ----------
+    metrics: dict
+        Arrays with the sharpe ratio, the maximum draw down in percent
+        and the net profit of every sample.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    equity = cash * np.cumprod(1.0 + samples, axis=1)
+    equity = np.concatenate((np.full((len(samples), 1), float(cash)),
+                             equity), axis=1)
+
+    return {'sharpe': _sharpe(samples, 1),
+            'max DD': _max_drawdown(equity),
+            'pnl': equity[:, -1] - cash}
+
+
+def confidence_intervals(metrics: dict, alpha: float = 0.05):
+    """Summarize resampled metrics as confidence intervals.
+
+    Parameters:
+    ----------
+    metrics: dict
+        Give arrays of resampled values keyed by metric.
+    alpha: float
+        Give the probability mass outside of the interval.
+
+    Returns:
+    ----------
+    intervals: DataFrame
+        The lower bound, median and upper bound of every metric.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    quantiles = (alpha / 2, 0.5, 1 - alpha / 2)
+    return pd.DataFrame({name: np.nanquantile(values, quantiles)
+                         for name, values in metrics.items()},
+                        index=['low', 'median', 'high']).T
+
+
+def _chunked(draw, measure, n_samples: int, seed: int):
+    """Draw and measure samples in chunks to bound the memory."""
+
+    seeds = np.random.SeedSequence(seed).spawn(
+        max(1, -(-n_samples // CHUNK_SIZE)))
+    parts = list()
+    for i, chunk_seed in enumerate(seeds):
+        size = min(CHUNK_SIZE, n_samples - i * CHUNK_SIZE)
+        parts.append(measure(draw(size, chunk_seed)))
+
+    return {name: np.concatenate([part[name] for part in parts])
+            for name in parts[0]}
+
+
+def analyze_returns(returns, cash: float = 10000, n_samples: int = 5000,
+                    block_size: int = 10, periods_per_year: float = 365,
+                    alpha: float = 0.05, seed: int = None):
+    """Block bootstrap a return series and return confidence intervals.
+
+    Parameters:
+    ----------
+    returns: array-like
+        Give the per bar returns of a run.
+    cash: float
+        Give the amount of starting capital.
+    n_samples: int
+        Give the number of resamples to draw.
+    block_size: int
+        Give the number of consecutive bars drawn together.
+    periods_per_year: float
+        Give the number of bars per year.
+    alpha: float
+        Give the probability mass outside of the intervals.
+    seed: int
+        Give the seed of the random number generator.
+
+    Returns:
+    ----------
+    intervals: DataFrame
+        The confidence intervals of the Sharpe ratio, the maximum draw
+        down and the net profit.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    metrics = _chunked(
+        lambda size, s: block_bootstrap(returns, size, block_size, s),
+        lambda samples: returns_metrics(samples, cash, periods_per_year),
+        n_samples, seed)
+
+    return confidence_intervals(metrics, alpha)
+
+
+def analyze_trades(pnl, cash: float = 10000, n_samples: int = 5000,
+                   replace: bool = True, alpha: float = 0.05,
+                   seed: int = None):
+    """Resample a trade list and return confidence intervals.
+
+    Parameters:
+    ----------
+    pnl: array-like
+        Give the net profit of every trade of a run.
+    cash: float
+        Give the amount of starting capital.
+    n_samples: int
+        Give the number of samples to draw.
+    replace: bool
+        Indicate if trades are drawn with replacement or only shuffled.
+    alpha: float
+        Give the probability mass outside of the intervals.
+    seed: int
+        Give the seed of the random number generator.
+
+    Returns:
+    ----------
+    intervals: DataFrame
+        The confidence intervals of the Sharpe ratio, the maximum draw
+        down and the net profit.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    returns = trade_returns(pnl, cash)
+    metrics = _chunked(
+        lambda size, s: shuffle_trades(returns, size, replace, s),
+        lambda samples: trades_metrics(samples, cash),
+        n_samples, seed)
+
+    return confidence_intervals(metrics, alpha)
+
+
+def run_candidates(strategy, par_tuples: list, data, cash: int = 10000):
+    """Run parameter sets and record their per bar returns and trades.
+
+    Parameters:
+    ----------
+    strategy: backtrader.Strategy
+        Give the strategy to run.
+    par_tuples: list
+        Give the parameter sets to run, e.g. analysis.index[:10] of an
+        optimization.
+    data: datafeed
+        Give the backtrader data feed to run on.
+    cash: int
+        Give the amount of starting capital.
+
+    Returns:
+    ----------
+    runs: dict
+        A dict with the per bar 'returns' and the 'trades' profits of
+        every parameter set, keyed by the parameter set.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    import backtrader as bt
+
+    import optimizer
+
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(data)
+    cerebro.optstrategy(strategy, par_tuple=list(par_tuples))
+    cerebro.addanalyzer(optimizer.EquityCurve, _name='equity')
+    cerebro.addanalyzer(optimizer.TradeList, _name='trades')
+    cerebro.broker.setcash(cash)
+    cerebro.broker.setcommission(commission=0.0007)
+
+    runs = dict()
+    for run in cerebro.run():
+        values = np.asarray(run[0].analyzers.equity.get_analysis()['values'])
+        returns = np.diff(np.concatenate(([cash], values))) \
+            / np.concatenate(([cash], values[:-1]))
+        runs[tuple(run[0].params.par_tuple)] = {
+            'returns': returns,
+            'trades': np.asarray(run[0].analyzers.trades.get_analysis()['pnl'])}
+
+    return runs
+
+
+def _analyze_candidate(args):
+    name, run, method, kwargs = args
+    if method == 'trades':
+        intervals = analyze_trades(run['trades'], **kwargs)
+    else:
+        intervals = analyze_returns(run['returns'], **kwargs)
+    intervals.index = pd.MultiIndex.from_product([[name], intervals.index])
+
+    return intervals
+
+
+def stress_test(runs: dict, method: str = 'returns', maxcpus: int = None,
+                **kwargs):
+    """Run the robustness check for many candidates in parallel.
+
+    Parameters:
+    ----------
+    runs: dict
+        Give the runs of the candidates as returned by run_candidates.
+    method: string
+        Give 'returns' to block bootstrap the per bar returns or
+        'trades' to resample the trades.
+    maxcpus: int
+        Give the number of processes to use, all available cores if
+        None.
+    kwargs:
+        Give further arguments of analyze_returns or analyze_trades.
+
+    Returns:
+    ----------
+    intervals: DataFrame
+        The confidence intervals of every candidate, indexed by the
+        candidate and the metric.
+
+    Raises:
+    ----------
+    ValueError
+        If the method is unknown.
+    """
+
+    if method not in ('returns', 'trades'):
+        raise ValueError("Unknown resampling method: " + str(method))
+
+    tasks = [(name, run, method, kwargs) for name, run in runs.items()
+             if len(run[method]) > 1]
+    if maxcpus == 1 or len(tasks) < 2:
+        results = [_analyze_candidate(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=maxcpus) as pool:
+            results = list(pool.map(_analyze_candidate, tasks))
+
+    return pd.concat(results) if results else pd.DataFrame()
@@ -0,0 +1,230 @@
+"""Implements rolling window primitives in amortized constant time.
+
+Description
+----------
+Highest, Lowest, AroonUp, AroonDown and the standard deviation of
+StcVol look at every value of their window on every bar. The
+primitives of this module update in amortized constant time per bar
+instead, no matter the length of the window:
+
+    The rolling maximum and minimum and the number of bars since them
+    keep a monotonic deque of the positions that can still become the
+    extreme of a later window. Every position enters and leaves the
+    deque once. Ties go to the most recent position like FindFirstIndex
+    of backtrader.
+
+    The rolling variance updates the mean and the sum of squared
+    deviations of the window with the value that enters and the value
+    that leaves it, after Welford.
+
+Every primitive comes as a batch function over an array, compiled with
+numba when it is installed, and as a streaming state that takes one
+value per bar, for feeds that grow bar by bar. Both give NaN until the
+window is full.
+
+Classes
+----------
+RollingExtreme:
+    Streams the maximum or minimum of a window and the bars since it.
+RollingVariance:
+    Streams the population variance of a window.
+
+Functions
+----------
+rolling_max, rolling_min: ndarray
+    Return the maximum or minimum of every window.
+rolling_argmax, rolling_argmin: ndarray
+    Return the number of bars since the maximum or minimum of every
+    window.
+rolling_var, rolling_std: ndarray
+    Return the population variance or standard deviation of every
+    window.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+from collections import deque
+import math
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+JIT_AVAILABLE = numba is not None
+
+
+def _jit(func):
+    if numba is None:
+        return func
+    return numba.njit(cache=True, nogil=True)(func)
+
+
+@_jit
+def _extremes(values, period, maximum, extreme, since):
+    # Positions in a ring buffer of the length of the window, the
+    # front holds the extreme of the current window
+    positions = np.empty(period, dtype=np.int64)
+    head = 0
+    size = 0
+    for i in range(len(values)):
+        if size > 0 and positions[head] <= i - period:
+            head = (head + 1) % period
+            size -= 1
+
+        value = values[i]
+        while size > 0:
+            back = values[positions[(head + size - 1) % period]]
+            if (back <= value) if maximum else (back >= value):
+                size -= 1
+            else:
+                break
+        positions[(head + size) % period] = i
+        size += 1
+
+        if i >= period - 1:
+            extreme[i] = values[positions[head]]
+            since[i] = i - positions[head]
+
+
+def _rolling_extremes(values, period, maximum):
+    values = np.ascontiguousarray(values, dtype=float)
+    period = int(period)
+    extreme = np.full(len(values), np.nan)
+    since = np.full(len(values), np.nan)
+    _extremes(values, period, maximum, extreme, since)
+
+    return extreme, since
+
+
+def rolling_max(values, period: int):
+    """Return the maximum of every window of period values."""
+
+    return _rolling_extremes(values, period, True)[0]
+
+
+def rolling_min(values, period: int):
+    """Return the minimum of every window of period values."""
+
+    return _rolling_extremes(values, period, False)[0]
+
+
+def rolling_argmax(values, period: int):
+    """Return the bars since the maximum of every window, 0 is now."""
+
+    return _rolling_extremes(values, period, True)[1]
+
+
+def rolling_argmin(values, period: int):
+    """Return the bars since the minimum of every window, 0 is now."""
+
+    return _rolling_extremes(values, period, False)[1]
+
+
+@_jit
+def _variances(values, period, out):
+    mean = 0.0
+    squares = 0.0
+    for i in range(len(values)):
+        value = values[i]
+        if i < period:
+            delta = value - mean
+            mean += delta / (i + 1)
+            squares += delta * (value - mean)
+        else:
+            old = values[i - period]
+            last = mean
+            mean += (value - old) / period
+            squares += (value - old) * (value - mean + old - last)
+
+        if i >= period - 1:
+            out[i] = max(squares, 0.0) / period
+
+
+def rolling_var(values, period: int):
+    """Return the population variance of every window of period values."""
+
+    values = np.ascontiguousarray(values, dtype=float)
+    out = np.full(len(values), np.nan)
+    _variances(values, int(period), out)
+
+    return out
+
+
+def rolling_std(values, period: int):
+    """Return the population standard deviation of every window."""
+
+    return np.sqrt(rolling_var(values, period))
+
+
+class RollingExtreme:
+    """Streams the maximum or minimum of a window and the bars since it.
+
+    Parameters:
+    ----------
+    period: int
+        Give the number of values in the window.
+    maximum: bool
+        Indicate if the maximum or the minimum is tracked.
+    """
+
+    def __init__(self, period: int, maximum: bool = True):
+        self.period = int(period)
+        self.maximum = maximum
+        self.count = 0
+        self.window = deque()
+
+    def update(self, value: float):
+        """Add the value of a bar and return (extreme, bars since it)."""
+
+        position = self.count
+        self.count += 1
+        if self.window and self.window[0][0] <= position - self.period:
+            self.window.popleft()
+        while self.window and (self.window[-1][1] <= value if self.maximum
+                               else self.window[-1][1] >= value):
+            self.window.pop()
+        self.window.append((position, value))
+
+        if self.count < self.period:
+            return math.nan, math.nan
+        return self.window[0][1], position - self.window[0][0]
+
+
+class RollingVariance:
+    """Streams the population variance of a window.
+
+    Parameters:
+    ----------
+    period: int
+        Give the number of values in the window.
+    """
+
+    def __init__(self, period: int):
+        self.period = int(period)
+        self.window = deque()
+        self.mean = 0.0
+        self.squares = 0.0
+
+    def update(self, value: float):
+        """Add the value of a bar and return the variance of the window."""
+
+        self.window.append(value)
+        if len(self.window) <= self.period:
+            delta = value - self.mean
+            self.mean += delta / len(self.window)
+            self.squares += delta * (value - self.mean)
+        else:
+            old = self.window.popleft()
+            last = self.mean
+            self.mean += (value - old) / self.period
+            self.squares += (value - old) * (value - self.mean + old - last)
+
+        if len(self.window) < self.period:
+            return math.nan
+        return max(self.squares, 0.0) / self.period
@@ -0,0 +1,336 @@
+"""Implements a resumable job runner for optimization runs.
+
+Description
+----------
+Expands specifications of strategies, pairs, timeframes, start dates
+and funding into jobs for optimization, walk forward optimization or
+testing, and runs them concurrently under one CPU budget. Every
+finished job is checkpointed to disk so that an interrupted run
+resumes with the jobs that were still missing. The jobs with the
+highest estimated cost are started first so that the long runs do not
+end up as stragglers.
+
+Classes
+----------
+Job: Inherits from namedtuple
+    Represents one run of optimize, walk_forward or test_strategy.
+
+Functions
+----------
+expand_jobs: list
+    Expands strategy specifications into jobs for every pair and
+    timeframe.
+estimate_cost: float
+    Estimates the relative cost of a job.
+run_job:
+    Runs a single job.
+run_jobs: dict
+    Runs a list of jobs concurrently with checkpointing.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import datetime as dt
+import os
+import pickle
+import time
+import traceback
+
+import optimizer
+import telemetry
+
+
+Job = namedtuple('Job', ('name', 'kind', 'strategy', 'params', 'pair',
+                         'timeframe', 'cash', 'start_date', 'funding',
+                         'walk_forward_strategy', 'save'))
+
+# Relative cost of evaluating one bar of a strategy
+STRATEGY_WEIGHTS = {'SMAC': 1.0,
+                    'Stc': 3.0,
+                    'AroonStc': 4.0,
+                    'StcSmaShort': 3.5,
+                    'StcVol': 4.0,
+                    'DRSIDMALong': 5.0,
+                    'DRSIDMAShort': 5.0}
+
+DEFAULT_CASH = {'BTC-USD': 100000, 'ETH-USD': 10000}
+
+
+def expand_jobs(kind: str, specs: list,
+                pairs: tuple = ('BTC-USD', 'ETH-USD'),
+                timeframes: tuple = ('1D', '8H'),
+                start_dates: dict = None, cash: dict = None,
+                save: bool = True):
+    """Expand strategy specifications into jobs.
+
+    Description
+    ----------
+    Create one job for every combination of specification, pair and
+    timeframe. The job is named after the label of the specification,
+    the coin and the timeframe, e.g. ``SMAC_BTC_1D``.
+
+    Parameters:
+    ----------
+    kind: string
+        Give the kind of the jobs, one of 'optimize', 'walk_forward'
+        or 'test'.
+    specs: list
+        Give tuples of (label, strategy, params, funding) or, for walk
+        forward jobs, (label, strategy, params, funding,
+        walk_forward_strategy). params is a set of parameter sets for
+        optimizations or a callable that returns the parameter set for
+        a pair and a timeframe.
+    pairs: tuple
+        Give the currency pairs to be traded.
+    timeframes: tuple
+        Give the time frames of the charts to be traded on.
+    start_dates: dict
+        Give the date where the data starts per timeframe. The default
+        of the optimizer is used for missing timeframes.
+    cash: dict
+        Give the amount of starting capital per pair.
+    save: bool
+        Indicate if the plots of the jobs should be saved or not.
+
+    Returns:
+    ----------
+    jobs: list
+        The expanded jobs.
+
+    Raises:
+    ----------
+    ValueError
+        If the kind of the jobs is unknown.
+    """
+
+    if kind not in ('optimize', 'walk_forward', 'test'):
+        raise ValueError("Unknown kind of job: " + str(kind))
+
+    start_dates = start_dates or dict()
+    cash = cash or DEFAULT_CASH
+
+    jobs = list()
+    for spec in specs:
+        label, strategy, params, funding = spec[0:4]
+        wf_strategy = spec[4] if len(spec) > 4 else None
+        for pair in pairs:
+            for timeframe in timeframes:
+                job_params = params(pair, timeframe) if callable(params) \
+                    else params
+                name = '_'.join((label, pair.split('-')[0], timeframe))
+                jobs.append(Job(name, kind, strategy, job_params, pair,
+                                timeframe, cash[pair],
+                                start_dates.get(timeframe), funding,
+                                wf_strategy, save))
+
+    return jobs
+
+
+def _job_kwargs(job: Job):
+    kwargs = {'pair': job.pair, 'timeframe': job.timeframe,
+              'cash': job.cash, 'funding': job.funding,
+              'plot': False, 'save': job.save}
+    if job.start_date is not None:
+        kwargs['start_date'] = job.start_date
+
+    return kwargs
+
+
+def estimate_cost(job: Job):
+    """Estimate the relative cost of a job.
+
+    Description
+    ----------
+    The cost is the number of bars of the job's data times the number
+    of parameter sets times the weight of the strategy.
+
+    Parameters:
+    ----------
+    job: Job
+        Give the job to estimate.
+
+    Returns:
+    ----------
+    cost: float
+        The estimated cost of the job.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    kwargs = {'funding': job.funding}
+    if job.start_date is not None:
+        kwargs['start_date'] = job.start_date
+    df, _ = optimizer.read_data(job.pair, job.timeframe, **kwargs)
+    candidates = 1 if job.kind == 'test' else len(job.params)
+    weight = STRATEGY_WEIGHTS.get(job.strategy.__name__, 1.0)
+
+    return len(df) * candidates * weight
+
+
+def run_job(job: Job, maxcpus: int = None):
+    """Run a single job and return its result.
+
+    Parameters:
+    ----------
+    job: Job
+        Give the job to run.
+    maxcpus: int
+        Give the number of processes a sweep may use.
+
+    Returns:
+    ----------
+    result: DataFrame or tuple
+        The ranked metrics of optimize or the metrics of test_strategy
+        as a DataFrame, or the tuple of the DataFrame of the test folds
+        and the Series of the stitched account value of walk_forward.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    kwargs = _job_kwargs(job)
+    if job.kind == 'optimize':
+        return optimizer.optimize(job.name, job.strategy, job.params,
+                                  maxcpus=maxcpus, **kwargs)
+    elif job.kind == 'walk_forward':
+        return optimizer.walk_forward(job.name, job.strategy,
+                                      job.walk_forward_strategy, job.params,
+                                      **kwargs)
+
+    return optimizer.test_strategy(job.name, job.strategy, job.params,
+                                   **kwargs)
+
+
+def _checkpoint_path(checkpoint_dir: str, job: Job):
+    return os.path.join(checkpoint_dir, job.kind + '_' + job.name + '.pkl')
+
+
+def _load_checkpoint(checkpoint_dir: str, job: Job):
+    path = _checkpoint_path(checkpoint_dir, job)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _save_checkpoint(checkpoint_dir: str, job: Job, record: dict):
+    # Write to a temporary file first so a crash never leaves a
+    # truncated checkpoint behind
+    path = _checkpoint_path(checkpoint_dir, job)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(record, f)
+    os.replace(tmp_path, path)
+
+
+def _timed_run(job: Job, maxcpus: int):
+    start = time.time()
+    result = run_job(job, maxcpus)
+    return {'name': job.name, 'kind': job.kind, 'result': result,
+            'elapsed': time.time() - start,
+            'finished': dt.datetime.now(dt.timezone.utc),
+            'worker': os.getpid()}
+
+
+def run_jobs(jobs: list, checkpoint_dir: str = './checkpoints',
+             cpus: int = None, workers: int = None):
+    """Run jobs concurrently and checkpoint every finished job.
+
+    Description
+    ----------
+    Jobs that already have a checkpoint in checkpoint_dir are not run
+    again. The remaining jobs are ordered by their estimated cost,
+    longest first, and run by a pool of worker processes. The CPU
+    budget is split between the workers, so a job that runs a sweep
+    uses cpus // workers processes for it. Failing jobs are reported
+    and not checkpointed, so they are retried when resuming. The
+    progress over all jobs is exported to the configured telemetry
+    directory, see telemetry, next to the progress of every job.
+
+    Parameters:
+    ----------
+    jobs: list
+        Give the jobs to run.
+    checkpoint_dir: string
+        Give the directory to store the checkpoints in.
+    cpus: int
+        Give the number of CPUs all jobs together may use, all
+        available cores if None.
+    workers: int
+        Give the number of jobs to run at the same time, as many as
+        there are CPUs if None.
+
+    Returns:
+    ----------
+    records: OrderedDict
+        The checkpoint records of the finished jobs keyed by job name
+        in the order of the given jobs. A record holds the result, the
+        elapsed time and the time the job finished.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+
+    cpus = cpus or os.cpu_count() or 1
+    records = dict()
+    pending = list()
+    for job in jobs:
+        record = _load_checkpoint(checkpoint_dir, job)
+        if record is None:
+            pending.append(job)
+        else:
+            records[job.name] = record
+
+    print('Resuming with {0} of {1} jobs finished'.format(len(records),
+                                                           len(jobs)))
+
+    pending.sort(key=estimate_cost, reverse=True)
+
+    workers = max(1, min(workers or cpus, cpus, len(pending)))
+    maxcpus = max(1, cpus // workers)
+    # The pool starts the jobs in the order they were submitted
+    progress = telemetry.SweepTelemetry(
+        jobs[0].kind if jobs else 'jobs', len(pending), 'jobs',
+        [job.name for job in pending[:workers]])
+
+    if pending:
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_timed_run, job, maxcpus): job
+                       for job in pending}
+            ended = set()
+            for future in as_completed(futures):
+                job = futures[future]
+                ended.add(job.name)
+                running = [other.name for other in pending
+                           if other.name not in ended][:workers]
+                try:
+                    record = future.result()
+                except Exception:
+                    print('Job ' + job.name + ' failed:\n'
+                          + traceback.format_exc())
+                    progress.update(runs=0, current=running)
+                    continue
+
+                _save_checkpoint(checkpoint_dir, job, record)
+                records[job.name] = record
+                progress.update(worker=record['worker'],
+                                busy=record['elapsed'], current=running)
+                print('Finished {0} in {1:.1f}s ({2} of {3})'.format(
+                    job.name, record['elapsed'], len(records), len(jobs)))
+
+    progress.finish()
+
+    return OrderedDict((job.name, records[job.name]) for job in jobs
+                       if job.name in records)
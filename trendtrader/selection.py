@@ -0,0 +1,283 @@
+"""Implements multi-objective selection of parameter sets.
+
+Description
+----------
+Selects parameter sets from the metrics of a sweep, as returned by
+optimizer.run_sweep or kernels.sweep, or of a training fold. The
+metrics are turned into one array in which every objective is
+maximized, candidates that violate a constraint are dropped and the
+rest are sorted into Pareto fronts: the first front holds the
+candidates no other candidate beats in every objective, the second
+front those that are only beaten by the first and so on. The best k
+candidates are taken front by front and ordered by profit within a
+front.
+
+A front is found by culling: the candidates are sorted so that no
+candidate can be dominated by a later one, and every candidate that
+survives removes everything it dominates in one array comparison. This
+takes one pass over the remaining candidates per member of the front,
+which keeps the selection of the best 100 of 100,000 candidates well
+below a second. Sorting all of them into fronts takes one such search
+per front, so k should be given for large sweeps.
+
+Classes
+----------
+    Implements no classes.
+
+Functions
+----------
+objective_matrix: ndarray
+    Converts metrics into an array in which every column is maximized.
+feasible: ndarray
+    Tells which candidates satisfy the constraints.
+pareto_front: ndarray
+    Finds the candidates not dominated by any other candidate.
+pareto_ranks: ndarray
+    Sorts candidates into successive Pareto fronts.
+select: DataFrame
+    Selects the best parameter sets by Pareto front.
+best: tuple
+    Selects the parameter set with the best value of one metric.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Metric and whether it is maximized, the objectives of the fronts
+OBJECTIVES = OrderedDict([('pnl', True),
+                          ('sharpe', True),
+                          ('max DD', False),
+                          ('# trades', True)])
+
+# Inclusive lower and upper bound of a metric, None if unbounded
+CONSTRAINTS = {'# trades': (2, None),
+               'sharpe': (0.1, None),
+               'pnl': (1000, None)}
+
+# Number of candidates optimizer.rank_results keeps by Pareto front,
+# every further front takes another pass over the remaining candidates
+PARETO_KEEP = 100
+
+
+def objective_matrix(analysis, objectives: dict = OBJECTIVES):
+    """Convert metrics into an array in which every column is maximized.
+
+    Parameters:
+    ----------
+    analysis: DataFrame
+        Give the metrics of the candidates, one row per candidate.
+    objectives: dict
+        Give the metrics to use and whether each is maximized.
+
+    Returns:
+    ----------
+    values: ndarray
+        An array of shape (len(analysis), len(objectives)), minimized
+        metrics negated and missing values set to -inf.
+
+    Raises:
+    ----------
+    KeyError
+        If a metric is not a column of the analysis.
+    """
+
+    values = analysis[list(objectives)].to_numpy(dtype=float, copy=True)
+    values[:, [not maximize for maximize in objectives.values()]] *= -1
+    values[np.isnan(values)] = -np.inf
+
+    return values
+
+
+def feasible(analysis, constraints: dict = CONSTRAINTS):
+    """Tell which candidates satisfy the constraints.
+
+    Parameters:
+    ----------
+    analysis: DataFrame
+        Give the metrics of the candidates, one row per candidate.
+    constraints: dict
+        Give the inclusive lower and upper bound of every constrained
+        metric, None for no bound.
+
+    Returns:
+    ----------
+    mask: ndarray
+        True for the candidates within all bounds. Missing values are
+        never within bounds.
+
+    Raises:
+    ----------
+    KeyError
+        If a metric is not a column of the analysis.
+    """
+
+    mask = np.ones(len(analysis), dtype=bool)
+    for metric, (lower, upper) in constraints.items():
+        values = analysis[metric].to_numpy(dtype=float)
+        mask &= ~np.isnan(values)
+        if lower is not None:
+            mask &= values >= lower
+        if upper is not None:
+            mask &= values <= upper
+
+    return mask
+
+
+def pareto_front(values):
+    """Find the candidates not dominated by any other candidate.
+
+    Parameters:
+    ----------
+    values: ndarray
+        Give an array of shape (candidates, objectives) in which every
+        objective is maximized.
+
+    Returns:
+    ----------
+    front: ndarray
+        The sorted row numbers of the candidates on the front. A
+        candidate is dominated if another one is at least as good in
+        every objective and better in one, so duplicates share a front.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return np.empty(0, dtype=int)
+
+    # Lexicographically descending, no candidate can be dominated by a
+    # candidate after it
+    order = np.lexsort(values.T[::-1])[::-1]
+    points = values[order]
+
+    i = 0
+    while i < len(points):
+        keep = np.any(points > points[i], axis=1) \
+            | np.all(points == points[i], axis=1)
+        points = points[keep]
+        order = order[keep]
+        i = np.count_nonzero(keep[:i]) + 1
+
+    return np.sort(order)
+
+
+def pareto_ranks(values, k: int = None):
+    """Sort candidates into successive Pareto fronts.
+
+    Parameters:
+    ----------
+    values: ndarray
+        Give an array of shape (candidates, objectives) in which every
+        objective is maximized.
+    k: int
+        Give the number of candidates after which no further front is
+        found, all fronts if None.
+
+    Returns:
+    ----------
+    ranks: ndarray
+        The front of every candidate starting at 0, -1 for candidates
+        beyond the last front that was found.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    values = np.asarray(values, dtype=float)
+    ranks = np.full(len(values), -1, dtype=int)
+    remaining = np.arange(len(values))
+
+    rank = 0
+    while len(remaining) and (k is None or len(remaining) > len(values) - k):
+        front = remaining[pareto_front(values[remaining])]
+        ranks[front] = rank
+        remaining = np.setdiff1d(remaining, front, assume_unique=True)
+        rank += 1
+
+    return ranks
+
+
+def select(analysis, k: int = None, objectives: dict = OBJECTIVES,
+           constraints: dict = CONSTRAINTS, order_by: str = 'pnl'):
+    """Select the best parameter sets by Pareto front.
+
+    Parameters:
+    ----------
+    analysis: DataFrame
+        Give the metrics of the candidates, indexed by parameter set.
+    k: int
+        Give the number of parameter sets to select, all feasible ones
+        if None. The fronts are found until k candidates are collected,
+        the last front is cut by order_by.
+    objectives: dict
+        Give the metrics of the fronts and whether each is maximized.
+    constraints: dict
+        Give the inclusive bounds of the metrics a candidate has to
+        satisfy, see feasible.
+    order_by: string
+        Give the metric that orders the candidates within a front,
+        descending.
+
+    Returns:
+    ----------
+    analysis: DataFrame
+        The selected candidates best first, with their front in the
+        column 'front'.
+
+    Raises:
+    ----------
+    KeyError
+        If a metric is not a column of the analysis.
+    """
+
+    analysis = analysis[feasible(analysis, constraints)]
+    ranks = pareto_ranks(objective_matrix(analysis, objectives), k)
+    analysis = analysis.assign(front=ranks)[ranks >= 0]
+    analysis = analysis.sort_values(by=['front', order_by],
+                                    ascending=[True, False], kind='stable')
+
+    return analysis if k is None else analysis[:k]
+
+
+def best(analysis, metric: str = 'max DD', maximize: bool = False):
+    """Select the parameter set with the best value of one metric.
+
+    Parameters:
+    ----------
+    analysis: DataFrame
+        Give the metrics of the candidates, indexed by parameter set.
+    metric: string
+        Give the metric to select by.
+    maximize: bool
+        Indicate if the metric is maximized or minimized.
+
+    Returns:
+    ----------
+    par_tuple: tuple
+        The parameter set with the best value, the first one on ties.
+        Missing values are never the best unless all are missing.
+
+    Raises:
+    ----------
+    KeyError
+        If the metric is not a column of the analysis.
+    ValueError
+        If the analysis is empty.
+    """
+
+    values = analysis[metric].to_numpy(dtype=float)
+    values = np.where(np.isnan(values), -np.inf if maximize else np.inf,
+                      values)
+
+    return analysis.index[np.argmax(values) if maximize
+                          else np.argmin(values)]
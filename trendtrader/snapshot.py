@@ -0,0 +1,416 @@
+"""Implements versioned binary snapshots of incremental sweeps and streams.
+
+Description
+----------
+A process that evaluates strategies on growing data has to run them
+over the whole history again after a restart before the first new
+signal. The state incremental keeps for every candidate, the tails of
+the indicator nodes, the last values of the smoothed averages within
+them, the cash, the position and the pending order of the position loop
+and the accumulators of the metrics, is independent of the length of
+the history. A snapshot stores it in a compact binary file, so that a
+restart reads a file of a few hundred bars per node and advances over
+the bars since the snapshot, e.g.
+
+    snapshot.write_snapshot('state/stcvol.snap', state)
+    state = snapshot.read_snapshot('state/stcvol.snap')
+    incremental.advance_sweep(state, df_new)
+
+Restoring a snapshot and advancing over the bars since it gives the
+same state, bit for bit, as advancing the state that was written.
+
+A snapshot starts with a fixed header of the magic bytes, the version
+of the format, the length of a JSON header and a CRC32 of everything
+after the fixed header. The JSON header holds the configuration of the
+sweep, the number of bars and the time of the last one, the keys and
+minimum periods of the nodes, with the keys of their inputs replaced by
+the positions of the inputs, and the shapes of the arrays, which follow
+as raw little endian float64 in the order ARRAYS. Snapshots of another
+version are refused rather than read wrongly.
+
+The streams of live keep their state in snapshots of the same layout
+with other magic bytes. Backtrader cannot store its indicators, so a
+stream snapshot holds the last bars the stream has seen, at most
+live.SNAPSHOT_BARS, the cash, position and commission of the open
+trade of its broker and the accumulators of its metrics. A restarted
+stream warms up its indicators on the kept bars instead of the whole
+history, see live.SignalService.
+
+Classes
+----------
+    Implements no classes.
+
+Functions
+----------
+encode: bytes
+    Encodes the state of an incremental sweep.
+decode: dict
+    Decodes the state of an incremental sweep.
+write_snapshot:
+    Writes the state of an incremental sweep to a file atomically.
+read_snapshot: dict
+    Reads the state of an incremental sweep from a file.
+encode_stream: bytes
+    Encodes the state of a live stream.
+decode_stream: dict
+    Decodes the state of a live stream.
+write_stream:
+    Writes the state of a live stream to a file atomically.
+read_stream: dict
+    Reads the state of a live stream from a file.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+import datetime as dt
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+
+import indicator_graph
+import metrics
+
+
+MAGIC = b'TTSNAP\r\n'
+STREAM_MAGIC = b'TTLIVE\r\n'
+
+# Version of the format, raised whenever the layout changes
+VERSION = 1
+
+# Magic bytes, version, length of the JSON header and CRC32
+_HEADER = struct.Struct('<8sHII')
+
+# Order of the arrays after the JSON header
+ARRAYS = ('loops', 'metrics', 'nodes')
+STREAM_ARRAYS = ('bars', 'metrics')
+
+# Columns of the bars of a stream, the time in POSIX seconds
+BAR_COLUMNS = ('time', 'open', 'high', 'low', 'close', 'funding')
+
+# Number of floats of the state of the metrics of a candidate
+_METRICS_STATE = len(metrics.OnlineMetrics(0.0).state())
+
+
+def _tuples(value):
+    # JSON turns the tuples of parameter sets into lists
+    if isinstance(value, list):
+        return tuple(_tuples(item) for item in value)
+    return value
+
+
+def _encode_key(key, positions):
+    # The inputs of a node come before it and are written as the list
+    # of their position, parameters are scalars
+    return [[positions[item]] if isinstance(item, tuple) else item
+            for item in key]
+
+
+def _decode_key(key, keys):
+    return tuple(keys[item[0]] if isinstance(item, list) else item
+                 for item in key)
+
+
+def _scalar(value):
+    # Parameter sets may hold numpy scalars
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('Cannot encode ' + repr(value))
+
+
+def _pack(magic, header, arrays, names):
+    # Fixed header, JSON header with the shapes and the raw arrays
+    header['shapes'] = {name: arrays[name].shape for name in names}
+    body = json.dumps(header, default=_scalar).encode()
+    payload = body + b''.join(
+        np.ascontiguousarray(arrays[name], dtype='<f8').tobytes()
+        for name in names)
+
+    return _HEADER.pack(magic, VERSION, len(body),
+                        zlib.crc32(payload)) + payload
+
+
+def _unpack(magic, data, names):
+    if len(data) < _HEADER.size:
+        raise ValueError('Snapshot is truncated')
+    found, version, length, crc = _HEADER.unpack_from(data)
+    if found != magic:
+        raise ValueError('Not a snapshot')
+    if version != VERSION:
+        raise ValueError('Snapshot of version {0}, expected {1}'.format(
+            version, VERSION))
+    payload = memoryview(data)[_HEADER.size:]
+    if zlib.crc32(payload) != crc:
+        raise ValueError('Snapshot is corrupted')
+
+    header = json.loads(bytes(payload[:length]))
+    arrays = dict()
+    offset = length
+    for name in names:
+        shape = tuple(header['shapes'][name])
+        count = int(np.prod(shape))
+        # Copied so that the position loop can update the state in place
+        arrays[name] = np.frombuffer(payload, dtype='<f8', count=count,
+                                     offset=offset).reshape(shape) \
+            .astype(float)
+        offset += 8 * count
+
+    return header, arrays
+
+
+def _write(path, data):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Readers never see a half written snapshot
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def encode(state: dict):
+    """Encode the state of an incremental sweep.
+
+    Parameters:
+    ----------
+    state: dict
+        Give the state as returned by incremental.start_sweep.
+
+    Returns:
+    ----------
+    data: bytes
+        The snapshot of the state.
+
+    Raises:
+    ----------
+    TypeError
+        If the configuration holds values that cannot be encoded.
+    """
+
+    nodes = state['nodes']
+    positions = {node.key: i for i, node in enumerate(nodes)}
+    arrays = {'loops': state['loops'],
+              'metrics': np.array([stats.state()
+                                   for stats in state['metrics']],
+                                  dtype=float).reshape(-1, _METRICS_STATE),
+              'nodes': np.array([node.array for node in nodes],
+                                dtype=float)}
+    header = {'config': state['config'],
+              'bars': state['bars'],
+              'last': state['last'].isoformat(),
+              'causal': state['causal'],
+              'keys': [_encode_key(node.key, positions) for node in nodes],
+              'minperiods': [node.minperiod for node in nodes]}
+
+    return _pack(MAGIC, header, arrays, ARRAYS)
+
+
+def decode(data: bytes):
+    """Decode the state of an incremental sweep.
+
+    Parameters:
+    ----------
+    data: bytes
+        Give the snapshot as returned by encode.
+
+    Returns:
+    ----------
+    state: dict
+        The state of the sweep, see incremental.start_sweep.
+
+    Raises:
+    ----------
+    ValueError
+        If the data is no snapshot, a snapshot of another version or
+        corrupted.
+    """
+
+    header, arrays = _unpack(MAGIC, data, ARRAYS)
+
+    config = header['config']
+    config['par_tuples'] = [_tuples(par_tuple)
+                            for par_tuple in config['par_tuples']]
+
+    keys = list()
+    for key in header['keys']:
+        keys.append(_decode_key(key, keys))
+
+    return {'config': config,
+            'bars': header['bars'],
+            'last': pd.Timestamp(header['last']),
+            'causal': header['causal'],
+            'loops': arrays['loops'],
+            'metrics': [metrics.OnlineMetrics.from_state(row)
+                        for row in arrays['metrics'].tolist()],
+            'nodes': [indicator_graph.Node(key, array, minperiod)
+                      for key, array, minperiod in
+                      zip(keys, arrays['nodes'],
+                          header['minperiods'])]}
+
+
+def write_snapshot(path: str, state: dict):
+    """Write the state of an incremental sweep to a file atomically.
+
+    Parameters:
+    ----------
+    path: string
+        Give the file to write, its directory is created if needed.
+    state: dict
+        Give the state as returned by incremental.start_sweep.
+
+    Returns:
+    ----------
+    Returns no value.
+
+    Raises:
+    ----------
+    TypeError
+        If the configuration holds values that cannot be encoded.
+    """
+
+    _write(path, encode(state))
+
+
+def read_snapshot(path: str):
+    """Read the state of an incremental sweep from a file.
+
+    Parameters:
+    ----------
+    path: string
+        Give the file as written by write_snapshot.
+
+    Returns:
+    ----------
+    state: dict
+        The state of the sweep, see incremental.start_sweep.
+
+    Raises:
+    ----------
+    OSError
+        If the file cannot be read.
+    ValueError
+        If the file is no snapshot, a snapshot of another version or
+        corrupted.
+    """
+
+    with open(path, 'rb') as f:
+        return decode(f.read())
+
+
+def encode_stream(state: dict):
+    """Encode the state of a live stream.
+
+    Parameters:
+    ----------
+    state: dict
+        Give the configuration of the stream, the time of its last
+        bar, its broker as a dict of cash, size, price and commission,
+        its last bars as an array of the columns BAR_COLUMNS and its
+        metrics.OnlineMetrics.
+
+    Returns:
+    ----------
+    data: bytes
+        The snapshot of the state.
+
+    Raises:
+    ----------
+    TypeError
+        If the configuration holds values that cannot be encoded.
+    """
+
+    arrays = {'bars': np.asarray(state['bars'],
+                                 dtype=float).reshape(-1, len(BAR_COLUMNS)),
+              'metrics': np.array(state['metrics'].state(), dtype=float)}
+    header = {'config': state['config'],
+              'last': state['last'].isoformat(),
+              'broker': state['broker']}
+
+    return _pack(STREAM_MAGIC, header, arrays, STREAM_ARRAYS)
+
+
+def decode_stream(data: bytes):
+    """Decode the state of a live stream.
+
+    Parameters:
+    ----------
+    data: bytes
+        Give the snapshot as returned by encode_stream.
+
+    Returns:
+    ----------
+    state: dict
+        The state of the stream, see encode_stream.
+
+    Raises:
+    ----------
+    ValueError
+        If the data is no stream snapshot, a snapshot of another version
+        or corrupted.
+    """
+
+    header, arrays = _unpack(STREAM_MAGIC, data, STREAM_ARRAYS)
+    config = header['config']
+    config['par_tuple'] = _tuples(config['par_tuple'])
+
+    return {'config': config,
+            'last': dt.datetime.fromisoformat(header['last']),
+            'broker': header['broker'],
+            'bars': arrays['bars'],
+            'metrics': metrics.OnlineMetrics.from_state(
+                arrays['metrics'].tolist())}
+
+
+def write_stream(path: str, state: dict):
+    """Write the state of a live stream to a file atomically.
+
+    Parameters:
+    ----------
+    path: string
+        Give the file to write, its directory is created if needed.
+    state: dict
+        Give the state of the stream, see encode_stream.
+
+    Returns:
+    ----------
+    Returns no value.
+
+    Raises:
+    ----------
+    TypeError
+        If the configuration holds values that cannot be encoded.
+    """
+
+    _write(path, encode_stream(state))
+
+
+def read_stream(path: str):
+    """Read the state of a live stream from a file.
+
+    Parameters:
+    ----------
+    path: string
+        Give the file as written by write_stream.
+
+    Returns:
+    ----------
+    state: dict
+        The state of the stream, see encode_stream.
+
+    Raises:
+    ----------
+    OSError
+        If the file cannot be read.
+    ValueError
+        If the file is no stream snapshot, a snapshot of another version
+        or corrupted.
+    """
+
+    with open(path, 'rb') as f:
+        return decode_stream(f.read())
@@ -0,0 +1,234 @@
+"""Implements splitters of time series for cross validation.
+
+Description
+----------
+Collects the splitters of data into training and testing windows used
+by walk forward optimization and combinatorial purged cross validation.
+Kept apart from optimizer so that sklearn is only imported when data is
+actually split.
+
+Classes
+----------
+TimeSeriesSplitImproved: Inherits from TimeSeriesSplit
+    A class representing windows of data on which to perform cross
+    validation such as walk forward optimization.
+CombinatorialPurgedSplit: Inherits from BaseCrossValidator
+    A class representing every combination of contiguous groups of
+    data as testing set, with the bars next to the testing groups
+    purged from the training set.
+
+Functions
+----------
+    Implements no module functions.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+import itertools
+import math
+
+from sklearn.model_selection import BaseCrossValidator, TimeSeriesSplit
+from sklearn.utils import indexable
+from sklearn.utils.validation import _num_samples
+import numpy as np
+
+class TimeSeriesSplitImproved(TimeSeriesSplit):
+    """Time Series cross-validator
+
+    Provides train/test indices to split time series data samples
+    that are observed at fixed time intervals, in train/test sets.
+    In each split, test indices must be higher than before, and thus
+    shuffling in cross validator is inappropriate.
+    This cross-validation object is a variation of :class:`KFold`.
+    In the kth split, it returns first k folds as train set and the
+    (k+1)th fold as test set.
+    Note that unlike standard cross-validation methods, successive
+    training sets are supersets of those that come before them.
+    Read more in the :ref:`User Guide `.
+
+    Source:
+    ----------
+    https://ntguardian.wordpress.com/2017/06/19/
+        walk-forward-analysis-demonstration-backtrader/
+
+    Parameters
+    ----------
+    n_splits : int, default=3
+        Number of splits. Must be at least 1.
+
+    Notes
+    -----
+    When ``fixed_length`` is ``False``, the training set has size
+    ``i * train_splits * n_samples // (n_splits + 1) + n_samples %
+    (n_splits + 1)`` in the ``i``th split, with a test set of size
+    ``n_samples//(n_splits + 1) * test_splits``, where ``n_samples``
+    is the number of samples. If fixed_length is True, replace ``i``
+    in the above formulation with 1, and ignore ``n_samples %
+    (n_splits + 1)`` except for the first training set. The number
+    of test sets is ``n_splits + 2 - train_splits - test_splits``.
+    """
+
+    def split(self, X, y=None, groups=None, fixed_length=False,
+              train_splits=1, test_splits=1):
+        """Generate indices to split data into training and test set.
+
+        Parameters
+        ----------
+        X : array-like, shape (n_samples, n_features)
+            Training data, where n_samples is the number of samples
+            and n_features is the number of features.
+        y : array-like, shape (n_samples,)
+            Always ignored, exists for compatibility.
+        groups : array-like, with shape (n_samples,), optional
+            Always ignored, exists for compatibility.
+        fixed_length : bool, whether training sets should always have
+            common length
+        train_splits : positive int, for the minimum number of
+            splits to include in training sets
+        test_splits : positive int, for the number of splits to
+            include in the test set
+
+        Returns
+        -------
+        train : ndarray
+            The training set indices for that split.
+        test : ndarray
+            The testing set indices for that split.
+        """
+
+        X, y, groups = indexable(X, y, groups)
+        n_samples = _num_samples(X)
+        n_splits = self.n_splits
+        n_folds = n_splits + 1
+        train_splits, test_splits = int(train_splits), int(test_splits)
+        if n_folds > n_samples:
+            raise ValueError(
+                ("Cannot have number of folds ={0} greater"
+                 " than the number of samples: {1}.").format(n_folds,
+                                                             n_samples))
+        indices = np.arange(n_samples)
+        split_size = (n_samples // n_folds)
+        test_size = split_size * test_splits
+        train_size = split_size * train_splits
+        test_starts = range(train_size + n_samples % n_folds,
+                            n_samples - (test_size - split_size),
+                            split_size)
+        if fixed_length:
+            for i, test_start in zip(range(len(test_starts)),
+                                     test_starts):
+                rem = 0
+                if i == 0:
+                    rem = n_samples % n_folds
+                yield (indices[(test_start - train_size - rem):test_start],
+                       indices[test_start:test_start + test_size])
+        else:
+            for test_start in test_starts:
+                yield (indices[:test_start],
+                       indices[test_start:test_start + test_size])
+
+
+class CombinatorialPurgedSplit(BaseCrossValidator):
+    """Combinatorial purged cross-validator
+
+    Splits the samples into n_groups contiguous groups and yields every
+    combination of n_test_groups groups as test set, with the remaining
+    groups as training set. Training bars that directly precede a test
+    group are purged, as their indicators and trades reach into the test
+    group, and the bars directly after a test group are embargoed. The
+    test sets of the combinations assemble into n_paths complete
+    backtest paths through the data.
+
+    Parameters
+    ----------
+    n_groups : int, default=6
+        Number of contiguous groups. Must be at least 2.
+    n_test_groups : int, default=2
+        Number of groups in every test set. Must be between 1 and
+        n_groups - 1.
+    purge : int, default=0
+        Number of training bars removed before every test group.
+    embargo : int, default=0
+        Number of training bars removed after every test group.
+    """
+
+    def __init__(self, n_groups=6, n_test_groups=2, purge=0, embargo=0):
+        if n_groups < 2 or not 0 < n_test_groups < n_groups:
+            raise ValueError(
+                ("Need at least 2 groups and between 1 and n_groups - 1 "
+                 "test groups, got {0} and {1}.").format(n_groups,
+                                                          n_test_groups))
+        if purge < 0 or embargo < 0:
+            raise ValueError("Purge and embargo cannot be negative.")
+        self.n_groups = n_groups
+        self.n_test_groups = n_test_groups
+        self.purge = purge
+        self.embargo = embargo
+
+    @property
+    def n_paths(self):
+        """Number of backtest paths assembled from the test sets."""
+        return math.comb(self.n_groups - 1, self.n_test_groups - 1)
+
+    def get_n_splits(self, X=None, y=None, groups=None):
+        """Return the number of train/test combinations."""
+        return math.comb(self.n_groups, self.n_test_groups)
+
+    def combinations(self):
+        """Return the test groups of every combination in split order."""
+        return list(itertools.combinations(range(self.n_groups),
+                                           self.n_test_groups))
+
+    def group_bounds(self, n_samples):
+        """Return the n_groups + 1 edges of the groups.
+
+        Raises
+        ------
+        ValueError
+            If a group is not longer than purge and embargo together.
+        """
+
+        edges = np.cumsum([0] + [len(group) for group in np.array_split(
+            np.arange(n_samples), self.n_groups)])
+        if np.min(np.diff(edges)) <= self.purge + self.embargo:
+            raise ValueError(
+                ("Groups of {0} samples are too short for a purge of {1} "
+                 "and an embargo of {2}.").format(np.min(np.diff(edges)),
+                                                  self.purge, self.embargo))
+        return edges
+
+    def split(self, X, y=None, groups=None):
+        """Generate indices to split data into training and test set.
+
+        Parameters
+        ----------
+        X : array-like, shape (n_samples, n_features)
+            Training data, where n_samples is the number of samples
+            and n_features is the number of features.
+        y : array-like, shape (n_samples,)
+            Always ignored, exists for compatibility.
+        groups : array-like, with shape (n_samples,), optional
+            Always ignored, exists for compatibility.
+
+        Returns
+        -------
+        train : ndarray
+            The training set indices for that split.
+        test : ndarray
+            The testing set indices for that split.
+        """
+
+        X, y, groups = indexable(X, y, groups)
+        n_samples = _num_samples(X)
+        edges = self.group_bounds(n_samples)
+
+        for test_groups in self.combinations():
+            test = np.zeros(n_samples, dtype=bool)
+            for group in test_groups:
+                test[edges[group]:edges[group + 1]] = True
+            train = ~test
+            for group in test_groups:
+                train[max(0, edges[group] - self.purge):edges[group]] = False
+                train[edges[group + 1]:edges[group + 1] + self.embargo] = False
+            yield np.flatnonzero(train), np.flatnonzero(test)
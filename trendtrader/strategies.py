@@ -28,6 +28,14 @@ Functions
 ----------
     Implements no module functions.
 
+Notes
+----------
+Every strategy accepts a ``graph`` parameter. When an
+indicator_graph.IndicatorGraph for the data feed is passed, the
+indicators are taken from the shared graph instead of being built
+again, so identical subexpressions are computed once for all
+strategies and parameter sets running on the feed.
+
 Exceptions
 ----------
     Exports no exceptions.
@@ -39,18 +47,35 @@ import backtrader as bt
 
 import custom_indicators
 import custom_basicops
+import indicator_graph
+
 
+def _add_graph_lines(strategy):
+    """Attach the shared indicator graph nodes of a strategy."""
 
+    nodes = indicator_graph.strategy_nodes(strategy.p.graph,
+                                           type(strategy).__name__,
+                                           strategy.p.par_tuple)
+    for name, node in nodes.items():
+        setattr(strategy, name,
+                custom_indicators.GraphLine(strategy.data, node=node,
+                                            plot=False))
 
 
 class SMAC(bt.Strategy):
     """Implement the logic of a sma crossover strategy."""
                             # Fast MA,     Slow MA
-    params = {('par_tuple', (float('nan'), float('nan'),))}
+    params = {('par_tuple', (float('nan'), float('nan'),)),
+              ('graph', None)}
 
     def __init__(self):
         """Initialize the strategy"""
 
+        if self.p.graph is not None:
+            _add_graph_lines(self)
+            self.l.equity = bt.ind.SimpleMovingAverage()
+            return
+
         self.fastma = dict()
         self.slowma = dict()
         self.regime = dict()
@@ -86,9 +111,14 @@ class Stc(bt.Strategy):
                              # d1 Length,  d2 Length,    Low STC Line,
                              float('nan'), float('nan'), float('nan'),
                              # High STC Line
-                             float('nan'),))}
+                             float('nan'),)),
+              ('graph', None)}
 
     def __init__(self):
+        if self.p.graph is not None:
+            _add_graph_lines(self)
+            return
+
         # Compute the STC value
         self.stc = custom_indicators.STC(self.data, fast=self.p.par_tuple[0],
                                          slow=self.p.par_tuple[1],
@@ -123,9 +153,14 @@ class AroonStc(bt.Strategy):
                             # d1 Length,  d2 Length,    Low STC Line,
                             float('nan'), float('nan'), float('nan'),
                             # High STC Line, AROON Length
-                            float('nan'), float('nan'),))}
+                            float('nan'), float('nan'),)),
+              ('graph', None)}
 
     def __init__(self):
+        if self.p.graph is not None:
+            _add_graph_lines(self)
+            return
+
         # Compute the STC value
 
         self.stc = custom_indicators.STC(self.data, fast=self.p.par_tuple[0],
@@ -143,12 +178,10 @@ class AroonStc(bt.Strategy):
                                           bt.LineNum(self.p.par_tuple[6]),
                                           plot=False)
 
-        self.aroonup = bt.ind.AroonUp(self.data,
-                                      period=int(self.p.par_tuple[7]),
-                                      plot=False)
-        self.aroondown = bt.ind.AroonDown(self.data,
-                                          period=int(self.p.par_tuple[7]),
-                                          plot=False)
+        self.aroonup = custom_indicators.AroonUp(
+            self.data, period=int(self.p.par_tuple[7]), plot=False)
+        self.aroondown = custom_indicators.AroonDown(
+            self.data, period=int(self.p.par_tuple[7]), plot=False)
 
     def next(self):
         if self.position.size == 0:
@@ -169,9 +202,14 @@ class StcSmaShort(bt.Strategy):
                              # d1 Length,  d2 Length,    Low STC Line,
                              float('nan'), float('nan'), float('nan'),
                              # High STC Line, Lenght SMA
-                             float('nan'), float('nan'),))}
+                             float('nan'), float('nan'),)),
+              ('graph', None)}
 
     def __init__(self):
+        if self.p.graph is not None:
+            _add_graph_lines(self)
+            return
+
         # compute the STC value
         self.stc = custom_indicators.STC(self.data.close,
                                          fast=self.p.par_tuple[0],
@@ -212,9 +250,14 @@ class StcVol(bt.Strategy):
                              # High STC Line, Lookback Vol, Vol Thresh Low,
                              float("nan"), float('nan'), float('nan'),
                              # Vol Thresh High
-                             float('nan'),))}
+                             float('nan'),)),
+              ('graph', None)}
 
     def __init__(self):
+        if self.p.graph is not None:
+            _add_graph_lines(self)
+            return
+
         # compute the STC value
         self.stc = custom_indicators.STC(self.data.close,
                                          fast=self.p.par_tuple[0],
@@ -225,7 +268,7 @@ class StcVol(bt.Strategy):
                                          plot=False)
 
         # Compute Volatility
-        self.vol = 100 * math.sqrt(365) * bt.ind.StandardDeviation(
+        self.vol = 100 * math.sqrt(365) * custom_indicators.StandardDeviation(
             bt.ind.PercentChange(self.data.close, period=1, plot=False),
             period=self.p.par_tuple[7])
 
@@ -257,9 +300,14 @@ class DRSIDMALong(bt.Strategy):
                             # Mom length, Mom derivative, Mom smoothing factor
                              float("nan"), float('nan'), float('nan'),
                             # Upper Threshold, Lower Threshold
-                             float("nan"), float('nan'),))}
+                             float("nan"), float('nan'),)),
+              ('graph', None)}
 
     def __init__(self):
+        if self.p.graph is not None:
+            _add_graph_lines(self)
+            return
+
         # Delta MA
         self.tema = bt.ind.TEMA(self.data.close, period=self.p.par_tuple[0],
                                 plot=False)
@@ -303,9 +351,14 @@ class DRSIDMAShort(bt.Strategy):
                             # Mom length, Mom derivative, Mom smoothing factor
                              float("nan"), float('nan'), float('nan'),
                             # Upper Threshold, Lower Threshold
-                             float("nan"), float('nan'),))}
+                             float("nan"), float('nan'),)),
+              ('graph', None)}
 
     def __init__(self):
+        if self.p.graph is not None:
+            _add_graph_lines(self)
+            return
+
         # Delta MA
         self.tema = bt.ind.TEMA(self.data.close, period=self.p.par_tuple[0],
                                 plot=False)
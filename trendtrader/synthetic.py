@@ -0,0 +1,291 @@
+"""Implements a seeded generator of synthetic price and funding data.
+
+Description
+----------
+The bundled data has a few thousand bars per file, which says little
+about how the optimizer scales to years of minute bars. This module
+generates OHLC and funding series of any length and time frame that
+optimizer.read_data reads like the bundled files, e.g.
+
+    python trendtrader/synthetic.py --pair SYN-USD --timeframe 1m \
+        --bars 1000000 --model jump
+
+from the root of the repository writes ./data/COINBASE_SYNUSD_1m.csv,
+which read_data('SYN-USD', '1m') loads.
+
+The log returns of the closes follow one of three models:
+
+    gbm: a geometric Brownian motion with constant drift and
+        volatility.
+    regime: a Markov chain that switches between a bull and a bear
+        regime, each with its own drift and volatility.
+    jump: a geometric Brownian motion with normally distributed jumps
+        arriving as a Poisson process.
+
+Every bar opens at the previous close, its high and low lie beyond its
+open and close by a random fraction of the volatility of one bar. The
+funding follows a mean reverting process that leans towards the
+direction of the recent trend, scaled by the price like in the bundled
+data. The same arguments and seed always give the same series.
+
+Classes
+----------
+    Implements no classes.
+
+Functions
+----------
+bar_duration: Timedelta
+    Returns the duration of a bar of a time frame.
+log_returns: ndarray
+    Draws the log returns of the closes of a model.
+generate: DataFrame
+    Generates a series of OHLC and funding data.
+write_csv: string
+    Writes a series to the CSV file read_data reads.
+main:
+    Parses the command line arguments and writes a series.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+import argparse
+import datetime as dt
+import re
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+import ingest
+
+
+MODELS = ('gbm', 'regime', 'jump')
+
+_UNITS = {'m': 'minutes', 'H': 'hours', 'D': 'days'}
+
+_YEAR = pd.Timedelta(days=365)
+
+
+def bar_duration(timeframe: str):
+    """Return the duration of a bar of a time frame.
+
+    Parameters:
+    ----------
+    timeframe: string
+        Give the time frame as a number and a unit, m for minutes, H for
+        hours or D for days, e.g. '1m', '8H' or '1D'.
+
+    Returns:
+    ----------
+    duration: pandas.Timedelta
+        The duration of one bar.
+
+    Raises:
+    ----------
+    ValueError
+        If the time frame cannot be parsed.
+    """
+
+    match = re.fullmatch(r'(\d+)([mHD])', timeframe)
+    if match is None:
+        raise ValueError('Unknown time frame: ' + timeframe)
+
+    return pd.Timedelta(**{_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def log_returns(model: str, n_bars: int, rng, years_per_bar: float,
+                drift: float = 0.5, volatility: float = 0.8,
+                bear_drift: float = -0.6, bear_volatility: float = 1.1,
+                regime_years: float = 0.5, jump_rate: float = 6.0,
+                jump_mean: float = -0.02, jump_std: float = 0.08):
+    """Draw the log returns of the closes of a model.
+
+    Parameters:
+    ----------
+    model: string
+        Give one of MODELS.
+    n_bars: int
+        Give the number of returns to draw.
+    rng: numpy.random.Generator
+        Give the random number generator.
+    years_per_bar: float
+        Give the duration of a bar in years.
+    drift, volatility: float
+        Give the yearly drift and volatility, of the bull regime for
+        the regime model.
+    bear_drift, bear_volatility: float
+        Give the yearly drift and volatility of the bear regime.
+    regime_years: float
+        Give the mean duration of a regime in years.
+    jump_rate: float
+        Give the mean number of jumps per year.
+    jump_mean, jump_std: float
+        Give the mean and standard deviation of the log size of a jump.
+
+    Returns:
+    ----------
+    returns: ndarray
+        The log returns of the closes.
+
+    Raises:
+    ----------
+    ValueError
+        If the model is unknown.
+    """
+
+    if model not in MODELS:
+        raise ValueError('Unknown model: ' + model)
+
+    drifts = np.full(n_bars, drift)
+    volatilities = np.full(n_bars, volatility)
+    if model == 'regime':
+        # Regimes last a geometrically distributed number of bars and
+        # alternate, starting with a bull regime
+        mean_bars = max(regime_years / years_per_bar, 1.0)
+        lengths = rng.geometric(1.0 / mean_bars,
+                                size=int(n_bars / mean_bars) + 2)
+        while lengths.sum() < n_bars:
+            lengths = np.concatenate(
+                (lengths, rng.geometric(1.0 / mean_bars, size=len(lengths))))
+        bear = np.repeat(np.arange(len(lengths)) % 2 == 1, lengths)[:n_bars]
+        drifts[bear] = bear_drift
+        volatilities[bear] = bear_volatility
+
+    returns = (drifts - 0.5 * volatilities ** 2) * years_per_bar \
+        + volatilities * np.sqrt(years_per_bar) * rng.standard_normal(n_bars)
+
+    if model == 'jump':
+        jumps = rng.poisson(jump_rate * years_per_bar, size=n_bars)
+        returns += jumps * jump_mean \
+            + np.sqrt(jumps) * jump_std * rng.standard_normal(n_bars)
+
+    return returns
+
+
+def _funding(returns, rng, level=0.0002, reversion=0.1, trend=0.5,
+             noise=0.0004):
+    # The basis reverts to a level and leans towards the recent
+    # returns, x[t] = (1 - reversion) * x[t-1] + reversion * level +
+    # shock[t] starting from the level
+    shocks = reversion * level + trend * returns \
+        + noise * rng.standard_normal(len(returns))
+    basis, _ = lfilter([1.0], [1.0, reversion - 1.0], shocks,
+                       zi=[(1.0 - reversion) * level])
+
+    return basis
+
+
+def generate(n_bars: int, timeframe: str = '1D', model: str = 'gbm',
+             seed: int = 0, price: float = 100.0,
+             start: dt.datetime = dt.datetime(2015, 1, 1, 0, 0, 0, 0,
+                                              dt.timezone.utc),
+             **model_params):
+    """Generate a series of OHLC and funding data.
+
+    Parameters:
+    ----------
+    n_bars: int
+        Give the number of bars.
+    timeframe: string
+        Give the time frame of the bars, see bar_duration.
+    model: string
+        Give the model of the returns, one of MODELS.
+    seed: int
+        Give the seed of the random number generator.
+    price: float
+        Give the open of the first bar.
+    start: datetime.datetime
+        Give the time of the first bar. read_data cuts the data at its
+        end date, long series should start early enough.
+    model_params:
+        Give the parameters of the model, see log_returns.
+
+    Returns:
+    ----------
+    df: DataFrame
+        The open, high, low, close and funding of every bar indexed by
+        its time, like the DataFrame of read_data.
+
+    Raises:
+    ----------
+    ValueError
+        If the time frame or the model is unknown.
+    """
+
+    duration = bar_duration(timeframe)
+    years_per_bar = duration / _YEAR
+    rng = np.random.default_rng(seed)
+
+    returns = log_returns(model, n_bars, rng, years_per_bar, **model_params)
+    close = price * np.exp(np.cumsum(returns))
+    open_ = np.concatenate(([price], close[:-1]))
+
+    # The extremes of a bar lie beyond its open and close by a half
+    # normal fraction of the volatility of one bar
+    spread = np.std(returns) if n_bars > 1 else 0.0
+    high = np.maximum(open_, close) \
+        * np.exp(0.5 * spread * np.abs(rng.standard_normal(n_bars)))
+    low = np.minimum(open_, close) \
+        * np.exp(-0.5 * spread * np.abs(rng.standard_normal(n_bars)))
+
+    funding = close * _funding(returns, rng)
+
+    index = pd.date_range(start, periods=n_bars, freq=duration, name='time')
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low,
+                         'close': close, 'funding': funding}, index=index)
+
+
+def write_csv(df, pair: str = 'SYN-USD', timeframe: str = '1D',
+              data_dir: str = './data'):
+    """Write a series to the CSV file read_data reads.
+
+    Parameters:
+    ----------
+    df: DataFrame
+        Give the series as returned by generate.
+    pair: string
+        Give the currency pair the file is named after.
+    timeframe: string
+        Give the time frame the file is named after.
+    data_dir: string
+        Give the directory of the data.
+
+    Returns:
+    ----------
+    path: string
+        The path of the file that was written.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    path = ingest.data_path(pair, timeframe, data_dir)
+    df.to_csv(path, date_format='%Y-%m-%dT%H:%M:%SZ', lineterminator='\n')
+
+    return path
+
+
+def main(argv: list = None):
+    """Parse the command line arguments and write a series."""
+
+    parser = argparse.ArgumentParser(
+        description='Write synthetic OHLC and funding data.')
+    parser.add_argument('--pair', default='SYN-USD')
+    parser.add_argument('--timeframe', default='1D')
+    parser.add_argument('--bars', type=int, default=10000)
+    parser.add_argument('--model', choices=MODELS, default='gbm')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--price', type=float, default=100.0)
+    parser.add_argument('--data-dir', default='./data')
+    args = parser.parse_args(argv)
+
+    df = generate(args.bars, args.timeframe, args.model, args.seed,
+                  args.price)
+    print(write_csv(df, args.pair, args.timeframe, args.data_dir))
+
+
+if __name__ == '__main__':
+    main()
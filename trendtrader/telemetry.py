@@ -0,0 +1,323 @@
+"""Implements progress telemetry of sweeps and walk forward runs.
+
+Description
+----------
+A sweep of thousands of runs prints its name when it starts and then
+nothing until it is done, so a stalled machine cannot be told from a
+slow job. SweepTelemetry counts the finished runs of a job, the time
+every worker process spent on them, the throughput and the time left,
+and exports them as a JSON status file and as a Prometheus text file,
+which the textfile collector of the node exporter picks up, e.g.
+
+    python trendtrader/cli.py optimize --telemetry-dir ./telemetry
+
+writes ./telemetry/optimize_SMAC_BTC_1D.json and .prom for every job
+and ./telemetry/jobs_optimize.json and .prom for the scheduler. Files
+are replaced atomically at most every few seconds while runs finish, a
+stale update time means that no run finished since.
+
+The directory is kept in an environment variable by configure, so that
+the worker processes of the scheduler and of backtrader export as
+well. Without a directory the telemetry is only kept in memory.
+
+Classes
+----------
+SweepTelemetry:
+    Counts the finished runs of a job and exports its progress.
+WorkerClock: Inherits from Analyzer
+    Measures the process and the time a run took in a sweep.
+
+Functions
+----------
+configure:
+    Sets the directory the telemetry of all processes is written to.
+directory: string
+    Returns the configured directory.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+import datetime as dt
+import json
+import math
+import os
+import re
+import time
+
+import backtrader as bt
+
+
+ENVIRONMENT = 'TRENDTRADER_TELEMETRY_DIR'
+
+# Seconds between two exports while runs finish
+EXPORT_EVERY = 5.0
+
+_METRICS = (('runs_completed', 'Runs of the job that finished.'),
+            ('runs_planned', 'Runs the job consists of.'),
+            ('runs_per_second', 'Finished runs per second of wall time.'),
+            ('eta_seconds', 'Estimated seconds until the job finishes.'),
+            ('elapsed_seconds', 'Seconds since the job started.'),
+            ('running', 'Whether the job is still running.'),
+            ('last_update_timestamp_seconds',
+             'Unix time of the last finished run.'))
+
+
+def configure(directory: str):
+    """Set the directory the telemetry of all processes is written to.
+
+    Parameters:
+    ----------
+    directory: string
+        Give the directory, None to keep the telemetry in memory only.
+
+    Returns:
+    ----------
+    Returns no value.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    if directory is None:
+        os.environ.pop(ENVIRONMENT, None)
+    else:
+        os.makedirs(directory, exist_ok=True)
+        os.environ[ENVIRONMENT] = os.path.abspath(directory)
+
+
+def directory():
+    """Return the configured directory, None if there is none."""
+
+    return os.environ.get(ENVIRONMENT) or None
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def _value(value):
+    return 'NaN' if value is None or math.isnan(value) else repr(float(value))
+
+
+def _write(path, text):
+    # Readers never see a half written file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class SweepTelemetry:
+    """Counts the finished runs of a job and exports its progress.
+
+    Parameters:
+    ----------
+    job: string
+        Give the name of the job, e.g. SMAC_BTC_1D.
+    total: int
+        Give the number of runs the job consists of, None if it is not
+        known in advance.
+    kind: string
+        Give the kind of the job, e.g. optimize or walk_forward.
+    current: string or list
+        Give what the job works on first, if anything.
+    directory: string
+        Give the directory to export to, the configured one if None.
+    every: float
+        Give the seconds between two exports.
+    """
+
+    def __init__(self, job: str, total: int, kind: str = 'sweep',
+                 current=None, directory: str = None,
+                 every: float = EXPORT_EVERY):
+        self.job = job
+        self.kind = kind
+        self.total = total
+        self.directory = directory
+        self.every = every
+        self.completed = 0
+        self.current = current
+        self.workers = dict()
+        self.started = time.time()
+        self.updated = self.started
+        self.finished = None
+        self.export()
+
+    def _path(self, extension):
+        name = re.sub(r'[^\w.-]', '_', self.kind + '_' + self.job)
+        return os.path.join(self.directory or directory(), name + extension)
+
+    def update(self, runs: int = 1, worker=None, busy: float = 0.0,
+               current=None):
+        """Count finished runs and export if it is time to.
+
+        Parameters:
+        ----------
+        runs: int
+            Give the number of runs that finished.
+        worker: int or string
+            Give the process that ran them, e.g. its process id.
+        busy: float
+            Give the seconds the worker spent on them.
+        current: string or list
+            Give what the job is working on now, e.g. a fold, if it
+            changed.
+
+        Returns:
+        ----------
+        Returns no value.
+
+        Raises:
+        ----------
+        Does not raise any exceptions.
+        """
+
+        self.completed += runs
+        self.updated = time.time()
+        if current is not None:
+            self.current = current
+        if worker is not None:
+            stats = self.workers.setdefault(str(worker),
+                                            {'runs': 0, 'busy': 0.0})
+            stats['runs'] += runs
+            stats['busy'] += busy
+
+        if self.updated - self._exported >= self.every:
+            self.export()
+
+    def callback(self, runstrat):
+        """Count a finished run of Cerebro.optcallback, see WorkerClock."""
+
+        clock = getattr(runstrat[0].analyzers, 'workerclock', None)
+        if clock is None:
+            self.update()
+        else:
+            analysis = clock.get_analysis()
+            self.update(worker=analysis['worker'],
+                        busy=analysis['seconds'])
+
+    def finish(self):
+        """Mark the job as finished and export."""
+
+        self.finished = time.time()
+        self.updated = self.finished
+        self.export()
+
+    def status(self):
+        """Return the progress of the job.
+
+        Parameters:
+        ----------
+        Gets no parameters.
+
+        Returns:
+        ----------
+        status: dict
+            The job, the finished and planned runs, the runs per
+            second, the estimated seconds left, what the job works on
+            and the runs and utilization of every worker.
+
+        Raises:
+        ----------
+        Does not raise any exceptions.
+        """
+
+        elapsed = max((self.finished or time.time()) - self.started, 1e-9)
+        rate = self.completed / elapsed
+        if self.finished is not None:
+            eta = 0.0
+        elif self.total is None or rate <= 0:
+            eta = None
+        else:
+            eta = max(self.total - self.completed, 0) / rate
+
+        return {'job': self.job,
+                'kind': self.kind,
+                'running': self.finished is None,
+                'current': self.current,
+                'runs completed': self.completed,
+                'runs planned': self.total,
+                'runs per second': rate,
+                'eta seconds': eta,
+                'elapsed seconds': elapsed,
+                'started': dt.datetime.fromtimestamp(
+                    self.started, dt.timezone.utc).isoformat(),
+                'updated': dt.datetime.fromtimestamp(
+                    self.updated, dt.timezone.utc).isoformat(),
+                'workers': {worker: {'runs': stats['runs'],
+                                     'busy seconds': stats['busy'],
+                                     'utilization': stats['busy'] / elapsed}
+                            for worker, stats in self.workers.items()}}
+
+    def prometheus(self):
+        """Return the progress of the job in the Prometheus text format."""
+
+        status = self.status()
+        labels = 'job="{0}",kind="{1}"'.format(_label(self.job),
+                                               _label(self.kind))
+        values = {'runs_completed': status['runs completed'],
+                  'runs_planned': status['runs planned'],
+                  'runs_per_second': status['runs per second'],
+                  'eta_seconds': status['eta seconds'],
+                  'elapsed_seconds': status['elapsed seconds'],
+                  'running': int(status['running']),
+                  'last_update_timestamp_seconds': self.updated}
+
+        lines = list()
+        for name, description in _METRICS:
+            lines.append('# HELP trendtrader_{0} {1}'.format(name,
+                                                             description))
+            lines.append('# TYPE trendtrader_{0} gauge'.format(name))
+            lines.append('trendtrader_{0}{{{1}}} {2}'.format(
+                name, labels, _value(values[name])))
+
+        lines.append('# HELP trendtrader_worker_utilization Fraction of '
+                     'the wall time a worker spent on runs of the job.')
+        lines.append('# TYPE trendtrader_worker_utilization gauge')
+        for worker, stats in status['workers'].items():
+            lines.append('trendtrader_worker_utilization{{{0},worker="{1}"}} '
+                         '{2}'.format(labels, _label(worker),
+                                      _value(stats['utilization'])))
+
+        current = self.current
+        if isinstance(current, (list, tuple)):
+            current = ', '.join(str(item) for item in current)
+        if current:
+            lines.append('# HELP trendtrader_current_info What the job '
+                         'works on.')
+            lines.append('# TYPE trendtrader_current_info gauge')
+            lines.append('trendtrader_current_info{{{0},current="{1}"}} 1'
+                         .format(labels, _label(current)))
+
+        return '\n'.join(lines) + '\n'
+
+    def export(self):
+        """Write the status and Prometheus files if there is a directory."""
+
+        self._exported = time.time()
+        if (self.directory or directory()) is None:
+            return
+
+        _write(self._path('.json'), json.dumps(self.status(), indent=1))
+        _write(self._path('.prom'), self.prometheus())
+
+
+class WorkerClock(bt.Analyzer):
+    """Measures the process and the time a run took in a sweep."""
+
+    def start(self):
+        # The analysis is read in the parent process, the process id
+        # of the worker is taken here
+        self.worker = os.getpid()
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def stop(self):
+        self.seconds = time.perf_counter() - self.started
+
+    def get_analysis(self):
+        return {'worker': self.worker, 'seconds': self.seconds}
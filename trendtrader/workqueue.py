@@ -0,0 +1,706 @@
+"""Implements a work queue to distribute sweeps over many nodes.
+
+Description
+----------
+Shards the parameter sets of a sweep into work units that are handed out
+by a small broker. Workers on any number of nodes lease units, run them
+against their locally cached data and push back the metric records of
+every parameter set. Workers renew their lease with heartbeats while
+they run a unit, units whose lease runs out because the worker died are
+handed out again. A unit that raises an error is marked as failed with
+the error instead, so that it does not take down every worker that
+leases it. The partial results are merged into the same DataFrame
+optimizer.run_sweep returns.
+
+The broker is available over TCP, speaking newline delimited JSON, or
+as a shared directory that all nodes can reach.
+
+Classes
+----------
+WorkUnit: Inherits from namedtuple
+    Represents a part of a sweep that is run by one worker.
+Broker:
+    Hands out work units under renewable leases and collects results.
+BrokerServer: Inherits from ThreadingTCPServer
+    Serves a broker over TCP.
+TCPClient:
+    Talks to a BrokerServer.
+DirectoryQueue:
+    A broker living in a directory shared by all nodes.
+
+Functions
+----------
+shard_sweep: list
+    Splits the parameter sets of a sweep into work units.
+evaluate_unit: list
+    Runs a work unit and returns its metric records.
+merge_results: DataFrame
+    Merges metric records into a DataFrame of metrics.
+run_worker: int
+    Leases and runs work units until the sweep is done.
+
+Exceptions
+----------
+    Exports no exceptions.
+"""
+
+from collections import namedtuple, deque
+import datetime as dt
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+import pandas as pd
+
+
+WorkUnit = namedtuple('WorkUnit', ('unit_id', 'sweep_id', 'strategy',
+                                   'par_tuples', 'pair', 'timeframe', 'cash',
+                                   'start_date', 'end_date', 'funding'))
+
+# Seconds after the last heartbeat before a lease is handed out again
+LEASE_TIMEOUT = 60.0
+
+METRICS = ('# trades', 'win rate', 'sharpe', 'max DD', 'pnl')
+
+
+def shard_sweep(sweep_id: str, strategy_name: str, par_tuples,
+                unit_size: int = 100, pair: str = 'BTC-USD',
+                timeframe: str = '1D', cash: int = 10000,
+                start_date: dt.datetime = None,
+                end_date: dt.datetime = None, funding: bool = False):
+    """Split the parameter sets of a sweep into work units.
+
+    Parameters:
+    ----------
+    sweep_id: string
+        Give a name for the sweep that is unique in the queue.
+    strategy_name: string
+        Give the class name of the strategy in strategies.py.
+    par_tuples: iterable
+        Give the parameter sets of the sweep.
+    unit_size: int
+        Give the number of parameter sets per work unit.
+    pair: string
+        Give the currency pair to be traded.
+    timeframe: string
+        Give the time frame of the chart to be traded on.
+    cash: int
+        Give the amount of starting capital.
+    start_date: datetime.datetime
+        Give the date where the data starts, the default of
+        optimizer.read_data if None.
+    end_date: datetime.datetime
+        Give the date where the data ends, the default of
+        optimizer.read_data if None.
+    funding: bool
+        Indicates if funding data should be considered.
+
+    Returns:
+    ----------
+    units: list
+        The work units of the sweep.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    par_tuples = sorted(tuple(par) for par in par_tuples)
+
+    return [WorkUnit('{0}-{1:05d}'.format(sweep_id, i // unit_size),
+                     sweep_id, strategy_name, par_tuples[i:i + unit_size],
+                     pair, timeframe, cash, start_date, end_date, funding)
+            for i in range(0, len(par_tuples), unit_size)]
+
+
+def _unit_to_dict(unit: WorkUnit):
+    d = unit._asdict()
+    for key in ('start_date', 'end_date'):
+        if d[key] is not None:
+            d[key] = d[key].isoformat()
+    d['par_tuples'] = [list(par) for par in unit.par_tuples]
+
+    return d
+
+
+def _unit_from_dict(d: dict):
+    d = dict(d)
+    for key in ('start_date', 'end_date'):
+        if d[key] is not None:
+            d[key] = dt.datetime.fromisoformat(d[key])
+    d['par_tuples'] = [tuple(par) for par in d['par_tuples']]
+
+    return WorkUnit(**d)
+
+
+def evaluate_unit(unit: WorkUnit, maxcpus: int = 1):
+    """Run a work unit against the local data and return its records.
+
+    Parameters:
+    ----------
+    unit: WorkUnit
+        Give the work unit to run.
+    maxcpus: int
+        Give the number of processes the sweep of the unit may use.
+
+    Returns:
+    ----------
+    records: list
+        A dict with the parameter set and its metrics for every
+        parameter set of the unit, NaN for metrics that are undefined.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    import optimizer
+    import strategies
+
+    kwargs = {'funding': unit.funding}
+    if unit.start_date is not None:
+        kwargs['start_date'] = unit.start_date
+    if unit.end_date is not None:
+        kwargs['end_date'] = unit.end_date
+    _, data = optimizer.read_data(unit.pair, unit.timeframe, **kwargs)
+
+    analysis = optimizer.run_sweep(getattr(strategies, unit.strategy),
+                                   unit.par_tuples, data, cash=unit.cash,
+                                   maxcpus=maxcpus)
+
+    records = list()
+    for par_tuple, row in analysis.iterrows():
+        # The sharpe ratio is None for runs within one calendar year
+        record = {key: float(pd.to_numeric(row[key], errors='coerce'))
+                  for key in METRICS}
+        record['par_tuple'] = list(par_tuple)
+        records.append(record)
+
+    return records
+
+
+def merge_results(records):
+    """Merge metric records into a DataFrame as run_sweep returns it.
+
+    Parameters:
+    ----------
+    records: iterable
+        Give the metric records of any number of work units. Records of
+        the same parameter set are only counted once.
+
+    Returns:
+    ----------
+    analysis: DataFrame
+        The metrics of every parameter set, indexed by the parameter
+        sets.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    merged = dict()
+    for record in records:
+        merged.setdefault(tuple(record['par_tuple']), record)
+
+    if not merged:
+        return pd.DataFrame(columns=list(METRICS))
+
+    return pd.DataFrame({key: [r[key] for r in merged.values()]
+                         for key in METRICS},
+                        index=pd.MultiIndex.from_tuples(list(merged)))
+
+
+class Broker:
+    """Hand out work units under renewable leases and collect results.
+
+    Description
+    ----------
+    A leased unit is handed out again when its worker did not send a
+    heartbeat within lease_timeout seconds. Results of a unit are
+    accepted once, late results of a worker that lost its lease are
+    ignored if the unit was completed in the meantime. Failed units are
+    not handed out again.
+    """
+
+    def __init__(self, units: list, lease_timeout: float = LEASE_TIMEOUT):
+        self.lease_timeout = lease_timeout
+        self._pending = deque(units)
+        self._leases = dict()
+        self._results = dict()
+        self._failed = dict()
+        self._lock = threading.Lock()
+
+    def add(self, units: list):
+        """Add work units to the queue."""
+
+        with self._lock:
+            self._pending.extend(units)
+
+    def requeue_expired(self):
+        """Hand out units again whose lease has run out."""
+
+        now = time.monotonic()
+        with self._lock:
+            expired = [unit_id for unit_id, (_, _, deadline)
+                       in self._leases.items() if deadline < now]
+            for unit_id in expired:
+                unit, _, _ = self._leases.pop(unit_id)
+                self._pending.appendleft(unit)
+
+        return expired
+
+    def lease(self, worker_id: str):
+        """Lease the next unit to a worker, None if nothing is pending."""
+
+        self.requeue_expired()
+        with self._lock:
+            while self._pending:
+                unit = self._pending.popleft()
+                if unit.unit_id in self._results \
+                        or unit.unit_id in self._failed:
+                    continue
+                self._leases[unit.unit_id] = \
+                    (unit, worker_id, time.monotonic() + self.lease_timeout)
+                return unit
+
+        return None
+
+    def heartbeat(self, worker_id: str, unit_id: str):
+        """Renew a lease, False if the worker does not hold it anymore."""
+
+        with self._lock:
+            lease = self._leases.get(unit_id)
+            if lease is None or lease[1] != worker_id:
+                return False
+            self._leases[unit_id] = \
+                (lease[0], worker_id, time.monotonic() + self.lease_timeout)
+
+        return True
+
+    def complete(self, worker_id: str, unit_id: str, records: list):
+        """Store the records of a unit, False if it was done already."""
+
+        with self._lock:
+            self._leases.pop(unit_id, None)
+            if unit_id in self._results:
+                return False
+            self._results[unit_id] = records
+
+        return True
+
+    def fail(self, worker_id: str, unit_id: str, error: str):
+        """Mark a unit as failed, False if it was done already."""
+
+        with self._lock:
+            self._leases.pop(unit_id, None)
+            if unit_id in self._results or unit_id in self._failed:
+                return False
+            self._failed[unit_id] = error
+
+        return True
+
+    def done(self):
+        """Whether no unit is pending or leased anymore."""
+
+        self.requeue_expired()
+        with self._lock:
+            return not self._pending and not self._leases
+
+    def status(self):
+        """Return the number of pending, leased, finished and failed units."""
+
+        with self._lock:
+            return {'pending': len(self._pending),
+                    'leased': len(self._leases),
+                    'finished': len(self._results),
+                    'failed': len(self._failed)}
+
+    def failures(self):
+        """Return the errors of the failed units keyed by unit id."""
+
+        with self._lock:
+            return dict(self._failed)
+
+    def results(self):
+        """Return the merged metrics of all finished units."""
+
+        with self._lock:
+            records = [record for unit_records in self._results.values()
+                       for record in unit_records]
+
+        return merge_results(records)
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.dispatch(json.loads(line))
+            self.wfile.write((json.dumps(response) + '\n').encode())
+            self.wfile.flush()
+
+
+class BrokerServer(socketserver.ThreadingTCPServer):
+    """Serve a broker over TCP with newline delimited JSON requests.
+
+    Description
+    ----------
+    Every request is an object with an ``op`` of lease, heartbeat,
+    complete, fail, done, status or failures and the arguments of the
+    matching Broker method, or config to ask for the lease timeout.
+    Pass port 0 to bind to a free port, the bound address is returned
+    by start.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, broker: Broker, host: str = '127.0.0.1',
+                 port: int = 0):
+        super(BrokerServer, self).__init__((host, port), _BrokerHandler)
+        self.broker = broker
+
+    def dispatch(self, request: dict):
+        op = request.get('op')
+        if op == 'lease':
+            unit = self.broker.lease(request['worker_id'])
+            return {'unit': None if unit is None else _unit_to_dict(unit)}
+        elif op == 'heartbeat':
+            return {'ok': self.broker.heartbeat(request['worker_id'],
+                                                request['unit_id'])}
+        elif op == 'complete':
+            return {'ok': self.broker.complete(request['worker_id'],
+                                               request['unit_id'],
+                                               request['records'])}
+        elif op == 'fail':
+            return {'ok': self.broker.fail(request['worker_id'],
+                                           request['unit_id'],
+                                           request['error'])}
+        elif op == 'done':
+            return {'done': self.broker.done()}
+        elif op == 'status':
+            return self.broker.status()
+        elif op == 'failures':
+            return {'failures': self.broker.failures()}
+        elif op == 'config':
+            return {'lease_timeout': self.broker.lease_timeout}
+
+        return {'error': 'Unknown operation: ' + str(op)}
+
+    def start(self):
+        """Serve in a background thread and return the bound address."""
+
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+
+        return self.server_address
+
+
+class TCPClient:
+    """Talk to a BrokerServer, offering the interface of a Broker."""
+
+    def __init__(self, host: str, port: int, timeout: float = 30.0):
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._file = self._sock.makefile('rwb')
+        self._lock = threading.Lock()
+        self.lease_timeout = self._call(op='config')['lease_timeout']
+
+    def _call(self, **request):
+        with self._lock:
+            self._file.write((json.dumps(request) + '\n').encode())
+            self._file.flush()
+            response = json.loads(self._file.readline())
+
+        if 'error' in response:
+            raise ValueError(response['error'])
+
+        return response
+
+    def lease(self, worker_id: str):
+        unit = self._call(op='lease', worker_id=worker_id)['unit']
+        return None if unit is None else _unit_from_dict(unit)
+
+    def heartbeat(self, worker_id: str, unit_id: str):
+        return self._call(op='heartbeat', worker_id=worker_id,
+                          unit_id=unit_id)['ok']
+
+    def complete(self, worker_id: str, unit_id: str, records: list):
+        return self._call(op='complete', worker_id=worker_id,
+                          unit_id=unit_id, records=records)['ok']
+
+    def fail(self, worker_id: str, unit_id: str, error: str):
+        return self._call(op='fail', worker_id=worker_id, unit_id=unit_id,
+                          error=error)['ok']
+
+    def done(self):
+        return self._call(op='done')['done']
+
+    def status(self):
+        return self._call(op='status')
+
+    def failures(self):
+        return self._call(op='failures')['failures']
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+
+class DirectoryQueue:
+    """A broker living in a directory shared by all nodes.
+
+    Description
+    ----------
+    Units are files that move between the pending, leased and results or
+    failed sub directories. A worker claims a unit by atomically
+    renaming it into leased, heartbeats update the modification time of
+    the leased file and any worker hands out units again whose leased
+    file has not been touched for lease_timeout seconds.
+    """
+
+    def __init__(self, root: str, lease_timeout: float = LEASE_TIMEOUT):
+        self.root = root
+        self.lease_timeout = lease_timeout
+        for sub in ('pending', 'leased', 'results', 'failed'):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def _path(self, sub: str, name: str):
+        return os.path.join(self.root, sub, name)
+
+    def _write(self, sub: str, name: str, obj):
+        tmp_path = self._path(sub, '.' + name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(obj, f)
+        os.replace(tmp_path, self._path(sub, name))
+
+    def _files(self, sub: str):
+        return sorted(name for name in os.listdir(os.path.join(self.root, sub))
+                      if name.endswith('.json') and not name.startswith('.'))
+
+    def add(self, units: list):
+        """Add work units to the queue."""
+
+        for unit in units:
+            self._write('pending', unit.unit_id + '.json', _unit_to_dict(unit))
+
+    def requeue_expired(self):
+        """Hand out units again whose lease has run out."""
+
+        expired = list()
+        deadline = time.time() - self.lease_timeout
+        for name in self._files('leased'):
+            path = self._path('leased', name)
+            try:
+                if os.path.getmtime(path) >= deadline:
+                    continue
+                unit_id = name.split('__')[0]
+                os.rename(path, self._path('pending', unit_id + '.json'))
+            except OSError:
+                # Renewed, completed or requeued by someone else
+                continue
+            expired.append(unit_id)
+
+        return expired
+
+    def lease(self, worker_id: str):
+        """Lease the next unit to a worker, None if nothing is pending."""
+
+        self.requeue_expired()
+        for name in self._files('pending'):
+            unit_id = name[:-len('.json')]
+            if os.path.exists(self._path('results', name)) \
+                    or os.path.exists(self._path('failed', name)):
+                try:
+                    os.remove(self._path('pending', name))
+                except OSError:
+                    pass
+                continue
+
+            leased = self._path('leased', unit_id + '__' + worker_id + '.json')
+            try:
+                os.utime(self._path('pending', name))
+                os.rename(self._path('pending', name), leased)
+            except OSError:
+                # Claimed by another worker first
+                continue
+
+            with open(leased) as f:
+                return _unit_from_dict(json.load(f))
+
+        return None
+
+    def heartbeat(self, worker_id: str, unit_id: str):
+        """Renew a lease, False if the worker does not hold it anymore."""
+
+        try:
+            os.utime(self._path('leased',
+                                unit_id + '__' + worker_id + '.json'))
+        except OSError:
+            return False
+
+        return True
+
+    def complete(self, worker_id: str, unit_id: str, records: list):
+        """Store the records of a unit, False if it was done already."""
+
+        finished = os.path.exists(self._path('results', unit_id + '.json'))
+        if not finished:
+            self._write('results', unit_id + '.json', records)
+        try:
+            os.remove(self._path('leased',
+                                 unit_id + '__' + worker_id + '.json'))
+        except OSError:
+            pass
+
+        return not finished
+
+    def fail(self, worker_id: str, unit_id: str, error: str):
+        """Mark a unit as failed, False if it was done already."""
+
+        finished = os.path.exists(self._path('results', unit_id + '.json')) \
+            or os.path.exists(self._path('failed', unit_id + '.json'))
+        if not finished:
+            self._write('failed', unit_id + '.json', error)
+        try:
+            os.remove(self._path('leased',
+                                 unit_id + '__' + worker_id + '.json'))
+        except OSError:
+            pass
+
+        return not finished
+
+    def done(self):
+        """Whether no unit is pending or leased anymore."""
+
+        self.requeue_expired()
+        return not self._files('pending') and not self._files('leased')
+
+    def status(self):
+        """Return the number of pending, leased, finished and failed units."""
+
+        return {'pending': len(self._files('pending')),
+                'leased': len(self._files('leased')),
+                'finished': len(self._files('results')),
+                'failed': len(self._files('failed'))}
+
+    def failures(self):
+        """Return the errors of the failed units keyed by unit id."""
+
+        failures = dict()
+        for name in self._files('failed'):
+            with open(self._path('failed', name)) as f:
+                failures[name[:-len('.json')]] = json.load(f)
+
+        return failures
+
+    def results(self):
+        """Return the merged metrics of all finished units."""
+
+        records = list()
+        for name in self._files('results'):
+            with open(self._path('results', name)) as f:
+                records.extend(json.load(f))
+
+        return merge_results(records)
+
+
+def run_worker(queue, worker_id: str = None, maxcpus: int = 1,
+               heartbeat_interval: float = None, poll_interval: float = 1.0,
+               max_units: int = None, evaluate=evaluate_unit):
+    """Lease and run work units until the sweep is done.
+
+    Description
+    ----------
+    While a unit is running a background thread renews its lease. When
+    nothing is pending but units are still leased by other workers, the
+    worker keeps polling, so it picks up units of workers that died. A
+    unit whose evaluation raises is marked as failed with the error and
+    the worker goes on with the next one. The runs the worker finished
+    are exported to the configured telemetry directory, see telemetry.
+
+    Parameters:
+    ----------
+    queue: Broker, TCPClient or DirectoryQueue
+        Give the queue to take work units from.
+    worker_id: string
+        Give a name for the worker that is unique across all nodes,
+        host name and process id if None.
+    maxcpus: int
+        Give the number of processes a unit may use.
+    heartbeat_interval: float
+        Give the seconds between heartbeats, a third of the lease
+        timeout of the queue if None.
+    poll_interval: float
+        Give the seconds to wait before asking for work again.
+    max_units: int
+        Give the number of units after which the worker stops.
+    evaluate: callable
+        Give the function that runs a unit and returns its records.
+
+    Returns:
+    ----------
+    n_units: int
+        The number of units the worker ran, failed ones included.
+
+    Raises:
+    ----------
+    Does not raise any exceptions.
+    """
+
+    import telemetry
+
+    worker_id = worker_id or '{0}-{1}'.format(socket.gethostname(),
+                                              os.getpid())
+    if heartbeat_interval is None:
+        heartbeat_interval = getattr(queue, 'lease_timeout',
+                                     LEASE_TIMEOUT) / 3.0
+
+    # Units are leased one at a time, the total is not known here
+    progress = telemetry.SweepTelemetry(worker_id, None, 'worker')
+
+    n_units = 0
+    while max_units is None or n_units < max_units:
+        unit = queue.lease(worker_id)
+        if unit is None:
+            if queue.done():
+                break
+            time.sleep(poll_interval)
+            continue
+
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(heartbeat_interval):
+                queue.heartbeat(worker_id, unit.unit_id)
+
+        beater = threading.Thread(target=beat, daemon=True)
+        beater.start()
+        start = time.time()
+        try:
+            records = evaluate(unit, maxcpus)
+        except Exception as e:
+            records = None
+            error = '{0}: {1}'.format(type(e).__name__, e)
+        finally:
+            stop.set()
+            beater.join()
+
+        n_units += 1
+        if records is None:
+            print('Unit {0} failed: {1}'.format(unit.unit_id, error))
+            queue.fail(worker_id, unit.unit_id, error)
+            continue
+
+        queue.complete(worker_id, unit.unit_id, records)
+        progress.update(runs=len(unit.par_tuples), worker=worker_id,
+                        busy=time.time() - start, current=unit.unit_id)
+
+    progress.finish()
+
+    return n_units